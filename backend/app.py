@@ -1,16 +1,53 @@
 # app.py
 
+import asyncio
+import io
+import json
 import os
-import pickle
+import tarfile
+import time
+import zipfile
+from contextlib import asynccontextmanager
+from typing import List
+
 import uvicorn
-from fastapi import FastAPI, File, UploadFile
+from fastapi import FastAPI, File, Header, HTTPException, Response, UploadFile
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from lxml import etree
 
+from backend.cache import ResultCache, content_key
+from backend.jobs import JOBS_DB, JobQueue
+from backend.limits import MAX_DOCUMENT_BYTES, MAX_UPLOAD_BYTES, BodySizeLimit
+from backend.maps import MAP_SUFFIXES, ArchiveSource, DirectorySource, topic_memo, validate_maps
+from backend.metrics import (
+    CONTENT_TYPE, DOCUMENTS, ERRORS, REQUEST_SECONDS, REQUESTS, UPLOAD_BYTES, Gauge, StageTimer,
+    registry as metrics_registry,
+)
+from backend.parsing import DocumentLimitError, invalid_document, parse_dita
+from backend.registry import LiveScorer, ModelRegistry
+from backend.rules import perform_rule_based_checks
+from backend.sessions import document_sessions, revalidate
+from backend.streaming import StreamingValidator, iter_chunks
+from backend.workers import PoolSaturatedError, ValidationPool
+
 ########################################
 # 1. Create a single FastAPI app
 ########################################
-app = FastAPI()
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Poll the model registry for newly activated versions while serving
+    live_scorer.start_watching(MODEL_RELOAD_INTERVAL)
+    # Resume bulk validation jobs interrupted by the last shutdown
+    job_queue.start()
+    yield
+    job_queue.stop()
+    live_scorer.stop_watching()
+
+app = FastAPI(lifespan=lifespan)
+
+# Reject oversized request bodies while they stream in (MAX_UPLOAD_BYTES)
+app.add_middleware(BodySizeLimit)
 
 # Add CORS Middleware right after creating the app
 app.add_middleware(
@@ -22,79 +59,368 @@ app.add_middleware(
 )
 
 ########################################
-# 2. Load Pickled Vectorizer and Model
+# 2. Load the Scorer
+########################################
+MODELS_DIR = os.environ.get("MODELS_DIR", "models")
+
+# Versioned model registry (see registry.py). Until a version is published
+# there, the model in MODELS_DIR is served.
+MODEL_REGISTRY = os.environ.get("MODEL_REGISTRY", os.path.join(MODELS_DIR, "registry"))
+
+# Seconds between checks for a newly activated version (0 disables polling)
+MODEL_RELOAD_INTERVAL = float(os.environ.get("MODEL_RELOAD_INTERVAL", "30"))
+
+# Holds the NumPy LinearScorer (or pickled sklearn pipeline) being served.
+# Each validation reads `live_scorer.current` once and uses that scorer
+# throughout, so a hot swap never mixes two models in one result.
+live_scorer = LiveScorer(ModelRegistry(MODEL_REGISTRY), MODELS_DIR)
+
+########################################
+# 3. Batch Helpers
 ########################################
-MODELS_DIR = "models"
+# File extensions picked out of uploaded archives
+DITA_SUFFIXES = (".dita", ".xml")
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tar.xz")
+
+def expand_upload(filename: str, content: bytes, suffixes: tuple = DITA_SUFFIXES) -> list:
+    """
+    Expand one uploaded file into a list of (filename, content) pairs.
+    Zip and tar archives are unpacked in member order, keeping only members
+    with one of `suffixes` (DITA/XML by default); any other upload is
+    returned unchanged.
+
+    Sizes are checked before anything is decompressed or parsed: raises
+    DocumentLimitError if a plain upload or an archive member is larger
+    than MAX_DOCUMENT_BYTES, or all members together are larger than
+    MAX_UPLOAD_BYTES.
+    """
+    name = (filename or "").lower()
+
+    def check_sizes(members):
+        total = 0
+        for member_name, size in members:
+            if size > MAX_DOCUMENT_BYTES:
+                raise DocumentLimitError(f"{member_name} is larger than {MAX_DOCUMENT_BYTES} bytes uncompressed.")
+            total += size
+        if total > MAX_UPLOAD_BYTES:
+            raise DocumentLimitError(f"Archive expands to more than {MAX_UPLOAD_BYTES} bytes.")
 
-vectorizer_path = os.path.join(MODELS_DIR, "vectorizer.pkl")
-model_path = os.path.join(MODELS_DIR, "model.pkl")
+    if name.endswith(".zip"):
+        with zipfile.ZipFile(io.BytesIO(content)) as archive:
+            members = [info for info in archive.infolist()
+                       if not info.is_dir() and info.filename.lower().endswith(suffixes)]
+            check_sizes((info.filename, info.file_size) for info in members)
+            return [(info.filename, archive.read(info)) for info in members]
 
-with open(vectorizer_path, "rb") as f:
-    vectorizer = pickle.load(f)
+    if name.endswith(TAR_SUFFIXES):
+        with tarfile.open(fileobj=io.BytesIO(content), mode="r:*") as archive:
+            members = [member for member in archive.getmembers()
+                       if member.isfile() and member.name.lower().endswith(suffixes)]
+            check_sizes((member.name, member.size) for member in members)
+            return [(member.name, archive.extractfile(member).read()) for member in members]
 
-with open(model_path, "rb") as f:
-    model = pickle.load(f)
+    check_sizes([(filename, len(content))])
+    return [(filename, content)]
+
+# Errors raised by `expand_upload` for an archive that cannot be unpacked
+ARCHIVE_ERRORS = (zipfile.BadZipFile, tarfile.TarError, DocumentLimitError)
 
 ########################################
-# 3. Helper Function: Extract Text from XML
+# 4. Validation Pipeline
 ########################################
-def extract_text_from_xml(xml_str: str) -> str:
+# These functions are synchronous and CPU-bound; the routes below run them
+# in `validation_pool` so the event loop stays responsive.
+# Results keyed by content hash + model version (see cache.py for the
+# RESULT_CACHE_SIZE / RESULT_CACHE_TTL / RESULT_CACHE_DB settings)
+result_cache = ResultCache()
+
+def validate_content(content: bytes, timer: StageTimer = None) -> dict:
+    """
+    Validates one document, returning a cached result for unchanged bytes.
+    Stage timings are recorded in `timer` (see metrics.py).
+    """
+    timer = timer or StageTimer()
+    scorer = live_scorer.current
+    with timer.stage("cache"):
+        key = content_key(content, scorer.version)
+        result = result_cache.get(key)
+    if result is None:
+        result = validate_document(content, scorer, timer)
+        with timer.stage("cache"):
+            result_cache.put(key, result)
+    DOCUMENTS.inc()
+    return result
+
+def validate_document(content: bytes, scorer, timer: StageTimer) -> dict:
+    """
+    1. Parses the raw `.dita` bytes once.
+    2. Applies rule-based checks (missing <title>, invalid root, etc.).
+    3. Extracts the text (and, for structural models, the markup tokens)
+       and gets a compliance probability from `scorer`.
+    Returns a dict with `compliance_probability`, the `model_version` that
+    produced it and any structural `errors`, or with an `error` key if the
+    XML is invalid.
+    """
+    # Parse the XML
+    try:
+        with timer.stage("parse"):
+            root_element = parse_dita(content)
+    except Exception as e:
+        return invalid_document(e)
+
+    # Run rule-based checks
+    with timer.stage("rules"):
+        errors = perform_rule_based_checks(root_element)
+
+    # ML compliance score
+    with timer.stage("extract"):
+        dita_text = scorer.extract(root_element)
+    with timer.stage("vectorize"):
+        features = scorer.features(dita_text)
+    with timer.stage("score"):
+        compliance_probability = scorer.score_features(features)
+
+    return {
+        "compliance_probability": compliance_probability,
+        "model_version": scorer.version,
+        "errors": errors
+    }
+
+def validate_stream(fileobj, timer: StageTimer = None) -> dict:
+    """
+    Validates one document read incrementally from a binary file object,
+    keeping peak memory bounded regardless of the document size.
+    The file is read twice: once to hash it for the result cache, and once
+    (on a miss) to feed the streaming parser.
+    """
+    timer = timer or StageTimer()
+    scorer = live_scorer.current
+    with timer.stage("cache"):
+        fileobj.seek(0)
+        key = content_key(iter_chunks(fileobj), scorer.version)
+        result = result_cache.get(key)
+    if result is None:
+        fileobj.seek(0)
+        result = validate_document_stream(iter_chunks(fileobj), scorer, timer)
+        with timer.stage("cache"):
+            result_cache.put(key, result)
+    DOCUMENTS.inc()
+    return result
+
+def validate_document_stream(chunks, scorer, timer: StageTimer) -> dict:
+    """
+    Streaming counterpart of `validate_document`: rule checks and text
+    features are computed as elements close, and processed subtrees are
+    freed along the way. Parsing, rules, extraction and vectorization are
+    interleaved, so they are timed together as the "stream" stage.
+    """
+    validator = StreamingValidator(scorer.features, structural=scorer.structural)
+    try:
+        with timer.stage("stream"):
+            for chunk in chunks:
+                validator.feed(chunk)
+            validator.close()
+    except (etree.XMLSyntaxError, DocumentLimitError) as e:
+        return invalid_document(e)
+
+    with timer.stage("score"):
+        compliance_probability = scorer.score_features(validator.features)
+
+    return {
+        "compliance_probability": compliance_probability,
+        "model_version": scorer.version,
+        "errors": validator.errors
+    }
+
+def validate_revision(document_id: str, content: bytes, timer: StageTimer = None) -> dict:
     """
-    Parse the XML string and extract all text content from DITA elements.
-    Returns a single string of natural language tokens.
+    Validates a new revision of an edited document against its session
+    (see sessions.py): unchanged blocks reuse their rule results and token
+    counts, so only the edited parts are checked and vectorized. Invalid
+    XML leaves the session at the last valid revision.
     """
+    timer = timer or StageTimer()
+    scorer = live_scorer.current
+    DOCUMENTS.inc()
     try:
-        root = etree.fromstring(xml_str.encode("utf-8"))
-        text_nodes = root.xpath("//text()")
-        return " ".join(text_nodes)
-    except Exception:
-        # If XML is invalid or parsing fails, return an empty string
-        return ""
+        with timer.stage("parse"):
+            root_element = parse_dita(content)
+    except Exception as e:
+        return invalid_document(e)
+
+    session = document_sessions.get(document_id)
+    with session.lock:
+        return revalidate(session, root_element, scorer, timer=timer)
+
+def validate_uploads(uploads: list, timer: StageTimer = None) -> list:
+    """
+    Validates a list of (filename, content) uploads, expanding archives.
+    Rule-based checks run per file, while the ML model scores every
+    parsable file in one call (timed as the "score" stage).
+    Returns one result per file, in input order.
+    """
+    timer = timer or StageTimer()
+    scorer = live_scorer.current
+    results = []
+    texts = []
+    scored = []  # (index into `results`, cache key) for files that still need a score
+
+    for upload_name, content in uploads:
+        try:
+            with timer.stage("expand"):
+                documents = expand_upload(upload_name, content)
+        except DocumentLimitError as e:
+            results.append({"filename": upload_name, **invalid_document(e)})
+            continue
+        except ARCHIVE_ERRORS as e:
+            ERRORS.inc(type="invalid_archive")
+            results.append({"filename": upload_name, "error": f"Invalid archive: {str(e)}"})
+            continue
+
+        for filename, document in documents:
+            DOCUMENTS.inc()
+            with timer.stage("cache"):
+                key = content_key(document, scorer.version)
+                cached = result_cache.get(key)
+            if cached is not None:
+                results.append({"filename": filename, **cached})
+                continue
+
+            try:
+                with timer.stage("parse"):
+                    root_element = parse_dita(document)
+            except Exception as e:
+                result = invalid_document(e)
+                result_cache.put(key, result)
+                results.append({"filename": filename, **result})
+                continue
+
+            with timer.stage("rules"):
+                errors = perform_rule_based_checks(root_element)
+            results.append({"filename": filename, "errors": errors})
+            with timer.stage("extract"):
+                texts.append(scorer.extract(root_element))
+            scored.append((len(results) - 1, key))
+
+    with timer.stage("score"):
+        probabilities = scorer.score_texts(texts)
+
+    for (index, key), probability in zip(scored, probabilities):
+        result = results[index]
+        result["compliance_probability"] = probability
+        result["model_version"] = scorer.version
+        result_cache.put(key, {
+            "compliance_probability": probability,
+            "model_version": scorer.version,
+            "errors": result["errors"],
+        })
+
+    return results
 
 ########################################
-# 4. Rule-Based Checks
+# 5. Worker Pool
 ########################################
-def perform_rule_based_checks(root_element) -> list:
+# Uploads above this size (in bytes) are validated in streaming mode
+STREAMING_THRESHOLD = int(os.environ.get("STREAMING_THRESHOLD", str(8 * 1024 * 1024)))
+
+# Sized by VALIDATION_WORKERS / VALIDATION_QUEUE_DEPTH (see workers.py)
+validation_pool = ValidationPool()
+
+async def run_validation(func, *args):
     """
-    Perform multiple DITA checks on the parsed root element (an _Element).
-    Return a list of error messages, if any.
+    Run a validation function in the worker pool.
+    Responds with 503 and a Retry-After header when the pool is saturated.
     """
-    errors = []
+    try:
+        return await validation_pool.run(func, *args)
+    except PoolSaturatedError as e:
+        ERRORS.inc(type="pool_saturated")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
 
-    # root_element is already the root (<concept>, <task>, or <reference>)
-    root_tag = root_element.tag  # e.g. "concept", "task", "reference"
+# Local directory map validation may read maps and topics from, when no
+# archive is uploaded (disabled unless set)
+DITA_MAP_ROOT = os.environ.get("DITA_MAP_ROOT") or None
 
-    # A. Check if the root tag is one of the expected
-    if root_tag not in ["concept", "task", "reference"]:
-        errors.append(f"Root element <{root_tag}> is unexpected. (Expected concept, task, or reference.)")
+def validate_map_upload(filename: str, content: bytes, map_path: str = None, timer: StageTimer = None) -> dict:
+    """
+    Validates the maps in an uploaded archive (or just `map_path`) together
+    with the topics they reference, resolved inside the same archive.
+    """
+    timer = timer or StageTimer()
+    try:
+        with timer.stage("expand"):
+            source = ArchiveSource(expand_upload(filename, content, DITA_SUFFIXES + MAP_SUFFIXES))
+    except DocumentLimitError as e:
+        return invalid_document(e)
+    except ARCHIVE_ERRORS as e:
+        ERRORS.inc(type="invalid_archive")
+        return {"error": f"Invalid archive: {str(e)}"}
+    return validate_map_source(source, [map_path] if map_path else None, timer)
+
+def validate_map_source(source, map_paths: list, timer: StageTimer) -> dict:
+    """
+    Runs map validation (see maps.py) with the current scorer. Topics are
+    memoized by content hash across requests, so only new or changed
+    topics are parsed and scored.
+    """
+    scorer = live_scorer.current
+    with timer.stage("maps"):
+        report = validate_maps(source, scorer, map_paths, topic_memo)
+    DOCUMENTS.inc(report["topics_parsed"] + report["topics_reused"])
+    return report
 
-    # B. Check if the root has 'id' attribute
-    if "id" not in root_element.attrib:
-        errors.append(f"Root element <{root_tag}> is missing the 'id' attribute.")
+def expand_job_files(uploads: list) -> list:
+    """
+    Expand the uploads of a job into one (filename, content) pair per
+    document, so job progress and results are counted per file. An archive
+    that cannot be read is kept as is and reported as invalid when validated.
+    """
+    files = []
+    for filename, content in uploads:
+        try:
+            files.extend(expand_upload(filename, content))
+        except ARCHIVE_ERRORS:
+            files.append((filename, content))
+    return files
 
-    # C. Check for <concept> missing <title>
-    for concept in root_element.findall(".//concept"):
-        title_element = concept.find("title")
-        if title_element is None:
-            errors.append("Concept element is missing a <title>.")
+# Bulk validation jobs (see jobs.py for JOBS_DB / JOB_WORKERS / JOB_CHUNK_SIZE).
+# Job workers are separate threads, so a large job never makes interactive
+# /validate requests fail with 503.
+job_queue = JobQueue(JOBS_DB, validate_uploads)
 
-    # D. Check for <task> missing <title>
-    for task in root_element.findall(".//task"):
-        title_element = task.find("title")
-        if title_element is None:
-            errors.append("Task element is missing a <title>.")
-        # Optionally check if <taskbody> or <steps> exist
+# Seconds between checks for new results when streaming job events
+JOB_EVENTS_POLL_INTERVAL = 0.5
 
-    # E. Check for <reference> missing <title>
-    for ref in root_element.findall(".//reference"):
-        title_element = ref.find("title")
-        if title_element is None:
-            errors.append("Reference element is missing a <title>.")
+########################################
+# 6. Metrics
+########################################
+# Request/error counters, upload size and per-stage latency histograms are
+# defined in metrics.py; these gauges read live state at scrape time.
+metrics_registry.register(Gauge(
+    "dita_cache_hits_total", "Result cache hits.", lambda: result_cache.hits, "counter"))
+metrics_registry.register(Gauge(
+    "dita_cache_misses_total", "Result cache misses.", lambda: result_cache.misses, "counter"))
+metrics_registry.register(Gauge(
+    "dita_cache_entries", "Results held in the in-memory cache.", lambda: result_cache.stats()["entries"]))
+metrics_registry.register(Gauge(
+    "dita_pool_pending", "Validations admitted to the worker pool and not finished.",
+    lambda: validation_pool.pending))
+metrics_registry.register(Gauge(
+    "dita_pool_workers", "Threads in the validation worker pool.", lambda: validation_pool.max_workers))
+metrics_registry.register(Gauge(
+    "dita_document_sessions", "Documents with an incremental validation session.", lambda: len(document_sessions)))
 
-    return errors
+def record_request(endpoint: str, timer: StageTimer, started: float, response: Response, timing: bool):
+    """
+    Record request-level metrics and, if asked for, the Server-Timing header.
+    """
+    REQUESTS.inc(endpoint=endpoint)
+    REQUEST_SECONDS.observe(time.perf_counter() - started, endpoint=endpoint)
+    if timing:
+        response.headers["Server-Timing"] = timer.server_timing()
 
 ########################################
-# 5. Define Routes
+# 7. Define Routes
 ########################################
 @app.get("/")
 def root():
@@ -104,36 +430,227 @@ def root():
     return {"message": "DITA AI Assistant - Backend is running"}
 
 @app.post("/validate")
-async def validate_dita(file: UploadFile = File(...)):
+async def validate_dita(response: Response, file: UploadFile = File(...), stream: bool = False,
+                       timing: bool = False):
     """
-    1. Reads the uploaded `.dita` file.
-    2. Applies rule-based checks (missing <title>, invalid root, etc.).
-    3. Extracts plain text and gets a compliance probability from the ML model.
-    4. Returns JSON with `compliance_probability` and any structural `errors`.
+    Reads the uploaded `.dita` file and validates it in the worker pool.
+    Uploads larger than STREAMING_THRESHOLD bytes (or any upload when
+    `?stream=true`) are validated in streaming mode instead of being read
+    into memory at once. With `?timing=true` the response carries a
+    Server-Timing header with the duration of each stage.
+    Returns JSON with `compliance_probability` and any structural `errors`.
+    Files larger than MAX_DOCUMENT_BYTES are rejected with 413.
     """
-    content = await file.read()
+    started = time.perf_counter()
+    timer = StageTimer()
+    UPLOAD_BYTES.observe(file.size or 0, endpoint="validate")
 
-    # Parse the XML
     try:
-        root_element = etree.fromstring(content)
-    except Exception as e:
-        return {"error": f"Invalid XML: {str(e)}"}
+        if (file.size or 0) > MAX_DOCUMENT_BYTES:
+            ERRORS.inc(type="upload_too_large")
+            raise HTTPException(status_code=413, detail=f"Document is larger than {MAX_DOCUMENT_BYTES} bytes.")
+        if stream or (file.size or 0) > STREAMING_THRESHOLD:
+            return await run_validation(validate_stream, file.file, timer)
 
-    # Run rule-based checks
-    errors = perform_rule_based_checks(root_element)
+        with timer.stage("read"):
+            content = await file.read()
+        return await run_validation(validate_content, content, timer)
+    finally:
+        record_request("validate", timer, started, response, timing)
 
-    # ML compliance score
-    dita_text = extract_text_from_xml(content.decode("utf-8"))
-    X_features = vectorizer.transform([dita_text])
-    compliance_probability = float(model.predict_proba(X_features)[0][1])
+@app.post("/validate/batch")
+async def validate_dita_batch(response: Response, files: List[UploadFile] = File(...), timing: bool = False):
+    """
+    Validates many `.dita` files in one request.
+    Accepts any number of uploaded files, including zip/tar archives, which
+    are expanded in member order.
+    Returns one result per file, in input order.
+    """
+    started = time.perf_counter()
+    timer = StageTimer()
+
+    try:
+        uploads = []
+        with timer.stage("read"):
+            for upload in files:
+                UPLOAD_BYTES.observe(upload.size or 0, endpoint="validate_batch")
+                uploads.append((upload.filename, await upload.read()))
+        results = await run_validation(validate_uploads, uploads, timer)
+        return {"results": results}
+    finally:
+        record_request("validate_batch", timer, started, response, timing)
+
+@app.post("/validate/map")
+async def validate_dita_map(response: Response, file: UploadFile = File(None), map: str = None,
+                            timing: bool = False):
+    """
+    Validates DITA maps with the topics they reference. Upload a zip/tar
+    archive holding the maps and topics; every .ditamap in it is validated,
+    or only `map` (a path inside the archive). Without an upload, `map` is
+    resolved under the server's DITA_MAP_ROOT directory, if configured.
+    Returns one entry per map with each referenced topic's result and the
+    cross-topic errors (broken references, duplicate topic ids, ...).
+    """
+    started = time.perf_counter()
+    timer = StageTimer()
+
+    try:
+        if file is not None:
+            UPLOAD_BYTES.observe(file.size or 0, endpoint="validate_map")
+            with timer.stage("read"):
+                content = await file.read()
+            return await run_validation(validate_map_upload, file.filename, content, map, timer)
+
+        if DITA_MAP_ROOT is None or not map:
+            raise HTTPException(status_code=400, detail="Upload an archive, or name a map under DITA_MAP_ROOT.")
+        return await run_validation(validate_map_source, DirectorySource(DITA_MAP_ROOT), [map], timer)
+    finally:
+        record_request("validate_map", timer, started, response, timing)
+
+@app.put("/documents/{document_id}")
+async def validate_document_revision(document_id: str, response: Response, file: UploadFile = File(...),
+                                     timing: bool = False):
+    """
+    Validates the latest revision of a document being edited. The server
+    keeps a session per `document_id` (e.g. the file name), so saving a
+    large topic again only re-checks and re-vectorizes the blocks that
+    changed since the previous revision.
+    Returns the same JSON as /validate plus a `session` entry telling how
+    many blocks were reused; `incremental` is false when there was no
+    previous revision to diff against (first upload, expired session or
+    new model version).
+    """
+    started = time.perf_counter()
+    timer = StageTimer()
+    UPLOAD_BYTES.observe(file.size or 0, endpoint="documents")
+
+    try:
+        if (file.size or 0) > MAX_DOCUMENT_BYTES:
+            ERRORS.inc(type="upload_too_large")
+            raise HTTPException(status_code=413, detail=f"Document is larger than {MAX_DOCUMENT_BYTES} bytes.")
+        with timer.stage("read"):
+            content = await file.read()
+        return await run_validation(validate_revision, document_id, content, timer)
+    finally:
+        record_request("documents", timer, started, response, timing)
 
+@app.delete("/documents/{document_id}")
+def close_document(document_id: str):
+    """
+    Drops a document's session, e.g. when the editor closes it.
+    """
+    if not document_sessions.discard(document_id):
+        raise HTTPException(status_code=404, detail=f"No session for document {document_id}.")
+    return {"deleted": document_id}
+
+@app.post("/jobs", status_code=202)
+async def submit_job(files: List[UploadFile] = File(...)):
+    """
+    Queues a bulk validation job (any number of files, including zip/tar
+    archives) and returns its id at once. Poll `GET /jobs/{id}` for
+    progress and results, or follow `GET /jobs/{id}/events`.
+    """
+    uploads = []
+    for upload in files:
+        UPLOAD_BYTES.observe(upload.size or 0, endpoint="jobs")
+        uploads.append((upload.filename, await upload.read()))
+    REQUESTS.inc(endpoint="jobs")
+    expanded = await asyncio.to_thread(expand_job_files, uploads)
+    return await asyncio.to_thread(job_queue.submit, expanded)
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str, offset: int = 0, limit: int = 100):
+    """
+    Job status and progress, plus one page of per-file results (in upload
+    order) starting at `offset`. `next_offset` is null once every result
+    has been returned and the job has finished.
+    """
+    job = await asyncio.to_thread(job_queue.status, job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}.")
+    limit = max(1, min(limit, 1000))
+    results = await asyncio.to_thread(job_queue.results, job_id, offset, limit)
+    next_offset = offset + len(results)
+    finished = job["status"] in ("done", "failed") and next_offset >= job["done"]
+    return {**job, "offset": offset, "results": results, "next_offset": None if finished else next_offset}
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str, last_event_id: str = Header(None)):
+    """
+    Server-sent events for a job: one `result` event per validated file
+    (its id is the file's position, so clients reconnecting with
+    Last-Event-ID continue where they stopped), then a final `done` event
+    with the job status.
+    """
+    if await asyncio.to_thread(job_queue.status, job_id) is None:
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}.")
+    offset = int(last_event_id) + 1 if last_event_id and last_event_id.isdigit() else 0
+
+    async def events():
+        nonlocal offset
+        while True:
+            job = await asyncio.to_thread(job_queue.status, job_id)
+            results = await asyncio.to_thread(job_queue.results, job_id, offset, 100)
+            for result in results:
+                yield f"id: {offset}\nevent: result\ndata: {json.dumps(result)}\n\n"
+                offset += 1
+            if job is None or (job["status"] in ("done", "failed") and offset >= job["done"]):
+                yield f"event: done\ndata: {json.dumps(job)}\n\n"
+                return
+            if not results:
+                await asyncio.sleep(JOB_EVENTS_POLL_INTERVAL)
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+@app.delete("/jobs/{job_id}")
+async def delete_job(job_id: str):
+    """
+    Deletes a job and its stored results.
+    """
+    if not await asyncio.to_thread(job_queue.delete, job_id):
+        raise HTTPException(status_code=404, detail=f"Unknown job {job_id}.")
+    return {"deleted": job_id}
+
+@app.get("/metrics")
+def metrics():
+    """
+    Prometheus metrics: request and error counts, upload sizes, per-stage
+    and end-to-end latency histograms, cache and worker pool state.
+    """
+    return Response(metrics_registry.render(), media_type=CONTENT_TYPE)
+
+@app.get("/cache/stats")
+def cache_stats():
+    """
+    Result cache hit/miss counters and size.
+    """
+    return {"model_version": live_scorer.version, **result_cache.stats()}
+
+@app.get("/models")
+def list_models():
+    """
+    The model version being served and the versions in the registry.
+    """
     return {
-        "compliance_probability": compliance_probability,
-        "errors": errors
+        "serving": live_scorer.version,
+        "current": live_scorer.registry.current_version(),
+        "versions": live_scorer.registry.versions(),
     }
 
+@app.post("/models/reload")
+async def reload_model():
+    """
+    Load the registry's current version now instead of waiting for the next
+    poll. The new model is loaded off the event loop and swapped in atomically.
+    """
+    try:
+        swapped = await asyncio.to_thread(live_scorer.reload)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Model reload failed: {str(e)}")
+    return {"reloaded": swapped, "serving": live_scorer.version}
+
 ########################################
-# 6. Main Entrypoint
+# 8. Main Entrypoint
 ########################################
 if __name__ == "__main__":
     # Start the server: uvicorn app:app --reload
@@ -0,0 +1,220 @@
+# artifact.py
+
+import argparse
+import hashlib
+import json
+import os
+import pickle
+
+import numpy as np
+
+########################################
+# 1. Format
+########################################
+# An exported model is a directory holding:
+#
+#   header.json       format version, tokenizer settings, whether the model
+#                     uses structural features, intercept, hashes
+#   vocabulary.npy    the sorted UTF-8 tokens concatenated into one uint8
+#                     blob (only for vocabulary-based vectorizers)
+#   offsets.npy       int64 start of each token in the blob, plus its end:
+#                     token i is vocabulary[offsets[i]:offsets[i + 1]]
+#   coef.npy          float64 coefficients, aligned with the vocabulary or
+#                     indexed by hash column for HashingVectorizer models
+#
+# The .npy files are memory-mapped on load, so forked workers share the same
+# pages, and the vocabulary is binary-searched in place instead of being
+# rebuilt into a Python dict. A blob costs each token its own length, where
+# a fixed-width array would pad every token to the longest one.
+ARTIFACT_FORMAT = "dita-linear"
+ARTIFACT_FORMAT_VERSION = 2
+
+HEADER_FILE = "header.json"
+VOCABULARY_FILE = "vocabulary.npy"
+OFFSETS_FILE = "offsets.npy"
+COEF_FILE = "coef.npy"
+
+class ArtifactError(ValueError):
+    """
+    Raised for models that cannot be exported, or artifacts that are
+    unreadable, of an unknown format, or fail their hash check.
+    """
+
+def _sha256_file(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def _tokenizer_settings(vectorizer) -> dict:
+    """
+    The CountVectorizer/HashingVectorizer settings needed to reproduce its
+    tokenization, rejecting configurations a plain regex tokenizer cannot match.
+    """
+    params = vectorizer.get_params()
+    if params["analyzer"] != "word" or params["ngram_range"] != (1, 1):
+        raise ArtifactError("Only word unigram vectorizers can be exported.")
+    if params["preprocessor"] is not None or params["tokenizer"] is not None or params["strip_accents"] is not None:
+        raise ArtifactError("Custom preprocessors, tokenizers and accent stripping cannot be exported.")
+    return {
+        "token_pattern": params["token_pattern"],
+        "lowercase": bool(params["lowercase"]),
+        "binary": bool(params["binary"]),
+    }
+
+########################################
+# 2. Export
+########################################
+def export_artifact(vectorizer, model, path: str) -> dict:
+    """
+    Export a fitted vectorizer + binary linear classifier (LogisticRegression,
+    SGDClassifier with log loss, ...) to the artifact directory `path`.
+    Returns the header that was written.
+    """
+    classes = [int(c) for c in getattr(model, "classes_", [])]
+    if classes != [0, 1] or getattr(model, "coef_", None) is None or model.coef_.shape[0] != 1:
+        raise ArtifactError("Only binary linear classifiers with classes [0, 1] can be exported.")
+
+    header = {
+        "format": ARTIFACT_FORMAT,
+        "format_version": ARTIFACT_FORMAT_VERSION,
+        **_tokenizer_settings(vectorizer),
+        # Trained on text plus structural pseudo-words (see parsing.extract_features)
+        "structural": bool(getattr(vectorizer, "structural", False)),
+        "intercept": float(model.intercept_[0]),
+        "files": {},
+    }
+    coef = np.asarray(model.coef_[0], dtype=np.float64)
+
+    os.makedirs(path, exist_ok=True)
+    if hasattr(vectorizer, "vocabulary_"):
+        tokens = sorted(vectorizer.vocabulary_, key=lambda token: token.encode("utf-8"))
+        encoded = [token.encode("utf-8") for token in tokens]
+        vocabulary = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(token) for token in encoded], out=offsets[1:])
+        columns = np.array([vectorizer.vocabulary_[token] for token in tokens], dtype=np.int64)
+        coef = coef[columns] if len(columns) else coef[:0]
+        header["kind"] = "vocabulary"
+        header["max_token_bytes"] = max((len(token) for token in encoded), default=0)
+        for name, array in ((VOCABULARY_FILE, vocabulary), (OFFSETS_FILE, offsets)):
+            np.save(os.path.join(path, name), array)
+            header["files"][name] = _sha256_file(os.path.join(path, name))
+    elif type(vectorizer).__name__ == "HashingVectorizer":
+        if vectorizer.alternate_sign or vectorizer.norm is not None:
+            raise ArtifactError("HashingVectorizer must use alternate_sign=False and norm=None.")
+        header["kind"] = "hashing"
+    else:
+        raise ArtifactError(f"Unsupported vectorizer type {type(vectorizer).__name__}.")
+
+    header["n_features"] = int(coef.shape[0])
+    np.save(os.path.join(path, COEF_FILE), coef)
+    header["files"][COEF_FILE] = _sha256_file(os.path.join(path, COEF_FILE))
+
+    # The version hash covers the settings and every array file
+    settings = json.dumps({k: v for k, v in header.items() if k != "files"}, sort_keys=True)
+    digest = hashlib.sha256(settings.encode("utf-8"))
+    for name in sorted(header["files"]):
+        digest.update(header["files"][name].encode("ascii"))
+    header["sha256"] = digest.hexdigest()
+    header["version"] = header["sha256"][:12]
+
+    # Write the header last, atomically: its presence marks a complete artifact
+    header_path = os.path.join(path, HEADER_FILE)
+    with open(header_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump(header, f, indent=2, sort_keys=True)
+    os.replace(header_path + ".tmp", header_path)
+    return header
+
+########################################
+# 3. Load
+########################################
+class ModelArtifact:
+    """
+    A loaded artifact: `header` plus the (memory-mapped) `vocabulary`,
+    `offsets` and `coef` arrays. `vocabulary` and `offsets` are None for
+    hashing artifacts.
+    """
+
+    def __init__(self, path: str, header: dict, vocabulary, offsets, coef):
+        self.path = path
+        self.header = header
+        self.vocabulary = vocabulary
+        self.offsets = offsets
+        self.coef = coef
+
+    def token(self, index: int) -> bytes:
+        """
+        The UTF-8 bytes of vocabulary token `index`.
+        """
+        return self.vocabulary[self.offsets[index]:self.offsets[index + 1]].tobytes()
+
+    @property
+    def version(self) -> str:
+        return self.header["version"]
+
+    @property
+    def kind(self) -> str:
+        return self.header["kind"]
+
+    @property
+    def intercept(self) -> float:
+        return self.header["intercept"]
+
+def is_artifact(path: str) -> bool:
+    return os.path.exists(os.path.join(path, HEADER_FILE))
+
+def load_artifact(path: str, mmap: bool = True, verify: bool = False) -> ModelArtifact:
+    """
+    Load the artifact directory `path`.
+    With `mmap=True` the arrays are memory-mapped read-only instead of read
+    into private memory. With `verify=True` every file is re-hashed and
+    checked against the header first.
+    """
+    try:
+        with open(os.path.join(path, HEADER_FILE), encoding="utf-8") as f:
+            header = json.load(f)
+    except (OSError, ValueError) as e:
+        raise ArtifactError(f"Cannot read artifact header in {path}: {e}")
+
+    if header.get("format") != ARTIFACT_FORMAT or header.get("format_version") != ARTIFACT_FORMAT_VERSION:
+        raise ArtifactError(
+            f"Unsupported artifact format {header.get('format')!r} version {header.get('format_version')!r}."
+        )
+
+    if verify:
+        for name, expected in header["files"].items():
+            if _sha256_file(os.path.join(path, name)) != expected:
+                raise ArtifactError(f"Hash mismatch for {name} in {path}.")
+
+    mmap_mode = "r" if mmap else None
+    vocabulary, offsets = None, None
+    if header["kind"] == "vocabulary":
+        vocabulary = np.load(os.path.join(path, VOCABULARY_FILE), mmap_mode=mmap_mode)
+        offsets = np.load(os.path.join(path, OFFSETS_FILE), mmap_mode=mmap_mode)
+    coef = np.load(os.path.join(path, COEF_FILE), mmap_mode=mmap_mode)
+    return ModelArtifact(path, header, vocabulary, offsets, coef)
+
+########################################
+# 4. Command Line
+########################################
+def export_pickles(models_dir: str = "models", path: str = None) -> dict:
+    """
+    Export the vectorizer.pkl / model.pkl pair in `models_dir` to an artifact
+    (by default `models_dir/artifact`).
+    """
+    with open(os.path.join(models_dir, "vectorizer.pkl"), "rb") as f:
+        vectorizer = pickle.load(f)
+    with open(os.path.join(models_dir, "model.pkl"), "rb") as f:
+        model = pickle.load(f)
+    return export_artifact(vectorizer, model, path or os.path.join(models_dir, "artifact"))
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export pickled models to the memory-mappable artifact format.")
+    parser.add_argument("models_dir", nargs="?", default="models")
+    parser.add_argument("--out", default=None, help="Artifact directory (default: <models_dir>/artifact)")
+    args = parser.parse_args()
+
+    header = export_pickles(args.models_dir, args.out)
+    print(f"Exported {header['kind']} artifact version {header['version']} ({header['n_features']} features)")
@@ -0,0 +1,211 @@
+# cache.py
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+import backend.parsing as parsing
+import backend.rules as rules
+
+########################################
+# 1. Configuration
+########################################
+# Maximum number of results kept in memory (0 disables the in-memory tier)
+RESULT_CACHE_SIZE = int(os.environ.get("RESULT_CACHE_SIZE", "1024"))
+
+# Seconds a cached result stays valid (0 means results never expire)
+RESULT_CACHE_TTL = float(os.environ.get("RESULT_CACHE_TTL", "3600"))
+
+# Optional SQLite file for a persistent tier that survives restarts
+RESULT_CACHE_DB = os.environ.get("RESULT_CACHE_DB") or None
+
+# Most rows kept in the SQLite tier (0 means no limit); the oldest go first
+RESULT_CACHE_DB_ROWS = int(os.environ.get("RESULT_CACHE_DB_ROWS", "100000"))
+
+# The SQLite tier drops expired and excess rows when it is opened and after
+# this many writes
+PRUNE_INTERVAL = 256
+
+########################################
+# 2. Content-Addressed Result Cache
+########################################
+def validation_settings() -> str:
+    """
+    Everything besides the model and the bytes that shapes a result: the
+    rule set version and the parser settings (DTD loading, entity
+    expansion, huge trees, depth and element limits).
+    """
+    options = ",".join(f"{name}={value}" for name, value in sorted(parsing.parser_options().items()))
+    return (f"rules={rules.RULES_VERSION};{options};dtd_dir={parsing.DITA_DTD_DIR};"
+            f"max_depth={parsing.MAX_XML_DEPTH};max_elements={parsing.MAX_XML_ELEMENTS}")
+
+def content_key(content, model_version: str) -> str:
+    """
+    Cache key for a validation result: a SHA-256 of the model version, the
+    `validation_settings` and the raw upload bytes, so retraining the model,
+    changing a rule or a parser setting invalidates old results.
+    `content` is either bytes or an iterable of byte chunks (for streams).
+    """
+    digest = hashlib.sha256(model_version.encode("utf-8"))
+    digest.update(b"\0")
+    digest.update(validation_settings().encode("utf-8"))
+    digest.update(b"\0")
+    if isinstance(content, (bytes, bytearray)):
+        digest.update(content)
+    else:
+        for chunk in content:
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class ResultCache:
+    """
+    Two-tier cache of validation results keyed by `content_key`.
+
+    - An in-process LRU bounded by `max_entries`.
+    - An optional SQLite tier at `db_path` that survives restarts; disk hits
+      are promoted back into the LRU.
+
+    Entries older than `ttl` seconds are treated as misses in both tiers.
+    The SQLite tier deletes them, and keeps at most `max_rows` rows,
+    dropping the oldest first, when it is opened and every PRUNE_INTERVAL
+    writes.
+    The cache is thread-safe, since lookups happen inside the worker pool.
+    The SQLite file is opened on first use, so a cache created before a
+    fork (see serve.py) gets its own connection in each worker process.
+    """
+
+    def __init__(self, max_entries: int = RESULT_CACHE_SIZE, ttl: float = RESULT_CACHE_TTL, db_path: str = RESULT_CACHE_DB,
+                 max_rows: int = RESULT_CACHE_DB_ROWS):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path
+        self.max_rows = max_rows
+        self._writes = 0
+        self.hits = 0
+        self.misses = 0
+        self.disk_hits = 0
+        self._entries = OrderedDict()  # key -> (created, result)
+        self._lock = threading.Lock()
+        self._db = None
+
+    def _connect(self):
+        # Callers hold self._lock
+        if self._db is None and self.db_path:
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS results (key TEXT PRIMARY KEY, created REAL NOT NULL, result TEXT NOT NULL)"
+            )
+            self._db.execute("CREATE INDEX IF NOT EXISTS results_created ON results (created)")
+            self._prune(self._db)
+            self._db.commit()
+        return self._db
+
+    def _prune(self, db):
+        # Callers hold self._lock and commit
+        if self.ttl > 0:
+            db.execute("DELETE FROM results WHERE created < ?", (time.time() - self.ttl,))
+        if self.max_rows > 0:
+            db.execute(
+                "DELETE FROM results WHERE key IN (SELECT key FROM results ORDER BY created DESC LIMIT -1 OFFSET ?)",
+                (self.max_rows,),
+            )
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_entries > 0 or bool(self.db_path)
+
+    def _expired(self, created: float) -> bool:
+        return self.ttl > 0 and time.time() - created > self.ttl
+
+    def _remember(self, key: str, created: float, result: dict):
+        if self.max_entries <= 0:
+            return
+        self._entries[key] = (created, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key: str):
+        """
+        Return a copy of the cached result for `key`, or None on a miss.
+        """
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created, result = entry
+                if not self._expired(created):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return dict(result)
+                del self._entries[key]
+
+            db = self._connect()
+            if db is not None:
+                row = db.execute("SELECT created, result FROM results WHERE key = ?", (key,)).fetchone()
+                if row is not None and not self._expired(row[0]):
+                    result = json.loads(row[1])
+                    self._remember(key, row[0], result)
+                    self.hits += 1
+                    self.disk_hits += 1
+                    return dict(result)
+
+            self.misses += 1
+            return None
+
+    def put(self, key: str, result: dict):
+        """
+        Store a validation result under `key` in every enabled tier.
+        """
+        if not self.enabled:
+            return
+
+        created = time.time()
+        with self._lock:
+            self._remember(key, created, result)
+            db = self._connect()
+            if db is not None:
+                db.execute(
+                    "INSERT OR REPLACE INTO results (key, created, result) VALUES (?, ?, ?)",
+                    (key, created, json.dumps(result)),
+                )
+                self._writes += 1
+                if self._writes % PRUNE_INTERVAL == 0:
+                    self._prune(db)
+                db.commit()
+
+    def clear(self):
+        """
+        Drop every cached result (both tiers) and reset the counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.disk_hits = 0
+            db = self._connect()
+            if db is not None:
+                db.execute("DELETE FROM results")
+                db.commit()
+
+    def stats(self) -> dict:
+        """
+        Hit/miss counters and current size, e.g. for the /cache/stats endpoint.
+        """
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "enabled": self.enabled,
+                "hits": self.hits,
+                "misses": self.misses,
+                "disk_hits": self.disk_hits,
+                "hit_ratio": self.hits / lookups if lookups else 0.0,
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "persistent": bool(self.db_path),
+            }
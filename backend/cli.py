@@ -0,0 +1,306 @@
+# cli.py
+
+import argparse
+import json
+import os
+import sys
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from backend.cache import content_key
+from backend.model import MODELS_DIR, load_scorer
+from backend.parsing import invalid_document, parse_dita
+from backend.registry import ModelRegistry
+from backend.rules import perform_rule_based_checks
+
+########################################
+# 1. Configuration
+########################################
+# File extensions validated when walking a directory tree
+DITA_SUFFIXES = (".dita", ".xml")
+
+# Files per worker task; each task scores its parsable files in one call
+BATCH_SIZE = 64
+
+# Version of the incremental state file format
+STATE_VERSION = 1
+
+########################################
+# 2. Collecting Files
+########################################
+def iter_files(paths: list, suffixes: tuple = DITA_SUFFIXES):
+    """
+    Yields every file with one of `suffixes` under `paths` (files are
+    yielded as given), in a stable, sorted order.
+    """
+    for path in paths:
+        if os.path.isfile(path):
+            yield path
+            continue
+        for dirpath, dirnames, filenames in os.walk(path):
+            dirnames[:] = sorted(name for name in dirnames if not name.startswith("."))
+            for name in sorted(filenames):
+                if name.lower().endswith(suffixes):
+                    yield os.path.join(dirpath, name)
+
+def _batched(iterable, size: int):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+########################################
+# 3. Validation Workers
+########################################
+# Each worker process loads the scorer once (artifacts are memory-mapped,
+# so workers share the coefficient pages).
+_scorer = None
+
+def load_cli_scorer(models_dir: str = MODELS_DIR, registry: str = None):
+    """
+    The registry's current version if it has one, else the model in
+    `models_dir` (the same choice the server makes at startup).
+    """
+    if registry:
+        models = ModelRegistry(registry)
+        if models.current_version():
+            return models.load()
+    return load_scorer(models_dir)
+
+def _init_worker(models_dir: str, registry: str):
+    global _scorer
+    _scorer = load_cli_scorer(models_dir, registry)
+
+def validate_files(batch: list) -> list:
+    """
+    Worker task: validate a batch of (path, previous key) pairs.
+
+    Each file is hashed with the model version (`content_key`); when the key
+    matches the previous run's, the file is not parsed again and the result
+    is {"path", "key", "unchanged": True}. Otherwise the result has the same
+    fields as the /validate response, plus "path" and "key". Parsable files
+    in the batch are scored with one `score_texts` call.
+    """
+    scorer = _scorer
+    results = []
+    texts = []
+    scored = []
+
+    for path, previous_key in batch:
+        try:
+            with open(path, "rb") as f:
+                content = f.read()
+        except OSError as e:
+            results.append({"path": path, "key": None, "error": f"Unreadable file: {e}"})
+            continue
+
+        key = content_key(content, scorer.version)
+        if key == previous_key:
+            results.append({"path": path, "key": key, "unchanged": True})
+            continue
+
+        try:
+            root_element = parse_dita(content)
+        except Exception as e:
+            results.append({"path": path, "key": key, **invalid_document(e)})
+            continue
+
+        errors = perform_rule_based_checks(root_element)
+        results.append({"path": path, "key": key, "errors": errors})
+        texts.append(scorer.extract(root_element))
+        scored.append(len(results) - 1)
+
+    for index, probability in zip(scored, scorer.score_texts(texts)):
+        results[index]["compliance_probability"] = probability
+        results[index]["model_version"] = scorer.version
+
+    return results
+
+def validate_tree(paths: list, workers: int = None, state: dict = None,
+                  models_dir: str = MODELS_DIR, registry: str = None, batch_size: int = BATCH_SIZE):
+    """
+    Validates every DITA file under `paths`, yielding results in file order.
+
+    Batches are validated in a process pool with at most two batches per
+    worker in flight. With a `state` from a previous run (see `load_state`),
+    files whose content and model version are unchanged reuse the stored
+    result and are marked "cached": True.
+
+    Set `workers=1` to validate in the current process.
+    """
+    state = state or {}
+    workers = workers or os.cpu_count() or 1
+    batches = _batched(
+        ((path, state.get(path, {}).get("key")) for path in iter_files(paths)),
+        batch_size,
+    )
+
+    def finish(batch_results):
+        for result in batch_results:
+            if result.pop("unchanged", False):
+                result = {**state[result["path"]]["result"], "path": result["path"],
+                          "key": result["key"], "cached": True}
+            yield result
+
+    if workers == 1:
+        _init_worker(models_dir, registry)
+        for batch in batches:
+            yield from finish(validate_files(batch))
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(models_dir, registry)) as pool:
+        in_flight = deque()
+        for batch in batches:
+            in_flight.append(pool.submit(validate_files, batch))
+            if len(in_flight) >= workers * 2:
+                yield from finish(in_flight.popleft().result())
+        while in_flight:
+            yield from finish(in_flight.popleft().result())
+
+########################################
+# 4. Incremental State
+########################################
+def load_state(path: str) -> dict:
+    """
+    Results of the previous run, as {file path: {"key", "result"}}.
+    A missing or unreadable state file means a full run.
+    """
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if data.get("version") != STATE_VERSION:
+        return {}
+    return data.get("files", {})
+
+def save_state(path: str, results: list):
+    """
+    Atomically write the state for the next run. Only files seen in this
+    run are kept, so deleted files drop out.
+    """
+    files = {}
+    for result in results:
+        if result.get("key") is None:
+            continue
+        stored = {k: v for k, v in result.items() if k not in ("path", "key", "cached")}
+        files[result["path"]] = {"key": result["key"], "result": stored}
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"version": STATE_VERSION, "files": files}, f)
+    os.replace(tmp, path)
+
+########################################
+# 5. Output Formats
+########################################
+def is_failure(result: dict, min_probability: float = None) -> bool:
+    """
+    A file fails if it is not well-formed, breaks a structural rule, or
+    (when `min_probability` is set) scores below it.
+    """
+    if "error" in result or result.get("errors"):
+        return True
+    return min_probability is not None and result["compliance_probability"] < min_probability
+
+def to_sarif(results: list, min_probability: float = None) -> dict:
+    """
+    A SARIF 2.1.0 log with one result per problem found.
+    """
+    rules = [
+        {"id": "invalid-xml", "shortDescription": {"text": "The file is not well-formed XML."}},
+        {"id": "dita-structure", "shortDescription": {"text": "The topic breaks a structural DITA rule."}},
+        {"id": "low-compliance", "shortDescription": {"text": "The model's compliance probability is below the threshold."}},
+    ]
+    sarif_results = []
+    for result in results:
+        location = [{"physicalLocation": {"artifactLocation": {"uri": result["path"].replace(os.sep, "/")}}}]
+        if "line" in result:
+            # Where the parser stopped, for files that are not well-formed
+            location[0]["physicalLocation"]["region"] = {"startLine": result["line"], "startColumn": result["column"]}
+        problems = []
+        if "error" in result:
+            problems.append(("invalid-xml", result["error"]))
+        for error in result.get("errors", []):
+            problems.append(("dita-structure", error))
+        probability = result.get("compliance_probability")
+        if min_probability is not None and probability is not None and probability < min_probability:
+            problems.append(("low-compliance", f"Compliance probability {probability:.3f} is below {min_probability}."))
+        for rule_id, message in problems:
+            sarif_results.append({
+                "ruleId": rule_id,
+                "level": "warning" if rule_id == "low-compliance" else "error",
+                "message": {"text": message},
+                "locations": location,
+            })
+    return {
+        "$schema": "https://json.schemastore.org/sarif-2.1.0.json",
+        "version": "2.1.0",
+        "runs": [{
+            "tool": {"driver": {"name": "dita-validator", "rules": rules}},
+            "results": sarif_results,
+        }],
+    }
+
+########################################
+# 6. Main Entrypoint
+########################################
+def main(argv: list = None) -> int:
+    """
+    Validate DITA files without the HTTP server. Returns the exit status:
+    0 if every file passed, 1 if any failed.
+    """
+    parser = argparse.ArgumentParser(
+        prog="python -m backend.cli",
+        description="Validate a tree of DITA files with the rule checks and the compliance model.",
+    )
+    parser.add_argument("paths", nargs="+", help="Files or directories to validate")
+    parser.add_argument("--format", choices=["jsonl", "sarif"], default="jsonl",
+                        help="JSONL streams one result per line; SARIF is written once at the end")
+    parser.add_argument("--output", default="-", help="Output file (default: stdout)")
+    parser.add_argument("--workers", type=int, help="Validation processes (default: number of CPUs)")
+    parser.add_argument("--models-dir", default=MODELS_DIR)
+    parser.add_argument("--registry", default=os.environ.get("MODEL_REGISTRY", os.path.join(MODELS_DIR, "registry")),
+                        help="Model registry whose current version is used, if it has one")
+    parser.add_argument("--min-probability", type=float,
+                        help="Also fail files whose compliance probability is below this value")
+    parser.add_argument("--incremental", metavar="STATE_FILE",
+                        help="Skip files unchanged since the run that wrote STATE_FILE, and update it")
+    args = parser.parse_args(argv)
+    missing = [path for path in args.paths if not os.path.exists(path)]
+    if missing:
+        # A mistyped path must not turn into "0 files validated" in a CI hook
+        parser.error(f"no such file or directory: {', '.join(missing)}")
+
+    state = load_state(args.incremental) if args.incremental else {}
+    out = sys.stdout if args.output == "-" else open(args.output, "w", encoding="utf-8")
+    results = []
+    failed = 0
+    try:
+        for result in validate_tree(args.paths, args.workers, state, args.models_dir, args.registry):
+            results.append(result)
+            if is_failure(result, args.min_probability):
+                failed += 1
+            if args.format == "jsonl":
+                line = {k: v for k, v in result.items() if k != "key"}
+                out.write(json.dumps(line) + "\n")
+                out.flush()
+        if args.format == "sarif":
+            json.dump(to_sarif(results, args.min_probability), out, indent=2)
+            out.write("\n")
+    finally:
+        if out is not sys.stdout:
+            out.close()
+
+    if args.incremental:
+        save_state(args.incremental, results)
+    cached = sum(1 for result in results if result.get("cached"))
+    print(f"{len(results)} files validated ({cached} unchanged), {failed} failed.", file=sys.stderr)
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
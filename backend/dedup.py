@@ -0,0 +1,182 @@
+# dedup.py
+
+import re
+import zlib
+from collections import Counter
+
+import numpy as np
+
+########################################
+# 1. Configuration
+########################################
+# MinHash permutations per document; split into DEDUP_BANDS LSH bands of
+# DEDUP_PERMUTATIONS // DEDUP_BANDS rows. 16 bands of 8 rows make documents
+# above ~0.7 estimated Jaccard similarity very likely to share a bucket.
+DEDUP_PERMUTATIONS = 128
+DEDUP_BANDS = 16
+
+# Documents are compared as sets of word n-grams ("shingles") of this size
+DEDUP_SHINGLE_SIZE = 3
+
+# Documents with at least this estimated Jaccard similarity (the fraction of
+# equal MinHash values) are near-duplicates
+DEDUP_THRESHOLD = 0.8
+
+# Same tokens as the vectorizers (lowercased words of 2+ characters)
+_TOKEN_RE = re.compile(r"(?u)\b\w\w+\b")
+
+# Multiplier combining token hashes into shingle hashes (a 64-bit odd constant)
+_SHINGLE_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+########################################
+# 2. MinHash Signatures
+########################################
+def shingle_hashes(text: str, size: int = DEDUP_SHINGLE_SIZE) -> np.ndarray:
+    """
+    64-bit hashes of the word n-grams of `text` (one shingle of all words
+    if there are fewer than `size`; none for a text without words).
+    Token hashes are CRC32s, so fingerprints are stable across processes.
+    """
+    tokens = np.fromiter((zlib.crc32(token.encode("utf-8")) for token in _TOKEN_RE.findall(text.lower())),
+                         dtype=np.uint64)
+    count = max(len(tokens) - size + 1, 1) if len(tokens) else 0
+    hashes = tokens[:count].copy()
+    for offset in range(1, min(size, len(tokens))):
+        hashes = hashes * _SHINGLE_MULTIPLIER + tokens[offset:offset + count]
+    return hashes
+
+def minhash_signatures(texts: list, num_perm: int = DEDUP_PERMUTATIONS, shingle_size: int = DEDUP_SHINGLE_SIZE,
+                       seed: int = 0, chunk_rows: int = 1 << 15) -> np.ndarray:
+    """
+    MinHash signatures of `texts`, as a (len(texts), num_perm) uint32 array.
+
+    Each permutation is a multiply-shift hash of the shingle hashes. All
+    shingles of all texts are hashed together, `chunk_rows` shingles at a
+    time, and reduced to per-document minimums with `np.minimum.reduceat`,
+    so the work is a few large NumPy operations rather than a Python loop
+    per document or per permutation.
+    """
+    rng = np.random.default_rng(seed)
+    multipliers = rng.integers(1, 2 ** 63, size=num_perm, dtype=np.uint64) | np.uint64(1)
+    increments = rng.integers(0, 2 ** 63, size=num_perm, dtype=np.uint64)
+
+    hashes = [shingle_hashes(text, shingle_size) for text in texts]
+    lengths = np.fromiter((len(h) for h in hashes), dtype=np.int64, count=len(hashes))
+    shingles = np.concatenate(hashes) if hashes else np.empty(0, dtype=np.uint64)
+    owners = np.repeat(np.arange(len(texts)), lengths)
+
+    # Texts without words keep the all-max signature, so they match each other
+    signatures = np.full((len(texts), num_perm), np.iinfo(np.uint32).max, dtype=np.uint32)
+    for start in range(0, len(shingles), chunk_rows):
+        rows = shingles[start:start + chunk_rows]
+        docs = owners[start:start + chunk_rows]
+        values = ((rows[:, None] * multipliers + increments) >> np.uint64(32)).astype(np.uint32)
+        starts = np.flatnonzero(np.r_[True, docs[1:] != docs[:-1]])
+        minimums = np.minimum.reduceat(values, starts, axis=0)
+        # A document may continue from the previous chunk: keep the smaller values
+        signatures[docs[starts]] = np.minimum(signatures[docs[starts]], minimums)
+    return signatures
+
+########################################
+# 3. LSH Index
+########################################
+class LSHIndex:
+    """
+    Banded locality-sensitive hashing over MinHash signatures.
+
+    A signature is cut into `bands` bands; documents sharing any whole band
+    land in the same bucket and become candidates, which are then checked
+    against `threshold` with their full signatures. Lookups cost one dict
+    access per band, regardless of how many documents are indexed.
+    """
+
+    def __init__(self, bands: int = DEDUP_BANDS, threshold: float = DEDUP_THRESHOLD):
+        self.bands = bands
+        self.threshold = threshold
+        self._buckets = [{} for _ in range(bands)]
+        self._signatures = {}
+
+    def _band_keys(self, signature: np.ndarray):
+        return [band.tobytes() for band in np.split(signature, self.bands)]
+
+    def find(self, signature: np.ndarray):
+        """
+        The key of the first indexed document similar to `signature`, or None.
+        """
+        checked = set()
+        for buckets, band_key in zip(self._buckets, self._band_keys(signature)):
+            for key in buckets.get(band_key, ()):
+                if key in checked:
+                    continue
+                checked.add(key)
+                if np.count_nonzero(self._signatures[key] == signature) >= self.threshold * len(signature):
+                    return key
+        return None
+
+    def add(self, key, signature: np.ndarray):
+        self._signatures[key] = signature
+        for buckets, band_key in zip(self._buckets, self._band_keys(signature)):
+            buckets.setdefault(band_key, []).append(key)
+
+    def __len__(self) -> int:
+        return len(self._signatures)
+
+########################################
+# 4. Corpus Deduplication
+########################################
+class DedupReport:
+    """
+    Outcome of `deduplicate`: documents seen, clusters of near-duplicates
+    found (a unique document is a cluster of one), documents removed (in
+    "drop" mode) and the size of the largest cluster.
+    """
+
+    def __init__(self):
+        self.documents = 0
+        self.clusters = 0
+        self.removed = 0
+        self.largest_cluster = 0
+
+    def as_dict(self) -> dict:
+        return dict(vars(self))
+
+def deduplicate(texts: list, labels: list, mode: str = "drop", threshold: float = DEDUP_THRESHOLD,
+                batch_size: int = 10000, report: DedupReport = None):
+    """
+    Groups near-duplicate documents and either drops all but the first of
+    each group (`mode="drop"`) or keeps them all with sample weights of
+    1 / group size (`mode="weight"`), so a templated topic repeated 500
+    times counts as much as a unique one.
+
+    Documents are only compared with documents of the same label: a
+    compliant topic and its slightly broken copy are exactly the pairs the
+    model has to learn from.
+
+    Returns (texts, labels, weights); weights is None in "drop" mode.
+    """
+    if mode not in ("drop", "weight"):
+        raise ValueError(f"Unknown dedup mode {mode!r}.")
+    report = report if report is not None else DedupReport()
+    indexes = {}
+    cluster_of = []
+    for start in range(0, len(texts), batch_size):
+        signatures = minhash_signatures(texts[start:start + batch_size])
+        for offset, signature in enumerate(signatures):
+            position = start + offset
+            index = indexes.setdefault(labels[position], LSHIndex(threshold=threshold))
+            match = index.find(signature)
+            if match is None:
+                index.add(position, signature)
+                match = position
+            cluster_of.append(match)
+
+    sizes = Counter(cluster_of)
+    report.documents = len(texts)
+    report.clusters = len(sizes)
+    report.largest_cluster = max(sizes.values(), default=0)
+
+    if mode == "weight":
+        return texts, labels, [1.0 / sizes[cluster] for cluster in cluster_of]
+    keep = [position for position, cluster in enumerate(cluster_of) if cluster == position]
+    report.removed = len(texts) - len(keep)
+    return [texts[position] for position in keep], [labels[position] for position in keep], None
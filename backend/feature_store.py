@@ -0,0 +1,115 @@
+# feature_store.py
+
+import os
+import sqlite3
+import zlib
+
+########################################
+# 1. Per-File Extraction Cache
+########################################
+class FeatureStore:
+    """
+    Persistent cache of the text extracted from each corpus file, so
+    retraining only re-parses files that were added or modified.
+
+    Entries live in an SQLite file, keyed by path and validated with:
+
+    - mtime and size: if both are unchanged, the stored text is used
+      without even opening the file;
+    - a SHA-256 of the content: if the file was touched but its bytes are
+      the same, the stored text is reused without parsing.
+
+    Extracted text is stored zlib-compressed. Parse failures are stored
+    too, so a broken file is not re-parsed every run. Plain text and text
+    with structural tokens (`structural=True`) are kept in separate tables.
+
+    `iter_corpus` drives the store: `split` a batch into cached results and
+    files to extract, then `record` what the workers extracted.
+    """
+
+    def __init__(self, db_path: str, structural: bool = False):
+        self.db_path = db_path
+        self.structural = structural
+        self._table = "files_structural" if structural else "files"
+        self._db = sqlite3.connect(db_path)
+        # The store is a rebuildable cache: trade durability for write speed
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            f"CREATE TABLE IF NOT EXISTS {self._table} ("
+            "path TEXT PRIMARY KEY, mtime_ns INTEGER NOT NULL, size INTEGER NOT NULL, "
+            "digest TEXT, text BLOB, error TEXT)"
+        )
+        self._db.commit()
+        self._stats = {}  # path -> (mtime_ns, size) for files being extracted
+
+    def _row(self, path: str):
+        return self._db.execute(
+            f"SELECT mtime_ns, size, digest, text, error FROM {self._table} WHERE path = ?", (path,)
+        ).fetchone()
+
+    def split(self, batch: list):
+        """
+        Splits a batch of (path, label) pairs into:
+
+        - `cached`: {path: (text, error)} for files whose mtime and size match
+        - `pending`: (path, label, known digest or None) for files to extract
+        """
+        cached = {}
+        pending = []
+        for path, label in batch:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                pending.append((path, label, None))
+                continue
+            row = self._row(path)
+            if row is not None and row[0] == stat.st_mtime_ns and row[1] == stat.st_size:
+                cached[path] = (_decompress(row[3]), row[4])
+                continue
+            self._stats[path] = (stat.st_mtime_ns, stat.st_size)
+            pending.append((path, label, row[2] if row is not None else None))
+        return cached, pending
+
+    def record(self, path: str, digest: str, text: str, error: str):
+        """
+        Store what was extracted from `path` and return its (text, error).
+        `text` and `error` are both None when the content hash matched the
+        stored digest: the stored entry is refreshed and returned instead.
+        """
+        stat = self._stats.pop(path, None)
+        if text is None and error is None:
+            row = self._row(path)
+            if stat is not None:
+                self._db.execute(f"UPDATE {self._table} SET mtime_ns = ?, size = ? WHERE path = ?", (*stat, path))
+            return _decompress(row[3]), row[4]
+        if stat is not None:
+            self._db.execute(
+                f"INSERT OR REPLACE INTO {self._table} (path, mtime_ns, size, digest, text, error) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (path, *stat, digest, _compress(text), error),
+            )
+        return text, error
+
+    def prune(self, seen: set):
+        """
+        Drop entries for files that are no longer part of the corpus.
+        """
+        stale = [(path,) for (path,) in self._db.execute(f"SELECT path FROM {self._table}") if path not in seen]
+        self._db.executemany(f"DELETE FROM {self._table} WHERE path = ?", stale)
+
+    def commit(self):
+        self._db.commit()
+
+    def close(self):
+        self._db.commit()
+        self._db.close()
+
+    def __len__(self) -> int:
+        return self._db.execute(f"SELECT COUNT(*) FROM {self._table}").fetchone()[0]
+
+def _compress(text):
+    return None if text is None else zlib.compress(text.encode("utf-8"))
+
+def _decompress(blob):
+    return None if blob is None else zlib.decompress(blob).decode("utf-8")
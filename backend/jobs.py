@@ -0,0 +1,260 @@
+# jobs.py
+
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+
+from backend.workers import _env_int
+
+########################################
+# 1. Configuration
+########################################
+# SQLite file holding queued jobs, their uploaded files and results
+JOBS_DB = os.environ.get("JOBS_DB", "jobs.sqlite")
+
+# Number of jobs processed at the same time (each in its own thread)
+JOB_WORKERS = _env_int("JOB_WORKERS", 1)
+
+# Files validated (and scored in one model call) per step of a job
+JOB_CHUNK_SIZE = _env_int("JOB_CHUNK_SIZE", 64)
+
+# Seconds finished (done or failed) jobs and their results are kept before
+# they are purged (0 keeps them until deleted)
+JOB_RETENTION_SECONDS = _env_int("JOB_RETENTION_SECONDS", 7 * 24 * 3600)
+
+# A worker holds a lease on its job, renewed after every chunk; when a
+# process dies, its jobs are resumed by others once the lease runs out
+JOB_LEASE_SECONDS = 300
+
+# Seconds idle workers wait before checking the database for new jobs
+# (jobs submitted in this process wake them up immediately)
+JOB_POLL_SECONDS = 5
+
+########################################
+# 2. Persistent Job Queue
+########################################
+class JobQueue:
+    """
+    Bulk validation jobs persisted in SQLite, so they survive restarts.
+
+    `submit` stores the files of a job and returns its id immediately.
+    Worker threads take queued jobs oldest first and validate their files
+    in order, `chunk_size` at a time, with `validate` (a function from a
+    list of (filename, content) pairs to one result per pair, such as
+    app.validate_uploads). Each chunk's results are stored as soon as it is
+    done, and the uploaded bytes of validated files are dropped.
+
+    A job interrupted by a restart is resumed from its first unvalidated
+    file by `start`. Workers are also started by the first `submit`.
+    Jobs finished more than `retention` seconds ago are purged whenever a
+    worker looks for work. The database is opened on first use.
+    """
+
+    def __init__(self, db_path: str, validate, workers: int = JOB_WORKERS, chunk_size: int = JOB_CHUNK_SIZE,
+                 retention: float = JOB_RETENTION_SECONDS):
+        self.db_path = db_path
+        self.validate = validate
+        self.workers = workers
+        self.chunk_size = chunk_size
+        self.retention = retention
+        self._db = None
+        self._lock = threading.Lock()
+        self._wakeup = threading.Condition(self._lock)
+        self._threads = []
+        self._stop = False
+
+    def _connect(self):
+        # Callers hold self._lock
+        if self._db is None:
+            self._db = sqlite3.connect(self.db_path, check_same_thread=False)
+            self._db.executescript(
+                "CREATE TABLE IF NOT EXISTS jobs ("
+                " id TEXT PRIMARY KEY, status TEXT NOT NULL, total INTEGER NOT NULL,"
+                " done INTEGER NOT NULL DEFAULT 0, created REAL NOT NULL, finished REAL, error TEXT, lease REAL);"
+                "CREATE TABLE IF NOT EXISTS job_files ("
+                " job_id TEXT NOT NULL, seq INTEGER NOT NULL, filename TEXT, content BLOB, result TEXT,"
+                " PRIMARY KEY (job_id, seq));"
+            )
+            self._db.commit()
+        return self._db
+
+    def start(self):
+        """
+        Start the worker threads (idempotent); they resume unfinished jobs.
+        """
+        with self._lock:
+            self._connect()
+            self._stop = False
+            self._threads = [thread for thread in self._threads if thread.is_alive()]
+            while len(self._threads) < self.workers:
+                thread = threading.Thread(target=self._work, name=f"job-worker-{len(self._threads)}", daemon=True)
+                thread.start()
+                self._threads.append(thread)
+
+    def stop(self):
+        """
+        Ask the workers to exit after their current chunk. Unfinished jobs
+        stay queued in the database.
+        """
+        with self._lock:
+            self._stop = True
+            self._wakeup.notify_all()
+
+    def submit(self, files: list) -> dict:
+        """
+        Queue a job for a list of (filename, content) pairs.
+        Returns the job's status (see `status`).
+        """
+        job_id = uuid.uuid4().hex
+        with self._lock:
+            db = self._connect()
+            db.execute(
+                "INSERT INTO jobs (id, status, total, created) VALUES (?, 'queued', ?, ?)",
+                (job_id, len(files), time.time()),
+            )
+            db.executemany(
+                "INSERT INTO job_files (job_id, seq, filename, content) VALUES (?, ?, ?, ?)",
+                ((job_id, seq, filename, content) for seq, (filename, content) in enumerate(files)),
+            )
+            db.commit()
+            self._wakeup.notify()
+        self.start()
+        return self.status(job_id)
+
+    def status(self, job_id: str):
+        """
+        {"id", "status", "total", "done", "created", "finished", "error"},
+        or None for an unknown job. Status is queued, running, done or failed.
+        """
+        with self._lock:
+            row = self._connect().execute(
+                "SELECT id, status, total, done, created, finished, error FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        if row is None:
+            return None
+        return dict(zip(("id", "status", "total", "done", "created", "finished", "error"), row))
+
+    def results(self, job_id: str, offset: int = 0, limit: int = 100) -> list:
+        """
+        Results of files `offset` .. `offset + limit - 1` (in upload order)
+        that have been validated so far.
+        """
+        with self._lock:
+            rows = self._connect().execute(
+                "SELECT result FROM job_files WHERE job_id = ? AND seq >= ? AND result IS NOT NULL"
+                " ORDER BY seq LIMIT ?",
+                (job_id, offset, limit),
+            ).fetchall()
+        return [json.loads(result) for (result,) in rows]
+
+    def delete(self, job_id: str) -> bool:
+        """
+        Remove a job and its results. A running job stops after its current chunk.
+        Returns False for an unknown job.
+        """
+        with self._lock:
+            db = self._connect()
+            deleted = db.execute("DELETE FROM jobs WHERE id = ?", (job_id,)).rowcount
+            db.execute("DELETE FROM job_files WHERE job_id = ?", (job_id,))
+            db.commit()
+        return bool(deleted)
+
+    def _purge(self, now: float):
+        # Callers hold self._lock. Drop jobs finished before the retention window.
+        if self.retention <= 0:
+            return
+        expired = [
+            (job_id,) for (job_id,) in self._db.execute(
+                "SELECT id FROM jobs WHERE status IN ('done', 'failed') AND finished < ?", (now - self.retention,)
+            )
+        ]
+        if expired:
+            self._db.executemany("DELETE FROM job_files WHERE job_id = ?", expired)
+            self._db.executemany("DELETE FROM jobs WHERE id = ?", expired)
+            self._db.commit()
+
+    def _claim(self):
+        """
+        Wait for the oldest unfinished job whose lease has expired and take
+        a lease on it. Returns its id, or None when the queue is stopping.
+
+        Leases (rather than in-memory bookkeeping) keep several server
+        processes sharing one database from working on the same job, and
+        let a job abandoned by a crashed process be picked up again.
+        """
+        with self._lock:
+            while not self._stop:
+                now = time.time()
+                self._connect()
+                self._purge(now)
+                row = self._db.execute(
+                    "SELECT id FROM jobs WHERE status IN ('queued', 'running') AND (lease IS NULL OR lease < ?)"
+                    " ORDER BY created LIMIT 1",
+                    (now,),
+                ).fetchone()
+                if row is not None:
+                    claimed = self._db.execute(
+                        "UPDATE jobs SET status = 'running', lease = ? WHERE id = ? AND (lease IS NULL OR lease < ?)",
+                        (now + JOB_LEASE_SECONDS, row[0], now),
+                    ).rowcount
+                    self._db.commit()
+                    if claimed:
+                        return row[0]
+                    continue
+                self._wakeup.wait(timeout=JOB_POLL_SECONDS)
+            return None
+
+    def _work(self):
+        while True:
+            job_id = self._claim()
+            if job_id is None:
+                return
+            try:
+                self._run(job_id)
+            except Exception as e:
+                print(f"Job {job_id} failed: {e}")
+                with self._lock:
+                    self._db.execute(
+                        "UPDATE jobs SET status = 'failed', finished = ?, error = ? WHERE id = ?",
+                        (time.time(), f"{type(e).__name__}: {e}", job_id),
+                    )
+                    self._db.commit()
+            finally:
+                with self._lock:
+                    self._db.execute("UPDATE jobs SET lease = NULL WHERE id = ?", (job_id,))
+                    self._db.commit()
+
+    def _run(self, job_id: str):
+        while True:
+            with self._lock:
+                if self._stop:
+                    return
+                rows = self._db.execute(
+                    "SELECT seq, filename, content FROM job_files WHERE job_id = ? AND result IS NULL"
+                    " ORDER BY seq LIMIT ?",
+                    (job_id, self.chunk_size),
+                ).fetchall()
+                if not rows:
+                    self._db.execute(
+                        "UPDATE jobs SET status = 'done', finished = ? WHERE id = ? AND status = 'running'",
+                        (time.time(), job_id),
+                    )
+                    self._db.commit()
+                    return
+
+            # Validate outside the lock so status polls are never blocked
+            results = self.validate([(filename, content) for _, filename, content in rows])
+
+            with self._lock:
+                stored = self._db.executemany(
+                    "UPDATE job_files SET result = ?, content = NULL WHERE job_id = ? AND seq = ? AND result IS NULL",
+                    ((json.dumps(result), job_id, seq) for (seq, _, _), result in zip(rows, results)),
+                ).rowcount
+                self._db.execute(
+                    "UPDATE jobs SET done = done + ?, lease = ? WHERE id = ?",
+                    (stored, time.time() + JOB_LEASE_SECONDS, job_id),
+                )
+                self._db.commit()
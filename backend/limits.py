@@ -0,0 +1,60 @@
+# limits.py
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+
+from backend.metrics import ERRORS
+from backend.workers import _env_int
+
+########################################
+# 1. Configuration
+########################################
+# Largest request body accepted, in bytes (all files of a request together).
+# Also caps the total uncompressed size of an uploaded archive's documents.
+MAX_UPLOAD_BYTES = _env_int("MAX_UPLOAD_BYTES", 512 * 1024 * 1024)
+
+# Largest single document, in bytes (an upload to /validate, or an archive
+# member once uncompressed). Depth and element limits are in parsing.py.
+MAX_DOCUMENT_BYTES = _env_int("MAX_DOCUMENT_BYTES", 64 * 1024 * 1024)
+
+########################################
+# 2. Request Body Limit
+########################################
+class BodySizeLimit:
+    """
+    ASGI middleware rejecting request bodies larger than `max_bytes` with
+    413, before they are spooled to disk or parsed: at once when the
+    Content-Length header is too large, otherwise as soon as the bytes
+    received so far pass the limit.
+    """
+
+    def __init__(self, app, max_bytes: int = MAX_UPLOAD_BYTES):
+        self.app = app
+        self.max_bytes = max_bytes
+
+    def _too_large(self):
+        ERRORS.inc(type="upload_too_large")
+        return f"Request body is larger than {self.max_bytes} bytes."
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or self.max_bytes <= 0:
+            return await self.app(scope, receive, send)
+
+        for name, value in scope["headers"]:
+            if name == b"content-length" and value.isdigit() and int(value) > self.max_bytes:
+                response = JSONResponse({"detail": self._too_large()}, status_code=413)
+                return await response(scope, receive, send)
+
+        received = 0
+
+        async def limited_receive():
+            nonlocal received
+            message = await receive()
+            if message["type"] == "http.request":
+                received += len(message.get("body", b""))
+                if received > self.max_bytes:
+                    # Raised while FastAPI reads the body, so it becomes the response
+                    raise HTTPException(status_code=413, detail=self._too_large())
+            return message
+
+        await self.app(scope, limited_receive, send)
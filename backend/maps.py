@@ -0,0 +1,360 @@
+# maps.py
+
+import os
+import posixpath
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote, urlsplit
+
+from lxml import etree
+
+from backend.cache import content_key
+from backend.parsing import invalid_document, parse_dita
+from backend.rules import TOPIC_TYPES, perform_rule_based_checks
+from backend.workers import _env_int
+
+########################################
+# 1. Configuration
+########################################
+MAP_SUFFIXES = (".ditamap",)
+TOPIC_SUFFIXES = (".dita", ".xml")
+
+# Topic analyses kept in memory across requests, keyed by content hash
+MAP_TOPIC_CACHE_SIZE = _env_int("MAP_TOPIC_CACHE_SIZE", 4096)
+
+# Threads parsing and checking the topics of a map concurrently
+MAP_WORKERS = _env_int("MAP_WORKERS", os.cpu_count() or 1)
+
+# Elements whose id is a topic id (targets of "file.dita#topicid" references)
+TOPIC_ELEMENTS = tuple(TOPIC_TYPES) + ("topic",)
+
+########################################
+# 2. Document Sources
+########################################
+# Paths inside a source are normalized, "/"-separated and relative to its
+# root; references that climb out of the root are reported as broken.
+def normalize_path(path: str):
+    path = posixpath.normpath(path.replace("\\", "/").lstrip("/"))
+    if path == ".." or path.startswith("../"):
+        return None
+    return path
+
+class ArchiveSource:
+    """
+    Documents from an uploaded archive, as (member name, content) pairs.
+    """
+
+    def __init__(self, files: list):
+        self.files = {}
+        for name, content in files:
+            path = normalize_path(name)
+            if path is not None:
+                self.files[path] = content
+
+    def read(self, path: str):
+        return self.files.get(path)
+
+    def maps(self) -> list:
+        return sorted(path for path in self.files if path.lower().endswith(MAP_SUFFIXES))
+
+class DirectorySource:
+    """
+    Documents under a local root directory. Paths resolving outside the
+    root (through "..", absolute paths or symlinks) are never read.
+    """
+
+    def __init__(self, root: str):
+        self.root = os.path.realpath(root)
+
+    def read(self, path: str):
+        full_path = os.path.realpath(os.path.join(self.root, path))
+        if os.path.commonpath([self.root, full_path]) != self.root:
+            return None
+        try:
+            with open(full_path, "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+########################################
+# 3. Memoized Topic Analysis
+########################################
+class TopicMemo:
+    """
+    LRU of topic analyses keyed by `content_key` (content hash + model
+    version), shared by every map validation: a topic referenced from
+    many maps, or uploaded many times, is parsed and scored once.
+
+    An analysis is {"result", "topic_ids", "ids", "refs"}: the /validate
+    result for the topic, the ids of its topic elements and of all its
+    elements, and the local href/conref values it contains.
+    """
+
+    def __init__(self, max_entries: int = MAP_TOPIC_CACHE_SIZE):
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str):
+        with self._lock:
+            analysis = self._entries.get(key)
+            if analysis is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return analysis
+
+    def put(self, key: str, analysis: dict):
+        if self.max_entries <= 0:
+            return
+        with self._lock:
+            self._entries[key] = analysis
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+topic_memo = TopicMemo()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _topic_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=MAP_WORKERS, thread_name_prefix="map-topic")
+        return _executor
+
+def _is_local(href: str) -> bool:
+    return not urlsplit(href).scheme
+
+def _analyze_topic(content: bytes, scorer):
+    """
+    Parse one topic and run everything except scoring.
+    Returns (analysis without a score, text to score or None).
+    """
+    try:
+        root_element = parse_dita(content)
+    except Exception as e:
+        return {"result": invalid_document(e), "topic_ids": [], "ids": [], "refs": []}, None
+
+    refs = []
+    ids = []
+    topic_ids = []
+    for element in root_element.iter(tag=etree.Element):
+        element_id = element.get("id")
+        if element_id:
+            ids.append(element_id)
+            if element.tag in TOPIC_ELEMENTS:
+                topic_ids.append(element_id)
+        if element.get("scope") in ("external", "peer"):
+            continue
+        for attribute in ("href", "conref"):
+            value = element.get(attribute)
+            if value and _is_local(value):
+                refs.append(value)
+
+    analysis = {
+        "result": {"errors": perform_rule_based_checks(root_element)},
+        "topic_ids": topic_ids,
+        "ids": ids,
+        "refs": refs,
+    }
+    return analysis, scorer.extract(root_element)
+
+def analyze_topics(contents: dict, scorer, memo: TopicMemo = topic_memo) -> tuple:
+    """
+    Analyses for {path: content}. Every distinct content is parsed at most
+    once (and not at all if memoized), concurrently in the map worker
+    threads, and new topics are scored together with one `score_texts` call.
+    Returns ({path: analysis}, topics parsed, topics reused from the memo).
+    """
+    keys = {path: content_key(content, scorer.version) for path, content in contents.items()}
+    analyses = {}
+    pending = {}  # key -> content, for contents not in the memo
+    for path, key in keys.items():
+        if key in analyses or key in pending:
+            continue
+        analysis = memo.get(key)
+        if analysis is not None:
+            analyses[key] = analysis
+        else:
+            pending[key] = contents[path]
+
+    fresh = list(_topic_executor().map(lambda content: _analyze_topic(content, scorer), pending.values()))
+    scored = [(analysis, text) for analysis, text in fresh if text is not None]
+    probabilities = scorer.score_texts([text for _, text in scored])
+    for (analysis, _), probability in zip(scored, probabilities):
+        analysis["result"]["compliance_probability"] = probability
+        analysis["result"]["model_version"] = scorer.version
+    for key, (analysis, _) in zip(pending, fresh):
+        memo.put(key, analysis)
+        analyses[key] = analysis
+
+    return {path: analyses[key] for path, key in keys.items()}, len(pending), len(analyses) - len(pending)
+
+########################################
+# 4. Map Validation
+########################################
+def _split_href(base: str, href: str):
+    """
+    Resolve `href` relative to the document at `base`.
+    Returns (target path or None if it leaves the root, fragment).
+    """
+    target, _, fragment = href.partition("#")
+    if not target:
+        return base, fragment
+    return normalize_path(posixpath.join(posixpath.dirname(base), unquote(target))), fragment
+
+def _walk_map(source, path: str, stack: list, topicrefs: list, errors: list, walked: set):
+    """
+    Collect (map path, href, target, fragment) for every topic reference of
+    the map at `path`, following references to submaps.
+    """
+    content = source.read(path)
+    if content is None:
+        errors.append(f"Map {path} not found.")
+        return
+    try:
+        root_element = parse_dita(content)
+    except Exception as e:
+        errors.append(f"Invalid XML in map {path}: {str(e)}")
+        return
+    walked.add(path)
+
+    for element in root_element.iter(tag=etree.Element):
+        href = element.get("href")
+        if not href or element.get("scope") in ("external", "peer") or not _is_local(href):
+            continue
+        target, fragment = _split_href(path, href)
+        if target is None:
+            errors.append(f"Reference '{href}' in {path} points outside the document root.")
+        elif element.get("format") == "ditamap" or target.lower().endswith(MAP_SUFFIXES):
+            if target in stack:
+                errors.append(f"Map reference cycle: {' -> '.join(stack + [path, target])}.")
+            elif target not in walked:
+                _walk_map(source, target, stack + [path], topicrefs, errors, walked)
+        elif element.get("format") == "dita" or (element.get("format") is None and target.lower().endswith(TOPIC_SUFFIXES)):
+            topicrefs.append((path, href, target, fragment))
+
+def _check_fragment(href: str, referrer: str, target: str, fragment: str, analysis: dict):
+    """
+    Error message if "topicid" or "topicid/elementid" does not exist in the
+    target topic, else None.
+    """
+    if not fragment:
+        return None
+    topic_id, _, element_id = fragment.partition("/")
+    if topic_id not in analysis["topic_ids"]:
+        return f"Reference '{href}' in {referrer}: no topic with id '{topic_id}' in {target}."
+    if element_id and element_id not in analysis["ids"]:
+        return f"Reference '{href}' in {referrer}: no element with id '{element_id}' in {target}."
+    return None
+
+def validate_maps(source, scorer, map_paths: list = None, memo: TopicMemo = topic_memo) -> dict:
+    """
+    Validates DITA maps and every topic they reference.
+
+    1. Walks each map (and the submaps it references), resolving topicref
+       hrefs against `source`.
+    2. Reads every distinct topic once, across all maps, and analyzes it
+       with `analyze_topics` (memoized per content hash).
+    3. Runs cross-topic checks: missing targets, "#topicid/elementid"
+       fragments that do not exist, href/conref links between topics, and
+       topic ids used by more than one topic of a map.
+
+    Returns {"model_version", "topics_parsed", "topics_reused", "maps"},
+    with one {"map", "topics", "errors"} entry per map; "topics" holds the
+    /validate result of each referenced topic, in first-reference order.
+    """
+    if map_paths is None:
+        map_paths = source.maps()
+
+    walks = []
+    for map_path in map_paths:
+        topicrefs, errors = [], []
+        path = normalize_path(map_path)
+        if path is None:
+            errors.append(f"Map {map_path} is outside the document root.")
+        else:
+            _walk_map(source, path, [], topicrefs, errors, set())
+        walks.append((map_path, topicrefs, errors))
+
+    # Read each referenced topic once, plus the targets of links between topics
+    contents = {}
+    missing = set()
+
+    def load(path):
+        if path in contents or path in missing:
+            return
+        content = source.read(path)
+        if content is None:
+            missing.add(path)
+        else:
+            contents[path] = content
+
+    for _, topicrefs, _ in walks:
+        for _, _, target, _ in topicrefs:
+            load(target)
+    analyses, parsed, reused = analyze_topics(contents, scorer, memo)
+    linked = {}
+    for path, analysis in analyses.items():
+        for href in analysis["refs"]:
+            target, fragment = _split_href(path, href)
+            if target is not None and not target.lower().endswith(TOPIC_SUFFIXES):
+                continue  # images, maps and other formats are not checked
+            linked.setdefault(path, []).append((href, target, fragment))
+            if target is not None:
+                load(target)
+    extra = {path: content for path, content in contents.items() if path not in analyses}
+    if extra:
+        more, more_parsed, more_reused = analyze_topics(extra, scorer, memo)
+        analyses.update(more)
+        parsed += more_parsed
+        reused += more_reused
+
+    results = []
+    for map_path, topicrefs, errors in walks:
+        topics = []
+        topic_owner = {}  # topic id -> path of the first topic that uses it
+        checked = set()
+        for referrer, href, target, fragment in topicrefs:
+            if target in missing:
+                errors.append(f"Broken reference '{href}' in {referrer}: {target} not found.")
+                continue
+            analysis = analyses[target]
+            error = _check_fragment(href, referrer, target, fragment, analysis)
+            if error:
+                errors.append(error)
+            if target in checked:
+                continue
+            checked.add(target)
+            topics.append({"filename": target, **analysis["result"]})
+
+            for topic_id in dict.fromkeys(analysis["topic_ids"]):
+                owner = topic_owner.setdefault(topic_id, target)
+                if owner != target:
+                    errors.append(f"Duplicate topic id '{topic_id}' in {owner} and {target}.")
+
+            for link_href, link_target, link_fragment in linked.get(target, []):
+                if link_target is None:
+                    errors.append(f"Reference '{link_href}' in {target} points outside the document root.")
+                elif link_target in missing:
+                    errors.append(f"Broken reference '{link_href}' in {target}: {link_target} not found.")
+                else:
+                    error = _check_fragment(link_href, target, link_target, link_fragment, analyses[link_target])
+                    if error:
+                        errors.append(error)
+
+        results.append({"map": map_path, "topics": topics, "errors": errors})
+
+    return {
+        "model_version": scorer.version,
+        "topics_parsed": parsed,
+        "topics_reused": reused,
+        "maps": results,
+    }
@@ -0,0 +1,183 @@
+# metrics.py
+
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+########################################
+# 1. Metric Types
+########################################
+# Minimal Prometheus text-format (v0.0.4) metrics: counters, histograms and
+# callback gauges, all safe to update from the validation worker threads.
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+def _format_labels(names: tuple, values: tuple, extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+INF_LABEL = 'le="+Inf"'
+
+class Counter:
+    """
+    A monotonically increasing count, optionally split by labels.
+    """
+
+    def __init__(self, name: str, help: str, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def value(self, **labels) -> float:
+        key = tuple(labels.get(name, "") for name in self.labels)
+        return self._values.get(key, 0)
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labels, key)} {_format_value(value)}")
+        return lines
+
+class Histogram:
+    """
+    Observations counted into cumulative `buckets` (upper bounds), plus the
+    running sum and count, optionally split by labels.
+    """
+
+    def __init__(self, name: str, help: str, buckets: tuple, labels: tuple = ()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = tuple(sorted(buckets))
+        self._series = {}  # label values -> [bucket counts..., sum, count]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels.get(name, "") for name in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 2)
+            if index < len(self.buckets):
+                series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def count(self, **labels) -> int:
+        key = tuple(labels.get(name, "") for name in self.labels)
+        series = self._series.get(key)
+        return series[-1] if series else 0
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, hits in zip(self.buckets, series):
+                    cumulative += hits
+                    le = f'le="{_format_value(float(bound))}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, INF_LABEL)} {series[-1]}")
+                lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {_format_value(float(series[-2]))}")
+                lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {series[-1]}")
+        return lines
+
+class Gauge:
+    """
+    A value read from `func()` at scrape time (e.g. cache size, pool depth).
+    Use `metric_type="counter"` for totals kept elsewhere, such as the
+    result cache's hit/miss counters.
+    """
+
+    def __init__(self, name: str, help: str, func, metric_type: str = "gauge"):
+        self.name = name
+        self.help = help
+        self.func = func
+        self.metric_type = metric_type
+
+    def render(self) -> list:
+        return [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} {self.metric_type}",
+            f"{self.name} {_format_value(float(self.func()))}",
+        ]
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+########################################
+# 2. Validation Pipeline Metrics
+########################################
+registry = MetricsRegistry()
+
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+SIZE_BUCKETS = tuple(1024 * 4 ** i for i in range(10))  # 1 KiB .. 256 MiB
+
+REQUESTS = registry.register(Counter(
+    "dita_requests_total", "Validation requests by endpoint.", ("endpoint",)))
+ERRORS = registry.register(Counter(
+    "dita_errors_total", "Validation errors by type.", ("type",)))
+DOCUMENTS = registry.register(Counter(
+    "dita_documents_total", "Documents validated (batch files counted individually)."))
+UPLOAD_BYTES = registry.register(Histogram(
+    "dita_upload_bytes", "Size of uploaded files in bytes.", SIZE_BUCKETS, ("endpoint",)))
+REQUEST_SECONDS = registry.register(Histogram(
+    "dita_request_seconds", "End-to-end request latency in seconds.", LATENCY_BUCKETS, ("endpoint",)))
+STAGE_SECONDS = registry.register(Histogram(
+    "dita_stage_seconds", "Latency of each validation stage in seconds.", LATENCY_BUCKETS, ("stage",)))
+
+########################################
+# 3. Per-Request Stage Timing
+########################################
+class StageTimer:
+    """
+    Times the stages of one validation (read, parse, rules, extract,
+    vectorize, score, ...). Every stage is also recorded in STAGE_SECONDS;
+    `server_timing()` formats the totals as a Server-Timing header value.
+    """
+
+    def __init__(self):
+        self.timings = {}
+
+    @contextmanager
+    def stage(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.timings[name] = self.timings.get(name, 0.0) + elapsed
+            STAGE_SECONDS.observe(elapsed, stage=name)
+
+    def server_timing(self) -> str:
+        return ", ".join(f"{name};dur={seconds * 1000:.3f}" for name, seconds in self.timings.items())
@@ -1,23 +1,59 @@
 # model.py
 
+import hashlib
+import math
 import pickle
 import os
+import re
+from collections import Counter
+
+import numpy as np
+
+from backend.artifact import is_artifact, load_artifact
+from backend.parsing import extract_features, extract_text
+
+# Folder holding vectorizer.pkl / model.pkl (overridable for deployments)
+MODELS_DIR = os.environ.get("MODELS_DIR", "models")
+
+def _sigmoid(z: float) -> float:
+    # Numerically stable logistic function (same values as scipy's expit)
+    if z >= 0:
+        return 1.0 / (1.0 + math.exp(-z))
+    e = math.exp(z)
+    return e / (1.0 + e)
 
 class DITAModel:
-    def __init__(self):
+    """
+    The scikit-learn pipeline (pickled vectorizer + classifier).
+
+    Like LinearScorer it exposes `version`, `structural`, `extract`,
+    `features`, `score_features` and `score_texts`, so the backend can use
+    either one.
+    """
+
+    def __init__(self, models_dir: str = MODELS_DIR):
+        self.models_dir = models_dir
         self.vectorizer = None
         self.model = None
+        self.version = None
+        self.structural = False
         self.load_model()
 
     def load_model(self):
-        vectorizer_path = os.path.join("models", "vectorizer.pkl")
-        model_path = os.path.join("models", "model.pkl")
+        vectorizer_path = os.path.join(self.models_dir, "vectorizer.pkl")
+        model_path = os.path.join(self.models_dir, "model.pkl")
 
         if os.path.exists(vectorizer_path) and os.path.exists(model_path):
             with open(vectorizer_path, "rb") as f:
-                self.vectorizer = pickle.load(f)
+                vectorizer_bytes = f.read()
             with open(model_path, "rb") as f:
-                self.model = pickle.load(f)
+                model_bytes = f.read()
+            self.vectorizer = pickle.loads(vectorizer_bytes)
+            self.model = pickle.loads(model_bytes)
+            # train_model marks vectorizers fitted on text + structural tokens
+            self.structural = bool(getattr(self.vectorizer, "structural", False))
+            # Short content hash of the pickles
+            self.version = hashlib.sha256(vectorizer_bytes + model_bytes).hexdigest()[:12]
         else:
             raise FileNotFoundError("Model or vectorizer not found. Please train the model first.")
 
@@ -30,3 +66,191 @@ class DITAModel:
         # .predict_proba() returns [ [prob_class_0, prob_class_1] ]
         prob = self.model.predict_proba(features)[0][1]
         return prob
+
+    def extract(self, root_element) -> str:
+        """The text this model vectorizes for a parsed document."""
+        return extract_features(root_element) if self.structural else extract_text(root_element)
+
+    def features(self, text: str):
+        """Sparse count row for `text`; rows of pieces of a document add up."""
+        return self.vectorizer.transform([text])
+
+    def score_features(self, features) -> float:
+        return float(self.model.predict_proba(features)[0][1])
+
+    def score_texts(self, texts: list) -> list:
+        """Scores many texts with one sparse-matrix transform and one predict_proba call."""
+        if not texts:
+            return []
+        X_features = self.vectorizer.transform(texts)
+        return [float(p) for p in self.model.predict_proba(X_features)[:, 1]]
+
+class LinearScorer:
+    """
+    Request-time scorer for an exported linear model (see artifact.py) that
+    needs only `re` and NumPy, not scikit-learn or scipy.
+
+    1. Tokenizes with the vectorizer's own token pattern and lowercasing,
+       exactly like CountVectorizer's default analyzer.
+    2. Maps distinct tokens to columns with one vectorized binary search
+       over the sorted vocabulary blob (or murmurhash for HashingVectorizer
+       artifacts).
+    3. Returns the logistic of `intercept + coef . counts`.
+
+    Features are Counters of {column: count}; they add up across pieces of
+    a document, which the streaming validator relies on.
+    """
+
+    def __init__(self, artifact):
+        self.artifact = artifact
+        self.version = artifact.version
+        header = artifact.header
+        self._token_re = re.compile(header["token_pattern"])
+        self._lowercase = header["lowercase"]
+        self._binary = header["binary"]
+        self.structural = bool(header.get("structural", False))
+        self._coef = artifact.coef
+        self._intercept = float(header["intercept"])
+        self._vocabulary = artifact.vocabulary
+        self._offsets = artifact.offsets
+        self._max_token_bytes = header.get("max_token_bytes", 0)
+        self._n_features = header["n_features"]
+        self._hash = None
+        if artifact.kind == "hashing":
+            # Only hashing artifacts need sklearn's murmurhash at request time
+            from sklearn.utils import murmurhash3_32
+            self._hash = murmurhash3_32
+
+    @classmethod
+    def load(cls, path: str, mmap: bool = True):
+        return cls(load_artifact(path, mmap=mmap))
+
+    def extract(self, root_element) -> str:
+        """
+        The text this model vectorizes for a parsed document: plain text, or
+        text plus structural tokens if the model was trained with them.
+        """
+        return extract_features(root_element) if self.structural else extract_text(root_element)
+
+    def tokenize(self, text: str) -> list:
+        if self._lowercase:
+            text = text.lower()
+        return self._token_re.findall(text)
+
+    def _columns(self, tokens: list) -> np.ndarray:
+        """
+        Column index of each token, or -1 for out-of-vocabulary tokens.
+        """
+        if self._hash is not None:
+            return np.array(
+                [abs(self._hash(token.encode("utf-8"), seed=0)) % self._n_features for token in tokens],
+                dtype=np.int64,
+            )
+
+        size = len(self._offsets) - 1
+        if not size or not tokens:
+            return np.full(len(tokens), -1, dtype=np.int64)
+        encoded = [token.encode("utf-8") for token in tokens]
+        lengths = np.array([len(token) for token in encoded])
+        # Tokens longer than every vocabulary token cannot match; comparing
+        # one byte past the other tokens' length keeps prefixes apart
+        width = int(min(lengths.max(), self._max_token_bytes)) + 1
+        queries = np.array(encoded, dtype=f"S{width}")
+
+        # Lower bound of every query at once
+        low = np.zeros(len(tokens), dtype=np.int64)
+        high = np.full(len(tokens), size, dtype=np.int64)
+        while True:
+            active = low < high
+            if not active.any():
+                break
+            middle = (low + high) // 2
+            less = self._tokens_at(np.minimum(middle, size - 1), width) < queries
+            low = np.where(active & less, middle + 1, low)
+            high = np.where(active & ~less, middle, high)
+        clipped = np.minimum(low, size - 1)
+        found = (self._tokens_at(clipped, width) == queries) & (lengths <= self._max_token_bytes)
+        return np.where(found, clipped, -1)
+
+    def _tokens_at(self, rows: np.ndarray, width: int) -> np.ndarray:
+        """
+        Vocabulary tokens `rows` as a fixed-width bytes array, cut to `width` bytes.
+        """
+        starts = self._offsets[rows]
+        lengths = np.minimum(self._offsets[rows + 1] - starts, width)
+        positions = np.arange(width)
+        matrix = self._vocabulary[np.minimum(starts[:, None] + positions, len(self._vocabulary) - 1)]
+        matrix = np.where(positions < lengths[:, None], matrix, 0).astype(np.uint8)
+        return matrix.view(f"S{width}").ravel()
+
+    def features(self, text: str) -> Counter:
+        """
+        Counter of {column: count} for the in-vocabulary tokens of `text`.
+        """
+        counts = Counter(self.tokenize(text))
+        if not counts:
+            return Counter()
+        tokens = list(counts)
+        features = Counter()
+        for column, token in zip(self._columns(tokens).tolist(), tokens):
+            if column >= 0:
+                features[column] += counts[token]
+        return features
+
+    def decision_function(self, features: Counter) -> float:
+        if not features:
+            return self._intercept
+        columns = np.fromiter(features.keys(), dtype=np.int64, count=len(features))
+        counts = np.fromiter(features.values(), dtype=np.float64, count=len(features))
+        if self._binary:
+            counts = np.minimum(counts, 1.0)
+        return self._intercept + float(np.dot(self._coef[columns], counts))
+
+    def score_features(self, features: Counter) -> float:
+        return _sigmoid(self.decision_function(features))
+
+    def score_texts(self, texts: list) -> list:
+        """
+        Scores many texts in one pass: the distinct tokens of the whole batch
+        are mapped to columns with a single vocabulary lookup, and every
+        document's `coef . counts` is summed with one np.bincount.
+        Gives the same probabilities as `score_features` per text.
+        """
+        if not texts:
+            return []
+        token_index = {}  # token -> position in the batch's vocabulary lookup
+        documents, positions, counts = [], [], []
+        for document, text in enumerate(texts):
+            for token, count in Counter(self.tokenize(text)).items():
+                documents.append(document)
+                positions.append(token_index.setdefault(token, len(token_index)))
+                counts.append(count)
+
+        logits = np.full(len(texts), self._intercept)
+        if token_index:
+            columns = self._columns(list(token_index))[positions]
+            documents = np.asarray(documents, dtype=np.int64)
+            counts = np.asarray(counts, dtype=np.float64)
+            known = columns >= 0
+            documents, columns, counts = documents[known], columns[known], counts[known]
+            if self._binary:
+                # Count each (document, column) once: hashed tokens may share a column
+                pairs = np.unique(documents * len(self._coef) + columns)
+                documents, columns = pairs // len(self._coef), pairs % len(self._coef)
+                counts = np.ones(len(pairs))
+            logits += np.bincount(documents, weights=self._coef[columns] * counts, minlength=len(texts))
+
+        # Same stable logistic as `_sigmoid`
+        e = np.exp(-np.abs(logits))
+        probabilities = np.where(logits >= 0, 1.0 / (1.0 + e), e / (1.0 + e))
+        return probabilities.tolist()
+
+def load_scorer(models_dir: str = MODELS_DIR):
+    """
+    The scorer to serve with: the NumPy LinearScorer when an exported
+    artifact exists in `models_dir/artifact`, else the pickled sklearn model.
+    """
+    artifact_dir = os.path.join(models_dir, "artifact")
+    if is_artifact(artifact_dir):
+        return LinearScorer.load(artifact_dir)
+    return DITAModel(models_dir)
@@ -0,0 +1,230 @@
+# model_search.py
+
+import itertools
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from sklearn.feature_extraction.text import CountVectorizer
+from sklearn.linear_model import LogisticRegression
+from sklearn.metrics import accuracy_score, brier_score_loss, roc_auc_score
+from sklearn.model_selection import StratifiedKFold
+
+########################################
+# 1. Configuration
+########################################
+# Candidate settings. Vectorizer settings are limited to what the serving
+# artifact can reproduce (word unigrams, see artifact.py); min_df and
+# binary also shrink or simplify the model.
+VECTORIZER_GRID = {"min_df": [1, 2, 5], "binary": [False, True]}
+CLASSIFIER_GRID = {"C": [0.1, 1.0, 10.0]}
+
+# Candidates whose mean ROC-AUC is within this of the best are considered
+# equally accurate; the smallest (then fastest) of them is selected
+SELECTION_TOLERANCE = 0.005
+
+# Bins of the expected calibration error
+CALIBRATION_BINS = 10
+
+def expand_grid(grid: dict) -> list:
+    """
+    Every combination of a {parameter: [values]} grid, as a list of dicts.
+    """
+    names = sorted(grid)
+    return [dict(zip(names, values)) for values in itertools.product(*(grid[name] for name in names))]
+
+def make_vectorizer(params: dict) -> CountVectorizer:
+    return CountVectorizer(stop_words=None, **params)
+
+def make_classifier(params: dict) -> LogisticRegression:
+    return LogisticRegression(max_iter=1000, **params)
+
+########################################
+# 2. Metrics
+########################################
+def calibration_error(y_true, probabilities, weights=None, bins: int = CALIBRATION_BINS) -> float:
+    """
+    Expected calibration error: the gap between predicted probability and
+    observed frequency of label 1, averaged over equal-width probability
+    bins weighted by how many documents (or how much sample weight) fall
+    in each.
+    """
+    y_true = np.asarray(y_true, dtype=float)
+    probabilities = np.asarray(probabilities, dtype=float)
+    weights = np.ones_like(y_true) if weights is None else np.asarray(weights, dtype=float)
+    indices = np.minimum((probabilities * bins).astype(int), bins - 1)
+    error = 0.0
+    for b in range(bins):
+        in_bin = indices == b
+        if in_bin.any():
+            w = weights[in_bin]
+            gap = np.average(probabilities[in_bin], weights=w) - np.average(y_true[in_bin], weights=w)
+            error += w.sum() * abs(gap)
+    return float(error / weights.sum())
+
+def score_predictions(y_true, probabilities, weights=None) -> dict:
+    return {
+        "accuracy": float(accuracy_score(y_true, probabilities >= 0.5, sample_weight=weights)),
+        "roc_auc": float(roc_auc_score(y_true, probabilities, sample_weight=weights)),
+        "brier": float(brier_score_loss(y_true, probabilities, sample_weight=weights)),
+        "calibration_error": calibration_error(y_true, probabilities, weights),
+    }
+
+########################################
+# 3. Cached Fold Matrices
+########################################
+# Each fold is vectorized once, with every term kept and raw counts. The
+# matrices of all vectorizer candidates are derived from it: min_df drops
+# the columns of rare training terms and binary clips counts to 1, which
+# gives exactly what a CountVectorizer with those settings would produce.
+_folds = None
+
+def _vectorize_fold(texts: list, labels: list, weights, train_index, test_index) -> dict:
+    vectorizer = make_vectorizer({})
+    started = time.perf_counter()
+    X_train = vectorizer.fit_transform([texts[i] for i in train_index])
+    X_test = vectorizer.transform([texts[i] for i in test_index])
+    labels = np.asarray(labels)
+    return {
+        "X_train": X_train.tocsc(),
+        "X_test": X_test.tocsc(),
+        "y_train": labels[train_index],
+        "y_test": labels[test_index],
+        "w_train": None if weights is None else np.asarray(weights)[train_index],
+        "w_test": None if weights is None else np.asarray(weights)[test_index],
+        # Per-document cost of turning text into a feature row
+        "transform_seconds": (time.perf_counter() - started) / (len(train_index) + len(test_index)),
+        "document_frequency": np.bincount(X_train.indices, minlength=X_train.shape[1]),
+    }
+
+def _fold_matrices(fold: dict, vectorizer_params: dict):
+    columns = np.flatnonzero(fold["document_frequency"] >= vectorizer_params.get("min_df", 1))
+    X_train = fold["X_train"][:, columns].tocsr()
+    X_test = fold["X_test"][:, columns].tocsr()
+    if vectorizer_params.get("binary"):
+        X_train, X_test = X_train.sign(), X_test.sign()
+    return X_train, X_test
+
+def _init_search_worker(folds: list):
+    global _folds
+    _folds = folds
+
+def _evaluate(task: tuple) -> dict:
+    """
+    Worker task: fit one candidate on one cached fold and score it.
+    """
+    fold_index, vectorizer_params, classifier_params = task
+    fold = _folds[fold_index]
+    X_train, X_test = _fold_matrices(fold, vectorizer_params)
+
+    model = make_classifier(classifier_params)
+    started = time.perf_counter()
+    model.fit(X_train, fold["y_train"], sample_weight=fold["w_train"])
+    fit_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    probabilities = model.predict_proba(X_test)[:, 1]
+    predict_seconds = (time.perf_counter() - started) / X_test.shape[0]
+
+    metrics = score_predictions(fold["y_test"], probabilities, fold["w_test"])
+    metrics["fit_seconds"] = fit_seconds
+    metrics["features"] = X_train.shape[1]
+    metrics["latency_ms"] = (fold["transform_seconds"] + predict_seconds) * 1000
+    return metrics
+
+########################################
+# 4. Cross-Validated Grid Search
+########################################
+def select_candidate(candidates: list, tolerance: float = SELECTION_TOLERANCE) -> dict:
+    """
+    The candidate to ship: among those whose mean ROC-AUC is within
+    `tolerance` of the best, the one with the fewest features, then the
+    highest ROC-AUC, then the lowest scoring latency (timings are noisy,
+    so they only break exact ties).
+    """
+    best_auc = max(candidate["mean"]["roc_auc"] for candidate in candidates)
+    contenders = [c for c in candidates if c["mean"]["roc_auc"] >= best_auc - tolerance]
+    return min(contenders, key=lambda c: (c["mean"]["features"], -c["mean"]["roc_auc"], c["mean"]["latency_ms"]))
+
+def grid_search(texts: list, labels: list, folds: int = 5, workers: int = None, seed: int = 0,
+                vectorizer_grid: dict = VECTORIZER_GRID, classifier_grid: dict = CLASSIFIER_GRID,
+                tolerance: float = SELECTION_TOLERANCE, weights: list = None) -> dict:
+    """
+    Stratified k-fold cross-validation of every vectorizer x classifier
+    setting in the grids. Optional sample `weights` apply to both fitting
+    and scoring.
+
+    Folds are vectorized once each (in parallel), then every (fold,
+    candidate) fit runs in a process pool sharing the cached fold matrices.
+    Returns {"folds", "candidates", "selected"}; each candidate has its
+    "vectorizer" and "classifier" parameters and the "mean" and "std" over
+    folds of accuracy, ROC-AUC, Brier score, calibration error, fit time,
+    feature count and per-document scoring latency.
+    """
+    folds = min(folds, int(np.bincount(labels, minlength=2).min()))
+    if folds < 2:
+        raise ValueError("Cross-validation needs at least two documents of each label.")
+    workers = workers or os.cpu_count() or 1
+    splits = list(StratifiedKFold(n_splits=folds, shuffle=True, random_state=seed).split(texts, labels))
+    vectorizer_candidates = expand_grid(vectorizer_grid)
+    classifier_candidates = expand_grid(classifier_grid)
+    settings = list(itertools.product(vectorizer_candidates, classifier_candidates))
+    print(f"Cross-validating {len(settings)} candidates over {folds} folds with {workers} workers")
+
+    tasks = [(fold_index, vectorizer_params, classifier_params)
+             for vectorizer_params, classifier_params in settings for fold_index in range(folds)]
+    if workers == 1:
+        fold_data = [_vectorize_fold(texts, labels, weights, train_index, test_index)
+                     for train_index, test_index in splits]
+        _init_search_worker(fold_data)
+        results = [_evaluate(task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, folds)) as pool:
+            fold_data = list(pool.map(_vectorize_fold, itertools.repeat(texts), itertools.repeat(labels),
+                                      itertools.repeat(weights), *zip(*splits)))
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_search_worker,
+                                 initargs=(fold_data,)) as pool:
+            results = list(pool.map(_evaluate, tasks))
+
+    candidates = []
+    for index, (vectorizer_params, classifier_params) in enumerate(settings):
+        fold_results = results[index * folds:(index + 1) * folds]
+        names = fold_results[0].keys()
+        candidates.append({
+            "vectorizer": vectorizer_params,
+            "classifier": classifier_params,
+            "mean": {name: float(np.mean([r[name] for r in fold_results])) for name in names},
+            "std": {name: float(np.std([r[name] for r in fold_results])) for name in names},
+        })
+
+    return {"folds": folds, "candidates": candidates, "selected": select_candidate(candidates, tolerance)}
+
+########################################
+# 5. Metrics Report
+########################################
+def measure_serving(models_dir: str, texts: list, sample_size: int = 1000) -> dict:
+    """
+    Size on disk and single-document scoring latency of the model saved in
+    `models_dir`, measured through the same scorer the server loads.
+    """
+    from backend.model import load_scorer
+
+    def size(path):
+        if os.path.isdir(path):
+            return sum(os.path.getsize(os.path.join(path, name)) for name in os.listdir(path))
+        return os.path.getsize(path) if os.path.exists(path) else 0
+
+    scorer = load_scorer(models_dir)
+    timings = []
+    for text in texts[:sample_size]:
+        started = time.perf_counter()
+        scorer.score_texts([text])
+        timings.append((time.perf_counter() - started) * 1000)
+    return {
+        "model_version": scorer.version,
+        "artifact_bytes": size(os.path.join(models_dir, "artifact")),
+        "pickle_bytes": size(os.path.join(models_dir, "model.pkl")) + size(os.path.join(models_dir, "vectorizer.pkl")),
+        "latency_ms_mean": float(np.mean(timings)) if timings else None,
+        "latency_ms_p95": float(np.percentile(timings, 95)) if timings else None,
+    }
@@ -0,0 +1,281 @@
+# parsing.py
+
+import os
+import re
+import threading
+
+from lxml import etree
+
+from backend.metrics import ERRORS
+from backend.workers import _env_int
+
+########################################
+# 1. Parsing
+########################################
+# Load the DTDs declared in DOCTYPEs (1) or ignore them (0, the default).
+# Loading applies DTD attribute defaults (e.g. DITA @class), which changes
+# structural features, so models must be trained with the same setting.
+DITA_LOAD_DTD = bool(_env_int("DITA_LOAD_DTD", 0))
+
+# Local directory holding the OASIS DITA DTDs (.dtd/.mod/.ent files, in any
+# layout). DTDs are only ever read from here, never from the network.
+DITA_DTD_DIR = os.environ.get("DITA_DTD_DIR")
+
+# Lift libxml2's limits on tree depth and text node size (1) for very
+# large documents. libxml2 then no longer limits entity amplification, so
+# entities are left unexpanded in this mode.
+XML_HUGE_TREE = bool(_env_int("XML_HUGE_TREE", 0))
+
+# Deepest element nesting and most elements accepted in one document.
+# libxml2 itself stops at a depth of 256 unless XML_HUGE_TREE is set.
+MAX_XML_DEPTH = _env_int("MAX_XML_DEPTH", 256)
+MAX_XML_ELEMENTS = _env_int("MAX_XML_ELEMENTS", 1000000)
+
+class DocumentLimitError(ValueError):
+    """
+    Raised when a document or an upload exceeds a configured size limit.
+    """
+
+class DTDCatalog(etree.Resolver):
+    """
+    Resolves DOCTYPE system ids (e.g. "concept.dtd" or an OASIS URL) and the
+    modules they include to files of the same name under `dtd_dir`. The
+    directory is indexed on first use and each file is read once, then
+    served from memory to every parser.
+    """
+
+    def __init__(self, dtd_dir: str):
+        super().__init__()
+        self.dtd_dir = dtd_dir
+        self._index = None
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _load(self, name: str):
+        with self._lock:
+            if self._index is None:
+                self._index = {}
+                for dirpath, _, filenames in os.walk(self.dtd_dir):
+                    for filename in filenames:
+                        self._index.setdefault(filename, os.path.join(dirpath, filename))
+            path = self._index.get(name)
+            if path is not None and path not in self._cache:
+                with open(path, "rb") as f:
+                    self._cache[path] = f.read()
+            return path, self._cache.get(path)
+
+    def resolve(self, system_url, public_id, context):
+        if not system_url:
+            return None
+        path, data = self._load(system_url.replace("\\", "/").rpartition("/")[2])
+        if data is None:
+            return None
+        return self.resolve_string(data, context, base_url=path)
+
+dtd_catalog = DTDCatalog(DITA_DTD_DIR) if DITA_DTD_DIR else None
+
+def parser_options() -> dict:
+    """
+    Keyword arguments for every lxml parser reading DITA (tree and pull
+    parsers alike, so all validation paths see the same document):
+
+    - ignorable whitespace between elements is dropped (it carries no tokens)
+    - nothing is fetched from the network
+    - only entities declared inside the document are expanded, unless DTDs
+      are loaded, in which case the entities they declare are too; none are
+      expanded with XML_HUGE_TREE
+    """
+    load_dtd = DITA_LOAD_DTD and dtd_catalog is not None
+    if XML_HUGE_TREE:
+        resolve_entities = False
+    else:
+        resolve_entities = True if load_dtd else "internal"
+    return {
+        "remove_blank_text": True,
+        "no_network": True,
+        "load_dtd": load_dtd,
+        "resolve_entities": resolve_entities,
+        "huge_tree": XML_HUGE_TREE,
+    }
+
+def new_parser(parser_class=etree.XMLParser, **kwargs):
+    """
+    A parser configured with `parser_options` (and the DTD catalog, if any).
+    Extra keyword arguments are passed on, e.g. `events` for XMLPullParser.
+    """
+    parser = parser_class(**parser_options(), **kwargs)
+    if dtd_catalog is not None:
+        parser.resolvers.add(dtd_catalog)
+    return parser
+
+# lxml parsers are not thread-safe, but are cheap to reuse: each thread
+# keeps its own
+_local = threading.local()
+
+# libxml2's own depth limit, which applies unless XML_HUGE_TREE is set
+_LIBXML2_MAX_DEPTH = 256
+
+def _needs_guard(content: bytes) -> bool:
+    """
+    Whether a document could exceed MAX_XML_DEPTH or MAX_XML_ELEMENTS.
+    Every element needs a "<" in the bytes, so counting them bounds both,
+    unless entities can expand into more markup or the document is not in
+    an ASCII-compatible encoding.
+    """
+    if content[:2] in (b"\xff\xfe", b"\xfe\xff", b"<\x00", b"\x00<") or b"<!ENTITY" in content:
+        return True
+    markup = content.count(b"<")
+    if markup > MAX_XML_ELEMENTS:
+        return True
+    return markup > MAX_XML_DEPTH and (XML_HUGE_TREE or MAX_XML_DEPTH < _LIBXML2_MAX_DEPTH)
+
+def check_limits(depth: int, elements: int):
+    """
+    Raise DocumentLimitError once an element at `depth` or the `elements`th
+    element goes past MAX_XML_DEPTH / MAX_XML_ELEMENTS.
+    """
+    if depth > MAX_XML_DEPTH:
+        raise DocumentLimitError(f"Document is nested deeper than {MAX_XML_DEPTH} elements.")
+    if elements > MAX_XML_ELEMENTS:
+        raise DocumentLimitError(f"Document has more than {MAX_XML_ELEMENTS} elements.")
+
+def _parse_guarded(content: bytes, chunk_size: int = 64 * 1024):
+    # Pull parsing is slower, but stops as soon as a limit is crossed
+    # instead of building the whole tree first
+    parser = new_parser(etree.XMLPullParser, events=("start", "end"))
+    depth = elements = 0
+    for offset in range(0, len(content), chunk_size):
+        parser.feed(content[offset:offset + chunk_size])
+        for event, _ in parser.read_events():
+            if event == "start":
+                depth += 1
+                elements += 1
+                check_limits(depth, elements)
+            else:
+                depth -= 1
+    return parser.close()
+
+def parse_dita(content: bytes):
+    """
+    Parse raw DITA bytes into an lxml root element (an _Element).
+    The bytes are handed to lxml untouched, so the encoding declared in the
+    XML prolog is honoured (UTF-16, ISO-8859-1, etc. all work).
+    Raises etree.XMLSyntaxError if the document is not well-formed, and
+    DocumentLimitError if it is deeper or larger than MAX_XML_DEPTH /
+    MAX_XML_ELEMENTS; documents that might be are parsed incrementally and
+    rejected as soon as they cross a limit.
+    """
+    if _needs_guard(content):
+        return _parse_guarded(content)
+    parser = getattr(_local, "parser", None)
+    if parser is None:
+        parser = _local.parser = new_parser()
+    return etree.fromstring(content, parser)
+
+def invalid_document(e: Exception) -> dict:
+    """
+    The result for a document that could not be parsed: the parser's
+    message plus, for syntax errors, the line and column where it stopped.
+    Shared by the API, the CLI and map validation so they report alike.
+    """
+    if isinstance(e, DocumentLimitError):
+        ERRORS.inc(type="limit_exceeded")
+        return {"error": f"Document too large: {str(e)}"}
+    ERRORS.inc(type="invalid_xml")
+    result = {"error": f"Invalid XML: {str(e)}"}
+    position = getattr(e, "position", None)
+    if position:
+        result["line"], result["column"] = position
+    return result
+
+########################################
+# 2. Text Extraction
+########################################
+_TEXT_NODES = etree.XPath("//text()")
+
+def extract_text(root_element) -> str:
+    """
+    Extract all text content from an already parsed DITA tree.
+    This is the single tokenization source shared by training and serving,
+    so both feed CountVectorizer exactly the same natural language tokens.
+    """
+    # Collect text from all nodes (e.g., <title>, <shortdesc>, <p>, etc.)
+    text_nodes = _TEXT_NODES(root_element)
+    # Join them with spaces to form one coherent text
+    return " ".join(text_nodes)
+
+def extract_text_from_xml(xml) -> str:
+    """
+    Parse an XML document (str or bytes) and extract all text content.
+    Returns an empty string if the document cannot be parsed.
+    """
+    if isinstance(xml, str):
+        xml = xml.encode("utf-8")
+    try:
+        return extract_text(parse_dita(xml))
+    except Exception:
+        # If parsing fails (invalid XML syntax, etc.), return an empty string to avoid crashing
+        return ""
+
+########################################
+# 3. Structural Features
+########################################
+# Markup is turned into pseudo-words appended to the document text, so the
+# vectorizers, exported artifacts and scorers count structure exactly like
+# ordinary tokens and both end up in one sparse row. Every pseudo-word is a
+# single \w+ token with an "x<kind>_" prefix, e.g. xpath_concept_title.
+_NON_WORD = re.compile(r"\W+")
+
+def _local_name(tag: str) -> str:
+    return _NON_WORD.sub("_", tag.rpartition("}")[2])
+
+def structure_tokens(element) -> list:
+    """
+    Structural pseudo-words for one element:
+
+    - tag-path n-grams: xtag_<tag>, xpath_<parent>_<tag> and
+      xpath_<grandparent>_<parent>_<tag>, or xroot_<tag> for the root
+    - attribute presence: xattr_<tag>_<attribute>
+    - element order: xorder_<parent>_<previous sibling>_<tag>, where the
+      previous sibling is "begin" for a first child
+
+    Only the element's attributes, ancestors and previous siblings are read,
+    so the result is the same on a complete tree and at the "start" event
+    of a streaming parse.
+    """
+    tag = _local_name(element.tag)
+    tokens = [f"xtag_{tag}"]
+    parent = element.getparent()
+    if parent is None:
+        tokens.append(f"xroot_{tag}")
+    else:
+        parent_tag = _local_name(parent.tag)
+        tokens.append(f"xpath_{parent_tag}_{tag}")
+        grandparent = parent.getparent()
+        if grandparent is not None:
+            tokens.append(f"xpath_{_local_name(grandparent.tag)}_{parent_tag}_{tag}")
+        previous = element.getprevious()
+        while previous is not None and not isinstance(previous.tag, str):
+            previous = previous.getprevious()  # skip comments and processing instructions
+        previous_tag = _local_name(previous.tag) if previous is not None else "begin"
+        tokens.append(f"xorder_{parent_tag}_{previous_tag}_{tag}")
+    for name in element.attrib:
+        tokens.append(f"xattr_{tag}_{_local_name(name)}")
+    return tokens
+
+def extract_features(root_element) -> str:
+    """
+    Extract the text content and the structural pseudo-words of a parsed
+    DITA tree in a single walk. Vectorized, the result counts the same words
+    as `extract_text` plus every element's `structure_tokens`.
+    """
+    texts = []
+    tokens = []
+    for node in root_element.iter():
+        if isinstance(node.tag, str):
+            if node.text:
+                texts.append(node.text)
+            tokens.extend(structure_tokens(node))
+        if node.tail and node is not root_element:
+            texts.append(node.tail)
+    return " ".join(texts + tokens)
@@ -0,0 +1,168 @@
+# registry.py
+
+import os
+import shutil
+import threading
+
+from backend.model import load_scorer
+
+########################################
+# 1. Versioned Model Registry
+########################################
+# Registry layout:
+#
+#   <root>/versions/<version>/   a complete models folder (vectorizer.pkl,
+#                                model.pkl and/or artifact/), never modified
+#                                once published
+#   <root>/CURRENT               name of the version to serve, replaced
+#                                atomically with os.replace
+CURRENT_FILE = "CURRENT"
+VERSIONS_DIR = "versions"
+
+class ModelRegistry:
+    """
+    Versioned model directories with an atomic "current" pointer.
+    A version is named after the scorer's content hash, so publishing the
+    same model twice is a no-op.
+    """
+
+    def __init__(self, root: str):
+        self.root = root
+
+    def version_dir(self, version: str) -> str:
+        return os.path.join(self.root, VERSIONS_DIR, version)
+
+    def versions(self) -> list:
+        versions_root = os.path.join(self.root, VERSIONS_DIR)
+        if not os.path.isdir(versions_root):
+            return []
+        return sorted(
+            name for name in os.listdir(versions_root)
+            if not name.startswith(".") and os.path.isdir(os.path.join(versions_root, name))
+        )
+
+    def current_version(self):
+        """
+        The version CURRENT points at, or None for an empty registry.
+        """
+        try:
+            with open(os.path.join(self.root, CURRENT_FILE), encoding="utf-8") as f:
+                return f.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def publish(self, models_dir: str, activate: bool = True) -> str:
+        """
+        Copy a trained models folder (as written by train_model) into the
+        registry and, by default, make it the current version.
+        Returns the version name.
+        """
+        version = load_scorer(models_dir).version
+        target = self.version_dir(version)
+        if not os.path.isdir(target):
+            # Copy under a temporary name, then rename: readers never see a
+            # half-copied version directory
+            staging = os.path.join(self.root, VERSIONS_DIR, f".{version}.{os.getpid()}.tmp")
+            shutil.copytree(
+                models_dir, staging,
+                ignore=shutil.ignore_patterns("registry", "checkpoint.pkl", "*.tmp"),
+            )
+            os.replace(staging, target)
+        if activate:
+            self.activate(version)
+        return version
+
+    def activate(self, version: str):
+        """
+        Atomically point CURRENT at an already published version.
+        """
+        if not os.path.isdir(self.version_dir(version)):
+            raise ValueError(f"Unknown model version {version!r}.")
+        os.makedirs(self.root, exist_ok=True)
+        pointer = os.path.join(self.root, CURRENT_FILE)
+        with open(pointer + ".tmp", "w", encoding="utf-8") as f:
+            f.write(version + "\n")
+        os.replace(pointer + ".tmp", pointer)
+
+    def load(self, version: str = None):
+        """
+        Load the scorer for `version` (default: the current version).
+        """
+        version = version or self.current_version()
+        if version is None:
+            raise FileNotFoundError(f"No current model version in registry {self.root}.")
+        return load_scorer(self.version_dir(version))
+
+########################################
+# 2. Hot-Swappable Scorer
+########################################
+class LiveScorer:
+    """
+    Holds the scorer currently being served and swaps it without a restart.
+
+    `reload()` checks the registry's CURRENT pointer and, if it moved, loads
+    the new version first and only then replaces `current` with a single
+    attribute assignment. Requests read `current` once and keep that scorer
+    for their whole validation, so in-flight requests finish on the model
+    they started with.
+
+    Without a registry (no CURRENT pointer yet), the scorer in `models_dir`
+    is served and reloads are no-ops until a version is published.
+    """
+
+    def __init__(self, registry: ModelRegistry, models_dir: str):
+        self.registry = registry
+        self.models_dir = models_dir
+        self._lock = threading.Lock()  # serializes reloads, not reads
+        self._watcher = None
+        self._stop = threading.Event()
+        version = registry.current_version()
+        self.current = registry.load(version) if version else load_scorer(models_dir)
+
+    @property
+    def version(self) -> str:
+        return self.current.version
+
+    def reload(self) -> bool:
+        """
+        Load and swap in the registry's current version if it changed.
+        Returns True if a new scorer was swapped in.
+        """
+        with self._lock:
+            version = self.registry.current_version()
+            if version is None or version == self.current.version:
+                return False
+            scorer = self.registry.load(version)
+            self.current = scorer
+            print(f"Model version {scorer.version} is now serving.")
+            return True
+
+    def start_watching(self, interval: float):
+        """
+        Poll the registry every `interval` seconds in a daemon thread.
+        """
+        if interval <= 0 or self._watcher is not None:
+            return
+
+        def watch():
+            while not self._stop.wait(interval):
+                try:
+                    self.reload()
+                except Exception as e:
+                    # Keep serving the current model if the new one is broken
+                    print(f"Model reload failed: {e}")
+
+        self._watcher = threading.Thread(target=watch, name="model-reload", daemon=True)
+        self._watcher.start()
+
+    def stop_watching(self):
+        """
+        Stop the polling thread and wait for it, so `start_watching` can
+        start a new one.
+        """
+        if self._watcher is None:
+            return
+        self._stop.set()
+        self._watcher.join()
+        self._watcher = None
+        self._stop.clear()
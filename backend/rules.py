@@ -0,0 +1,193 @@
+# rules.py
+
+from collections import defaultdict
+
+from lxml import etree
+
+########################################
+# 1. Rule Engine
+########################################
+# Version of the rule set, part of every result cache key (see cache.py):
+# bump it whenever a rule is added, removed or changes its messages, so
+# results checked by the old rules are not served again
+RULES_VERSION = "1"
+
+# Topic types accepted as the document root
+TOPIC_TYPES = ["concept", "task", "reference"]
+
+class RuleContext:
+    """
+    Per-document state shared by all rules during one run.
+    Rules may keep their own bookkeeping in `state` (e.g. IDs seen so far).
+    """
+
+    def __init__(self):
+        self.errors = []
+        self.state = {}
+        self._started = False
+
+class RuleEngine:
+    """
+    Dispatches DITA rules from a single walk over the document.
+
+    Each rule registers the element tags it cares about and is called with
+    `(element, context)` once that element has been fully read (its "end"
+    event), so it can inspect the element's attributes and direct children.
+    Rules registered with `root=True` run once, on the root's "start" event,
+    which keeps root-level errors first in the output. The tag "*" matches
+    every element; such rules should only look at the element itself (tag,
+    attributes, text), not at its children.
+
+    A rule returns an iterable of error messages (or None).
+
+    Most rules are local: their result depends only on the element's
+    subtree, so `end_element` can replay a result cached for an unchanged
+    subtree (see sessions.py). Rules registered with `document=True` keep
+    document-wide bookkeeping in `context.state` and always run.
+
+    Because rules only consume (event, element) pairs, the same engine runs
+    over an in-memory tree (`check`) or events coming from an incremental
+    parser (`begin` / `feed`), and adding rules never adds tree traversals.
+    """
+
+    def __init__(self):
+        self._root_rules = []
+        self._rules = defaultdict(list)
+        self._document_rules = set()
+        self._dispatch = {}  # tag -> ((rule, is a document rule), ...)
+
+    def rule(self, *tags, root: bool = False, document: bool = False):
+        """
+        Decorator registering a rule function for `tags` (or for the root).
+        `document=True` marks rules whose results depend on the rest of the
+        document, which are never replayed from a cache.
+        """
+        def register(func):
+            if root:
+                self._root_rules.append(func)
+            if document:
+                self._document_rules.add(func)
+            for tag in tags:
+                self._rules[tag].append(func)
+            self._dispatch.clear()
+            return func
+        return register
+
+    def needs_children(self, tag) -> bool:
+        """
+        Whether some rule registered for `tag` may inspect its direct children.
+        Streaming callers use this to decide when children can be freed.
+        """
+        return tag in self._rules
+
+    def begin(self) -> RuleContext:
+        """
+        Start a new document run.
+        """
+        return RuleContext()
+
+    def feed(self, context: RuleContext, event: str, element):
+        """
+        Dispatch one ("start" | "end", element) event to the matching rules.
+        """
+        tag = element.tag
+        if not isinstance(tag, str):
+            # Comments and processing instructions carry no rules
+            return
+
+        if event == "start":
+            if not context._started:
+                context._started = True
+                for func in self._root_rules:
+                    context.errors.extend(func(element, context) or ())
+            return
+
+        self.end_element(context, element)
+
+    def end_element(self, context: RuleContext, element, reuse: list = None) -> list:
+        """
+        Run the rules for one complete element: those registered for its tag,
+        then the "*" rules. With `reuse` (a list returned by an earlier call
+        for an identical subtree), local rules are not called again and their
+        cached messages are used instead; document rules always run.
+        Returns the messages of each rule, in order, with None for document
+        rules, for the caller to cache.
+        """
+        rules = self._dispatch.get(element.tag)
+        if rules is None:
+            rules = self._dispatch[element.tag] = tuple(
+                (func, func in self._document_rules)
+                for func in self._rules.get(element.tag, []) + self._rules.get("*", [])
+            )
+
+        results = []
+        for position, (func, document) in enumerate(rules):
+            if document:
+                context.errors.extend(func(element, context) or ())
+                results.append(None)
+            else:
+                messages = reuse[position] if reuse is not None else list(func(element, context) or ())
+                context.errors.extend(messages)
+                results.append(messages)
+        return results
+
+    def check(self, root_element) -> list:
+        """
+        Run every rule over an already parsed tree in a single walk.
+        Returns the list of error messages.
+        """
+        context = self.begin()
+        for event, element in etree.iterwalk(root_element, events=("start", "end")):
+            self.feed(context, event, element)
+        return context.errors
+
+rule_engine = RuleEngine()
+
+def perform_rule_based_checks(root_element) -> list:
+    """
+    Perform all registered DITA checks on the parsed root element (an _Element).
+    Return a list of error messages, if any.
+    """
+    return rule_engine.check(root_element)
+
+########################################
+# 2. Root Rules
+########################################
+@rule_engine.rule(root=True)
+def check_root_tag(element, context):
+    # The root should be <concept>, <task>, or <reference>
+    if element.tag not in TOPIC_TYPES:
+        yield f"Root element <{element.tag}> is unexpected. (Expected concept, task, or reference.)"
+
+@rule_engine.rule(root=True)
+def check_root_id(element, context):
+    if "id" not in element.attrib:
+        yield f"Root element <{element.tag}> is missing the 'id' attribute."
+
+########################################
+# 3. Topic Rules
+########################################
+@rule_engine.rule(*TOPIC_TYPES)
+def check_topic_title(element, context):
+    if element.find("title") is None:
+        yield f"{element.tag.capitalize()} element is missing a <title>."
+
+@rule_engine.rule("task")
+def check_task_body(element, context):
+    if element.find("taskbody") is None:
+        yield "Task element is missing a <taskbody>."
+
+@rule_engine.rule("shortdesc")
+def check_shortdesc_not_empty(element, context):
+    if len(element) == 0 and not (element.text or "").strip():
+        yield "Shortdesc element is empty."
+
+@rule_engine.rule("*", document=True)
+def check_unique_ids(element, context):
+    element_id = element.get("id")
+    if element_id is None:
+        return
+    seen = context.state.setdefault("ids", set())
+    if element_id in seen:
+        yield f"Duplicate id '{element_id}' on <{element.tag}>."
+    seen.add(element_id)
@@ -0,0 +1,211 @@
+# serve.py
+
+import argparse
+import gc
+import math
+import os
+import signal
+import socket
+import sys
+import time
+import traceback
+
+from backend.workers import _env_int
+
+########################################
+# 1. Configuration
+########################################
+# Server processes (0: one per available CPU, see `available_cpus`)
+SERVER_WORKERS = _env_int("SERVER_WORKERS", 0)
+
+# Threads each process may use inside BLAS/OpenMP libraries. Scoring is one
+# small dot product per document, so extra native threads only compete
+# with the other workers for cores.
+BLAS_THREADS = _env_int("BLAS_THREADS", 1)
+
+# Environment variables read by OpenMP, OpenBLAS, MKL and friends when they
+# are loaded; set before NumPy is first imported
+THREAD_ENV_VARS = ("OMP_NUM_THREADS", "OPENBLAS_NUM_THREADS", "MKL_NUM_THREADS",
+                   "VECLIB_MAXIMUM_THREADS", "NUMEXPR_NUM_THREADS")
+
+# A worker that exits sooner than this after starting is restarted only
+# after a pause, so a crash at startup does not turn into a fork loop
+MIN_WORKER_UPTIME = 1.0
+
+def available_cpus() -> int:
+    """
+    CPUs this process may run on: its CPU affinity, further limited by a
+    cgroup v2 CPU quota (e.g. a container's --cpus), when there is one.
+    """
+    try:
+        cpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        cpus = os.cpu_count() or 1
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            quota, period = f.read().split()
+        if quota != "max":
+            cpus = min(cpus, max(1, math.ceil(int(quota) / int(period))))
+    except (OSError, ValueError):
+        pass
+    return cpus
+
+def limit_native_threads(threads: int):
+    """
+    Cap BLAS/OpenMP thread pools at `threads` per process: through the
+    environment for libraries not loaded yet, and with threadpoolctl for
+    those already loaded. Forked workers inherit both.
+    """
+    for name in THREAD_ENV_VARS:
+        os.environ[name] = str(threads)
+    from threadpoolctl import threadpool_limits
+    threadpool_limits(limits=threads)
+
+########################################
+# 2. Preloading
+########################################
+def _touch_pages(array):
+    # Read one byte per page so a memory-mapped array is in the page cache
+    if array is not None:
+        array.view("uint8")[::4096].sum()
+
+def preload():
+    """
+    Import the app in the parent process, which loads the model being
+    served, and get it ready to be shared by forked workers:
+
+    - artifact arrays are memory-mapped and read once, so every worker
+      maps the same page-cache pages instead of loading its own copy
+    - one warm-up score initializes the scorer's lazy state
+    - `gc.freeze` moves everything loaded so far out of the collector's
+      reach, so collections in the workers do not write to (and copy) the
+      shared pages
+
+    Returns the ASGI app.
+    """
+    import backend.app as app_module
+
+    scorer = app_module.live_scorer.current
+    artifact = getattr(scorer, "artifact", None)
+    if artifact is not None:
+        _touch_pages(artifact.vocabulary)
+        _touch_pages(artifact.offsets)
+        _touch_pages(artifact.coef)
+    scorer.score_texts(["warm up"])
+    print(f"Preloaded model version {scorer.version}")
+
+    gc.collect()
+    gc.freeze()
+    return app_module.app
+
+########################################
+# 3. Pre-Fork Supervisor
+########################################
+def _run_worker(app, sock: socket.socket, log_level: str):
+    import uvicorn
+
+    # Uvicorn installs its own SIGINT/SIGTERM handlers for a graceful shutdown
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    server = uvicorn.Server(uvicorn.Config(app, log_level=log_level))
+    server.run(sockets=[sock])
+
+def serve(host: str = "0.0.0.0", port: int = 8000, workers: int = None, blas_threads: int = BLAS_THREADS,
+          log_level: str = "info"):
+    """
+    Run the API in `workers` processes forked from one parent.
+
+    The parent caps native thread pools, preloads the app and model, binds
+    the listening socket, and then forks the workers, which share the
+    socket and the preloaded memory copy-on-write. Each worker serves with
+    its own uvicorn event loop (and runs the app's lifespan: model reload
+    watcher, job workers). The parent restarts workers that die, and on
+    SIGTERM/SIGINT asks every worker to shut down gracefully and waits.
+
+    Unless already set, each worker's VALIDATION_WORKERS / MAP_WORKERS
+    thread pools are sized to its share of the CPUs.
+    """
+    cpus = available_cpus()
+    workers = workers or SERVER_WORKERS or cpus
+    limit_native_threads(blas_threads)
+    per_worker = str(max(1, cpus // workers))
+    os.environ.setdefault("VALIDATION_WORKERS", per_worker)
+    os.environ.setdefault("MAP_WORKERS", per_worker)
+
+    app = preload()
+
+    sock = socket.socket(socket.AF_INET6 if ":" in host else socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    print(f"Serving on http://{host}:{sock.getsockname()[1]} with {workers} workers "
+          f"({blas_threads} BLAS thread(s) each, {cpus} CPUs available)")
+
+    children = {}  # pid -> start time
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                _run_worker(app, sock, log_level)
+            except BaseException:
+                traceback.print_exc()
+                code = 1
+            finally:
+                os._exit(code)
+        children[pid] = time.monotonic()
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGTERM, stop)
+    signal.signal(signal.SIGINT, stop)
+
+    for _ in range(workers):
+        spawn()
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        started = children.pop(pid, None)
+        if started is None or stopping:
+            continue
+        print(f"Worker {pid} exited with status {os.waitstatus_to_exitcode(status)}; restarting it")
+        if time.monotonic() - started < MIN_WORKER_UPTIME:
+            time.sleep(MIN_WORKER_UPTIME)
+        if not stopping:
+            spawn()
+
+    sock.close()
+
+########################################
+# 4. Main Entrypoint
+########################################
+def main(argv: list = None):
+    parser = argparse.ArgumentParser(
+        prog="python -m backend.serve",
+        description="Run the validation API in several worker processes sharing one preloaded model.",
+    )
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--workers", type=int,
+                        help="Worker processes (default: SERVER_WORKERS, or one per available CPU)")
+    parser.add_argument("--blas-threads", type=int, default=BLAS_THREADS,
+                        help="BLAS/OpenMP threads per worker (default: 1)")
+    parser.add_argument("--log-level", default="info")
+    args = parser.parse_args(argv)
+    serve(args.host, args.port, args.workers, args.blas_threads, args.log_level)
+
+if __name__ == "__main__":
+    sys.exit(main())
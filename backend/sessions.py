@@ -0,0 +1,251 @@
+# sessions.py
+
+import hashlib
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from lxml import etree
+
+from backend.metrics import StageTimer
+from backend.parsing import structure_tokens
+from backend.rules import rule_engine
+from backend.workers import _env_int
+
+########################################
+# 1. Configuration
+########################################
+# Documents with a live editing session, per server process (least recently
+# used sessions are dropped first; 0 disables sessions)
+SESSION_CACHE_SIZE = _env_int("SESSION_CACHE_SIZE", 128)
+
+# Seconds a session is kept without a new revision (0 means no expiry)
+SESSION_TTL = _env_int("SESSION_TTL", 3600)
+
+# Depth of the subtrees a document is cut into. At depth 2 a block is one
+# child of <conbody>, <taskbody>, <refbody>, ...: a paragraph, a section,
+# a step list. The few elements above that depth are the "shell".
+BLOCK_DEPTH = 2
+
+########################################
+# 2. Blocks
+########################################
+# Everything computed for a block depends only on its markup (tail
+# included) and, for structural models, on the tags its structure tokens
+# read from outside it: parent, grandparent and previous sibling. Local
+# rules only look at an element and its children, and token counts add up
+# across text nodes. A block with the same key in the next revision is not
+# checked or vectorized again.
+def block_key(block, context: str = "") -> bytes:
+    """
+    Key of a block: a hash of `context` (the outside tags, when they
+    matter) and of the block serialized with its tail.
+    """
+    digest = hashlib.blake2b(context.encode("utf-8"), digest_size=16)
+    digest.update(b"\0")
+    digest.update(etree.tostring(block))
+    return digest.digest()
+
+def _elements(block):
+    # The block's elements in "end" event order, skipping comments and PIs
+    return (element for _, element in etree.iterwalk(block, events=("end",)) if isinstance(element.tag, str))
+
+def _check_block(block, context, scorer, engine) -> tuple:
+    """
+    Run the rules over a new block and vectorize its text, as
+    `extract_features` / `extract_text` would within the whole document.
+    Returns the block record: (per-element rule results, features).
+    """
+    texts = []
+    for node in block.iter():
+        if isinstance(node.tag, str):
+            if node.text:
+                texts.append(node.text)
+            if scorer.structural:
+                texts.extend(structure_tokens(node))
+        if node.tail:
+            texts.append(node.tail)
+    rules = []
+    if isinstance(block.tag, str):
+        rules = [engine.end_element(context, element) for element in _elements(block)]
+    return rules, scorer.features(" ".join(texts))
+
+def _replay_block(block, record: tuple, context, engine):
+    # Same rule calls as `_check_block`, with the cached local results
+    if isinstance(block.tag, str):
+        for element, results in zip(_elements(block), record[0]):
+            engine.end_element(context, element, results)
+
+def _add(total, features, sign: int = 1):
+    # total +/- features: Counters (LinearScorer) are updated in place,
+    # sparse rows (DITAModel) are added
+    if isinstance(total, Counter):
+        if sign > 0:
+            total.update(features)
+        else:
+            total.subtract(features)
+        return total
+    return total + features if sign > 0 else total - features
+
+########################################
+# 3. Document Sessions
+########################################
+class DocumentSession:
+    """
+    What is kept of a document's last revision to validate the next one:
+    the record of each block (see `block_key`), how many times each block
+    occurs, and the shell's and the whole document's feature rows.
+    """
+
+    def __init__(self, model_version: str = None):
+        self.lock = threading.Lock()
+        self.revision = 0
+        self.reset(model_version)
+
+    def reset(self, model_version: str):
+        self.model_version = model_version
+        self.blocks = {}  # key -> (per-element rule results, features)
+        self.block_counts = Counter()
+        self.shell_features = None
+        self.features = None
+
+def revalidate(session: DocumentSession, root_element, scorer, engine=rule_engine, timer: StageTimer = None) -> dict:
+    """
+    Validates a new revision of the document held by `session`, giving the
+    same result as `validate_document` on the full tree.
+
+    Root rules and the rules of shell elements always run, as do document
+    rules (e.g. duplicate ids). Blocks seen in the previous revision replay
+    their cached local rule results, and only new or changed blocks are
+    checked and vectorized. The feature row is updated from token-count
+    deltas: the removed blocks' counts and the old shell's are subtracted,
+    the added blocks' and the new shell's added. Since the model is linear
+    over counts, scoring the updated row equals scoring the whole text.
+
+    A session created for another model version starts over.
+    Returns the /validate result plus a "session" entry with the revision
+    number, the block count and how many blocks were reused.
+    """
+    timer = timer or StageTimer()
+    if session.model_version != scorer.version:
+        session.reset(scorer.version)
+    context = engine.begin()
+    engine.feed(context, "start", root_element)
+    shell_texts = []
+    blocks = {}
+    keys = []
+    reused = 0
+
+    def visit(node, depth: int):
+        nonlocal reused
+        if node.tail and depth:
+            shell_texts.append(node.tail)
+        if not isinstance(node.tag, str):
+            return
+        if node.text:
+            shell_texts.append(node.text)
+        if scorer.structural:
+            shell_texts.extend(structure_tokens(node))
+        parent = node.getparent()
+        path = f"{node.tag}\0{parent.tag if parent is not None else ''}\0"
+        previous = ""
+        for child in node:
+            if depth + 1 < BLOCK_DEPTH:
+                visit(child, depth + 1)
+                continue
+            key = block_key(child, path + previous if scorer.structural else "")
+            if isinstance(child.tag, str):
+                previous = child.tag
+            record = blocks.get(key) or session.blocks.get(key)
+            if record is None:
+                record = _check_block(child, context, scorer, engine)
+            else:
+                _replay_block(child, record, context, engine)
+                reused += 1
+            blocks[key] = record
+            keys.append(key)
+        engine.end_element(context, node)
+
+    with timer.stage("blocks"):
+        visit(root_element, 0)
+        shell_features = scorer.features(" ".join(shell_texts))
+        block_counts = Counter(keys)
+
+        incremental = session.features is not None
+        if incremental:
+            features = _add(session.features, session.shell_features, -1)
+            features = _add(features, shell_features)
+            for key, count in (session.block_counts - block_counts).items():
+                for _ in range(count):
+                    features = _add(features, session.blocks[key][1], -1)
+            for key, count in (block_counts - session.block_counts).items():
+                for _ in range(count):
+                    features = _add(features, blocks[key][1])
+        else:
+            features = shell_features.copy()
+            for key in keys:
+                features = _add(features, blocks[key][1])
+        if isinstance(features, Counter):
+            features = +features  # drop the columns whose count fell to zero
+
+    with timer.stage("score"):
+        compliance_probability = scorer.score_features(features)
+
+    session.blocks = blocks
+    session.block_counts = block_counts
+    session.shell_features = shell_features
+    session.features = features
+    session.revision += 1
+
+    return {
+        "compliance_probability": compliance_probability,
+        "model_version": scorer.version,
+        "errors": context.errors,
+        "session": {
+            "revision": session.revision,
+            "incremental": incremental,
+            "blocks": len(keys),
+            "blocks_reused": reused,
+        },
+    }
+
+class SessionStore:
+    """
+    LRU of DocumentSessions by document id, bounded by `max_sessions`;
+    sessions idle for more than `ttl` seconds start over. Sessions live in
+    the server process, so with several workers (see serve.py) a revision
+    may reach a worker without the session and is then validated in full.
+    """
+
+    def __init__(self, max_sessions: int = SESSION_CACHE_SIZE, ttl: float = SESSION_TTL):
+        self.max_sessions = max_sessions
+        self.ttl = ttl
+        self._sessions = OrderedDict()  # document id -> (last used, session)
+        self._lock = threading.Lock()
+
+    def get(self, document_id: str) -> DocumentSession:
+        """
+        The session for `document_id`, created if missing or expired.
+        """
+        now = time.time()
+        with self._lock:
+            entry = self._sessions.get(document_id)
+            if entry is None or (self.ttl > 0 and now - entry[0] > self.ttl):
+                session = DocumentSession()
+            else:
+                session = entry[1]
+            if self.max_sessions > 0:
+                self._sessions[document_id] = (now, session)
+                self._sessions.move_to_end(document_id)
+                while len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            return session
+
+    def discard(self, document_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(document_id, None) is not None
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+document_sessions = SessionStore()
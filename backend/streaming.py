@@ -0,0 +1,139 @@
+# streaming.py
+
+from lxml import etree
+
+from backend.parsing import check_limits, new_parser, structure_tokens
+from backend.rules import rule_engine
+
+########################################
+# 1. Configuration
+########################################
+# Size of the chunks read from an upload and fed to the parser
+STREAM_CHUNK_SIZE = 64 * 1024
+
+# Buffered text (in characters) before it is folded into the feature row
+TEXT_FLUSH_CHARS = 256 * 1024
+
+def iter_chunks(fileobj, chunk_size: int = STREAM_CHUNK_SIZE):
+    """
+    Yield a binary file object's content in `chunk_size` pieces.
+    """
+    while True:
+        chunk = fileobj.read(chunk_size)
+        if not chunk:
+            return
+        yield chunk
+
+########################################
+# 2. Streaming Validator
+########################################
+class StreamingValidator:
+    """
+    Validates a DITA document fed in chunks, with bounded memory.
+
+    Bytes go into an lxml XMLPullParser. Every element's "end" event runs
+    the rule engine and collects the element's text plus its children's
+    tails, then the element's subtree is dropped. Siblings are dropped as
+    soon as the parent has no rule that needs to see them, so only the
+    current path (plus the direct children of elements with rules) stays
+    alive, no matter how large the document is.
+
+    Text is folded into running features through `vectorize(text)` (e.g. a
+    scorer's `features`) every TEXT_FLUSH_CHARS characters. Token counts
+    are additive across text nodes, so the final `features` equal
+    vectorizing `extract_text` of the whole tree. With `structural=True`,
+    every element's `structure_tokens` are added at its "start" event (its
+    previous sibling is only dropped at its own "end"), matching
+    `extract_features`.
+
+    Usage:
+        validator = StreamingValidator(scorer.features, structural=scorer.structural)
+        for chunk in chunks:
+            validator.feed(chunk)
+        validator.close()
+        validator.errors, validator.features
+    """
+
+    def __init__(self, vectorize, engine=rule_engine, flush_chars: int = TEXT_FLUSH_CHARS,
+                 structural: bool = False):
+        self.vectorize = vectorize
+        self.engine = engine
+        self.flush_chars = flush_chars
+        self.structural = structural
+        self.features = None
+        self._context = engine.begin()
+        self._parser = new_parser(etree.XMLPullParser, events=("start", "end"))
+        self._texts = []
+        self._buffered = 0
+        self._depth = 0
+        self._elements = 0
+
+    @property
+    def errors(self) -> list:
+        return self._context.errors
+
+    def feed(self, chunk: bytes):
+        """
+        Feed the next chunk of the document.
+        Raises etree.XMLSyntaxError as soon as the input stops being
+        well-formed, and DocumentLimitError as soon as it is nested too
+        deep or has too many elements (see parsing.py).
+        """
+        self._parser.feed(chunk)
+        self._drain()
+
+    def close(self):
+        """
+        Signal the end of the document and finish the feature row.
+        """
+        self._parser.close()
+        self._drain()
+        self._flush_text(force=True)
+
+    def _drain(self):
+        for event, element in self._parser.read_events():
+            if event == "start":
+                self._depth += 1
+                self._elements += 1
+                check_limits(self._depth, self._elements)
+            else:
+                self._depth -= 1
+            self.engine.feed(self._context, event, element)
+            if event == "start" and self.structural:
+                self._add_text(" ".join(structure_tokens(element)))
+            elif event == "end":
+                self._release(element)
+
+    def _release(self, element):
+        # The element is complete: its own text and its children's tails
+        # are final, so collect them and free the subtree.
+        self._add_text(element.text)
+        for child in element:
+            self._add_text(child.tail)
+        del element[:]
+
+        # The previous sibling's tail is final too. Drop that sibling
+        # unless the parent has rules that inspect its children.
+        parent = element.getparent()
+        if parent is not None and not self.engine.needs_children(parent.tag):
+            previous = element.getprevious()
+            while previous is not None:
+                self._add_text(previous.tail)
+                earlier = previous.getprevious()
+                parent.remove(previous)
+                previous = earlier
+
+        self._flush_text()
+
+    def _add_text(self, text):
+        if text:
+            self._texts.append(text)
+            self._buffered += len(text)
+
+    def _flush_text(self, force: bool = False):
+        if not force and self._buffered < self.flush_chars:
+            return
+        row = self.vectorize(" ".join(self._texts))
+        self.features = row if self.features is None else self.features + row
+        self._texts = []
+        self._buffered = 0
@@ -1,61 +1,250 @@
 # train_model.py
 
+import argparse
+import hashlib
+import json
 import os
 import glob
 import pickle
-import re
-from lxml import etree
-from sklearn.feature_extraction.text import CountVectorizer
-from sklearn.linear_model import LogisticRegression
+import random
+import tarfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
 
-def extract_text_from_xml(xml_str: str) -> str:
+from sklearn.feature_extraction.text import CountVectorizer, HashingVectorizer
+from sklearn.linear_model import LogisticRegression, SGDClassifier
+
+from backend.artifact import export_artifact
+from backend.dedup import DedupReport, deduplicate
+from backend.feature_store import FeatureStore
+from backend.model_search import grid_search, make_classifier, make_vectorizer, measure_serving
+from backend.parsing import extract_features, extract_text, extract_text_from_xml, parse_dita
+from backend.registry import ModelRegistry
+
+# Labeled corpus layout: subfolder -> label (1 = Compliant, 0 = Non-Compliant)
+LABEL_FOLDERS = [("compliant", 1), ("non_compliant", 0)]
+
+class CorpusReport:
+    """
+    Counters filled in while a corpus is loaded: how many files were seen,
+    how many were loaded, and which ones could not be parsed (and why).
+    """
+
+    def __init__(self):
+        self.files = 0
+        self.loaded = 0
+        self.cached = 0  # files whose text came from the feature store
+        self.failures = []  # (path, error message)
+
+def iter_labeled_files(data_path: str = "data"):
+    """
+    Lazily yields (path, label) for every .dita file under the label folders.
+    """
+    for folder, label in LABEL_FOLDERS:
+        for path in sorted(glob.iglob(os.path.join(data_path, folder, "*.dita"))):
+            yield path, label
+
+def iter_shard_files(data_path: str = "data"):
     """
-    Parse the XML string and extract all text content from DITA elements.
-    This ensures we feed natural language tokens (instead of raw XML) to CountVectorizer.
+    Lazily yields the tar and JSONL shards written by
+    `populate_data.py --format tar|jsonl` directly under `data_path`.
     """
+    paths = glob.glob(os.path.join(data_path, "*.jsonl")) + glob.glob(os.path.join(data_path, "*.tar"))
+    yield from sorted(paths)
+
+def iter_shard(shard_path: str):
+    """
+    Lazily yields (name, label, content) for every document in a shard.
+    JSONL rows carry their label; in a tar archive the label comes from the
+    member's folder, as in the loose-file layout. Names are
+    "<shard path>:<folder>/<file name>".
+    """
+    if shard_path.endswith(".jsonl"):
+        with open(shard_path, encoding="utf-8") as f:
+            for line in f:
+                if line.strip():
+                    row = json.loads(line)
+                    yield f"{shard_path}:{row['name']}", int(row["label"]), row["content"].encode("utf-8")
+        return
+    labels = dict(LABEL_FOLDERS)
+    with tarfile.open(shard_path) as archive:
+        for member in archive:
+            folder = member.name.partition("/")[0]
+            if member.isfile() and member.name.endswith(".dita") and folder in labels:
+                yield f"{shard_path}:{member.name}", labels[folder], archive.extractfile(member).read()
+
+def _extract(name: str, label: int, content: bytes, extract, known_digest: str = None) -> tuple:
+    # One (name, label, text, error, digest) result of the worker tasks below
     try:
-        # Convert string to bytes, parse with lxml
-        root = etree.fromstring(xml_str.encode("utf-8"))
-        # Collect text from all nodes (e.g., <title>, <shortdesc>, <p>, etc.)
-        text_nodes = root.xpath("//text()")
-        # Join them with spaces to form one coherent text
-        return " ".join(text_nodes)
-    except Exception:
-        # If parsing fails (invalid XML syntax, etc.), return an empty string to avoid crashing
-        return ""
-
-def load_data(data_path: str = "data"):
+        digest = hashlib.sha256(content).hexdigest()
+        if digest == known_digest:
+            return name, label, None, None, digest
+        return name, label, extract(parse_dita(content)), None, digest
+    except Exception as e:
+        return name, label, None, f"{type(e).__name__}: {e}", None
+
+def _extract_files(batch: list, structural: bool = False) -> list:
+    """
+    Worker task: parse a batch of (path, label, known digest) triples and
+    extract their text (plus structural tokens with `structural`).
+    Returns (path, label, text, error, digest) tuples; `error` is None on
+    success. When the content's SHA-256 equals the known digest the file is
+    not parsed and both `text` and `error` are None (see FeatureStore).
+    """
+    extract = extract_features if structural else extract_text
+    results = []
+    for path, label, known_digest in batch:
+        try:
+            with open(path, "rb") as f:
+                content = f.read()
+        except OSError as e:
+            results.append((path, label, None, f"{type(e).__name__}: {e}", None))
+            continue
+        results.append(_extract(path, label, content, extract, known_digest))
+    return results
+
+def _extract_shard(shard_path: str, structural: bool = False) -> list:
+    """
+    Worker task: read one shard and extract the text of every document in
+    it, as `_extract_files` does for loose files. A shard that cannot be
+    read is reported as a single failure.
+    """
+    extract = extract_features if structural else extract_text
+    try:
+        return [_extract(name, label, content, extract) for name, label, content in iter_shard(shard_path)]
+    except Exception as e:
+        return [(shard_path, None, None, f"{type(e).__name__}: {e}", None)]
+
+def _batched(iterable, size: int):
+    batch = []
+    for item in iterable:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+def iter_corpus(data_path: str = "data", workers: int = None, chunksize: int = 256,
+                report: CorpusReport = None, progress_every: int = 0, store: FeatureStore = None,
+                structural: bool = False):
+    """
+    Yields (text, label) pairs for the labeled corpus under `data_path`:
+    the loose files of `iter_labeled_files`, then the documents of the
+    shards of `iter_shard_files`.
+
+    Files are parsed in a process pool, `chunksize` files (or one shard)
+    per task, with at most two tasks per worker in flight so memory stays
+    flat on large corpora. Pairs come out in the same order as
+    `iter_labeled_files` and `iter_shard`.
+    Unparseable files are skipped and recorded in `report.failures`
+    instead of being turned into empty documents. With `structural`, texts
+    include the structural tokens of `parsing.extract_features`.
+
+    With a `store`, only files that are new or changed since they were last
+    stored are sent to the workers; the rest come from the feature store,
+    and entries for deleted files are pruned once the corpus is exhausted.
+    Shards are always read in full: the store only covers loose files.
+
+    Set `workers=1` to parse in the current process.
+    Set `progress_every` to print a progress line every N files.
+    """
+    report = report if report is not None else CorpusReport()
+    workers = workers or os.cpu_count() or 1
+    if store is not None and store.structural != structural:
+        raise ValueError("The feature store was opened for a different kind of features.")
+    seen = set()
+
+    def plan():
+        # (batch, cached {path: (text, error)}, task, task argument) per batch;
+        # a shard's batch is None, its documents are only known once read
+        for batch in _batched(iter_labeled_files(data_path), chunksize):
+            if store is None:
+                yield batch, {}, _extract_files, [(path, label, None) for path, label in batch]
+                continue
+            seen.update(path for path, _ in batch)
+            cached, pending = store.split(batch)
+            yield batch, cached, _extract_files, pending
+        for shard_path in iter_shard_files(data_path):
+            yield None, {}, _extract_shard, shard_path
+
+    def merge(batch, cached, extracted):
+        if batch is None:
+            return [(name, label, text, error) for name, label, text, error, _ in extracted]
+        report.cached += len(cached)
+        texts = dict(cached)
+        for path, label, text, error, digest in extracted:
+            if store is not None:
+                if text is None and error is None:
+                    report.cached += 1
+                text, error = store.record(path, digest, text, error)
+            texts[path] = (text, error)
+        if store is not None:
+            store.commit()
+        return [(path, label, *texts[path]) for path, label in batch]
+
+    if workers == 1:
+        results = (
+            merge(batch, cached, task(argument, structural))
+            for batch, cached, task, argument in plan()
+        )
+        yield from _collect(results, report, progress_every)
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            in_flight = deque()
+
+            def results():
+                for batch, cached, task, argument in plan():
+                    future = pool.submit(task, argument, structural) if argument else None
+                    in_flight.append((batch, cached, future))
+                    if len(in_flight) >= workers * 2:
+                        yield finish(*in_flight.popleft())
+                while in_flight:
+                    yield finish(*in_flight.popleft())
+
+            def finish(batch, cached, future):
+                return merge(batch, cached, future.result() if future is not None else [])
+
+            yield from _collect(results(), report, progress_every)
+
+    if store is not None:
+        store.prune(seen)
+        store.commit()
+
+def _collect(results, report: CorpusReport, progress_every: int):
+    for batch in results:
+        for path, label, text, error in batch:
+            report.files += 1
+            if error is not None:
+                report.failures.append((path, error))
+            else:
+                report.loaded += 1
+                yield text, label
+            if progress_every and report.files % progress_every == 0:
+                print(f"  ... {report.files} files read, {len(report.failures)} unparseable")
+
+def load_data(data_path: str = "data", workers: int = None, report: CorpusReport = None,
+              progress_every: int = 0, store: FeatureStore = None, structural: bool = False):
     """
     Reads all .dita files from `data_path` subfolders 'compliant' and 'non_compliant',
-    extracts plain text, and returns lists of documents (X) and labels (y).
+    and the documents of the tar/JSONL shards in `data_path`, extracts plain text (plus structural tokens with `structural`), and returns
+    lists of documents (X) and labels (y).
+    Unparseable files are left out (see `iter_corpus`).
 
     Label 1 = Compliant, 0 = Non-Compliant
     """
-    compliant_files = glob.glob(os.path.join(data_path, "compliant", "*.dita"))
-    non_compliant_files = glob.glob(os.path.join(data_path, "non_compliant", "*.dita"))
-
     X = []
     y = []
-
-    # Handle compliant files
-    for file in compliant_files:
-        with open(file, "r", encoding="utf-8") as f:
-            raw_xml = f.read()
-            text_content = extract_text_from_xml(raw_xml)
-            X.append(text_content)
-        y.append(1)
-
-    # Handle non-compliant files
-    for file in non_compliant_files:
-        with open(file, "r", encoding="utf-8") as f:
-            raw_xml = f.read()
-            text_content = extract_text_from_xml(raw_xml)
-            X.append(text_content)
-        y.append(0)
-
+    for text, label in iter_corpus(data_path, workers=workers, report=report, progress_every=progress_every,
+                                   store=store, structural=structural):
+        X.append(text)
+        y.append(label)
     return X, y
 
-def train(data_path: str = "data"):
+def train(data_path: str = "data", models_dir: str = "models", feature_store: str = None,
+          structural: bool = True, search: bool = False, folds: int = 5, workers: int = None,
+          dedup: str = None):
     """
     Trains a simple logistic regression classifier using the .dita files in `data_path`.
     By default, looks in:
@@ -64,17 +253,66 @@ def train(data_path: str = "data"):
         ├── compliant/
         └── non_compliant/
 
-    for labeled data.
+    for labeled data. The fitted model is saved to `models_dir`.
+
+    With a `feature_store` path (an SQLite file, see feature_store.py),
+    only files added or modified since the last run are parsed.
+
+    With `structural` (the default), tag paths, attributes and element
+    order are counted alongside the words (see `parsing.extract_features`),
+    so the model also sees markup problems such as a misspelled root tag.
+
+    With `search`, vectorizer and classifier settings are chosen by k-fold
+    cross-validation over the grids in model_search.py (`folds` folds,
+    `workers` processes), and a metrics report is written to
+    `models_dir/metrics.json`: cross-validated accuracy, ROC-AUC,
+    calibration and fit time of every candidate, plus the size and scoring
+    latency of the saved model.
+
+    With `dedup` ("drop" or "weight"), near-duplicate documents are found
+    by MinHash LSH (see dedup.py) and either dropped or down-weighted
+    before training.
     """
     print(f"Loading data from: {data_path}")
-    X, y = load_data(data_path)
+    report = CorpusReport()
+    store = FeatureStore(feature_store, structural=structural) if feature_store else None
+    try:
+        X, y = load_data(data_path, report=report, progress_every=10000, store=store, structural=structural)
+    finally:
+        if store is not None:
+            store.close()
+    print(f"Loaded {report.loaded} of {report.files} files.")
+    if store is not None:
+        print(f"  {report.cached} files reused from the feature store, {report.files - report.cached} extracted")
+    for path, error in report.failures[:10]:
+        print(f"  Skipped unparseable file {path}: {error}")
+    if len(report.failures) > 10:
+        print(f"  ... and {len(report.failures) - 10} more unparseable files")
 
     # Quick debug: show the first doc if available
     if X:
         print("Example of extracted text from the first doc:\n", X[0][:200], "...\n")
 
+    weights, dedup_report = None, None
+    if dedup:
+        dedup_report = DedupReport()
+        X, y, weights = deduplicate(X, y, mode=dedup, report=dedup_report)
+        print(f"Near-duplicates: {dedup_report.documents} documents in {dedup_report.clusters} clusters "
+              f"(largest {dedup_report.largest_cluster}), {dedup_report.removed} removed")
+
+    vectorizer_params, classifier_params, search_result = {}, {}, None
+    if search:
+        search_result = grid_search(X, y, folds=folds, workers=workers, weights=weights)
+        selected = search_result["selected"]
+        vectorizer_params, classifier_params = selected["vectorizer"], selected["classifier"]
+        print(f"Selected {vectorizer_params} {classifier_params}: "
+              f"ROC-AUC {selected['mean']['roc_auc']:.3f}, accuracy {selected['mean']['accuracy']:.3f}, "
+              f"{selected['mean']['features']:.0f} features")
+
     # Convert text to numeric features
-    vectorizer = CountVectorizer(stop_words=None)
+    vectorizer = make_vectorizer(vectorizer_params) if search else CountVectorizer(stop_words=None)
+    # Read back by the scorers (and the artifact header) to extract the same features
+    vectorizer.structural = structural
     X_features = vectorizer.fit_transform(X)
 
     if X_features.shape[1] == 0:
@@ -84,25 +322,194 @@ def train(data_path: str = "data"):
         )
 
     # Train a logistic regression model
-    model = LogisticRegression()
-    model.fit(X_features, y)
+    model = make_classifier(classifier_params) if search else LogisticRegression()
+    started = time.perf_counter()
+    model.fit(X_features, y, sample_weight=weights)
+    fit_seconds = time.perf_counter() - started
     print("Model training complete.")
 
+    save_model(vectorizer, model, models_dir)
+
+    if search:
+        report = {
+            "documents": len(X),
+            "structural": structural,
+            "dedup": {"mode": dedup, **dedup_report.as_dict()} if dedup else None,
+            **search_result,
+            "final": {"fit_seconds": fit_seconds, "features": X_features.shape[1],
+                      **measure_serving(models_dir, X)},
+        }
+        report_path = os.path.join(models_dir, "metrics.json")
+        with open(report_path, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"Metrics report written to {report_path}")
+
+def save_model(vectorizer, model, models_dir: str = "models"):
+    """
+    Pickle the fitted vectorizer and model into `models_dir`, where the
+    backend loads them from, and export them as an artifact directory
+    (see artifact.py) next to the pickles.
+    """
     # Ensure we have a 'models' folder
-    if not os.path.exists("models"):
-        os.mkdir("models")
+    os.makedirs(models_dir, exist_ok=True)
 
     # Save the vectorizer
-    vectorizer_path = os.path.join("models", "vectorizer.pkl")
+    vectorizer_path = os.path.join(models_dir, "vectorizer.pkl")
     with open(vectorizer_path, "wb") as f:
         pickle.dump(vectorizer, f)
 
     # Save the trained model
-    model_path = os.path.join("models", "model.pkl")
+    model_path = os.path.join(models_dir, "model.pkl")
     with open(model_path, "wb") as f:
         pickle.dump(model, f)
 
-    print(f"Model and vectorizer saved to {os.path.abspath('models/')}")
+    # Export the compact, memory-mappable artifact used for serving
+    header = export_artifact(vectorizer, model, os.path.join(models_dir, "artifact"))
+
+    print(f"Model and vectorizer saved to {os.path.abspath(models_dir)} (artifact version {header['version']})")
+
+def _shuffled(iterable, buffer_size: int, rng: random.Random):
+    """
+    Approximate streaming shuffle: keep `buffer_size` items and emit a random
+    one each time a new item arrives. The corpus is read label folder by
+    label folder, so SGD needs this to see mixed mini-batches.
+    """
+    buffer = []
+    for item in iterable:
+        if len(buffer) < buffer_size:
+            buffer.append(item)
+            continue
+        index = rng.randrange(buffer_size)
+        yield buffer[index]
+        buffer[index] = item
+    rng.shuffle(buffer)
+    yield from buffer
+
+def train_incremental(data_path: str = "data", n_features: int = 2 ** 20, batch_size: int = 10000,
+                      epochs: int = 5, shuffle_buffer: int = 100000, seed: int = 0,
+                      models_dir: str = "models", resume: bool = False, feature_store: str = None,
+                      structural: bool = True, dedup: str = None):
+    """
+    Trains a logistic model out-of-core, so neither the vocabulary nor the
+    full feature matrix has to fit in RAM.
+
+    - Text is vectorized with a stateless HashingVectorizer (`n_features`
+      columns, raw token counts: no alternate signs, no normalization).
+    - An SGDClassifier with log loss is updated with `partial_fit` over
+      mini-batches of `batch_size` documents streamed from `iter_corpus`
+      through a shuffle buffer, for `epochs` passes.
+    - After every mini-batch the model is checkpointed to
+      `models_dir/checkpoint.pkl`; `resume=True` continues from it.
+
+    The resulting vectorizer.pkl/model.pkl are drop-in replacements for the
+    ones written by `train`, without the vocabulary dict.
+
+    With a `feature_store`, files are parsed at most once per run (later
+    epochs read the stored text) and unchanged files not at all.
+    `structural` adds structural tokens, as in `train`.
+
+    With `dedup` ("drop" or "weight"), near-duplicates are removed or
+    down-weighted as in `train`, within each mini-batch: the whole corpus
+    is never in memory at once, so copies landing in different batches are
+    not matched. Returns the DedupReport totals over the last epoch (or
+    None without `dedup`).
+    """
+    vectorizer = HashingVectorizer(n_features=n_features, alternate_sign=False, norm=None)
+    vectorizer.structural = structural
+    model = SGDClassifier(loss="log_loss", random_state=seed)
+    checkpoint_path = os.path.join(models_dir, "checkpoint.pkl")
+    os.makedirs(models_dir, exist_ok=True)
+
+    done = 0
+    if resume and os.path.exists(checkpoint_path):
+        with open(checkpoint_path, "rb") as f:
+            checkpoint = pickle.load(f)
+        vectorizer, model, done = checkpoint["vectorizer"], checkpoint["model"], checkpoint["batches"]
+        structural = getattr(vectorizer, "structural", False)
+        print(f"Resuming from checkpoint after {done} mini-batches.")
+
+    store = FeatureStore(feature_store, structural=structural) if feature_store else None
+    batches = 0
+    for epoch in range(epochs):
+        print(f"Epoch {epoch + 1}/{epochs}: streaming data from {data_path}")
+        report = CorpusReport()
+        dedup_report = DedupReport() if dedup else None
+        # Seed per epoch so a resumed run replays exactly the same batches
+        rng = random.Random(seed + epoch)
+        corpus = _shuffled(iter_corpus(data_path, report=report, store=store, structural=structural),
+                           shuffle_buffer, rng)
+
+        for batch in _batched(corpus, batch_size):
+            batches += 1
+            if batches <= done:
+                continue
+            texts, labels = zip(*batch)
+            weights = None
+            if dedup:
+                batch_report = DedupReport()
+                texts, labels, weights = deduplicate(list(texts), list(labels), mode=dedup, report=batch_report)
+                dedup_report.documents += batch_report.documents
+                dedup_report.clusters += batch_report.clusters
+                dedup_report.removed += batch_report.removed
+                dedup_report.largest_cluster = max(dedup_report.largest_cluster, batch_report.largest_cluster)
+            model.partial_fit(vectorizer.transform(texts), labels, classes=[0, 1], sample_weight=weights)
+
+            # Write the checkpoint atomically so a crash never leaves it half-written
+            with open(checkpoint_path + ".tmp", "wb") as f:
+                pickle.dump({"vectorizer": vectorizer, "model": model, "batches": batches}, f)
+            os.replace(checkpoint_path + ".tmp", checkpoint_path)
+
+        print(f"  {report.loaded} documents, {len(report.failures)} unparseable, {batches} mini-batches so far")
+        if dedup:
+            print(f"  Near-duplicates: {dedup_report.clusters} clusters (largest {dedup_report.largest_cluster}), "
+                  f"{dedup_report.removed} removed")
+
+    if store is not None:
+        store.close()
+    if not hasattr(model, "coef_"):
+        raise ValueError("No training data found in " + data_path)
+
+    print("Model training complete.")
+    save_model(vectorizer, model, models_dir)
+    os.remove(checkpoint_path)
+    return dedup_report
 
 if __name__ == "__main__":
-    train()
+    parser = argparse.ArgumentParser(description="Train the DITA compliance model.")
+    parser.add_argument("data_path", nargs="?", default="data")
+    parser.add_argument("--incremental", action="store_true",
+                        help="Out-of-core training with HashingVectorizer + SGDClassifier.partial_fit")
+    parser.add_argument("--n-features", type=int, default=2 ** 20)
+    parser.add_argument("--batch-size", type=int, default=10000)
+    parser.add_argument("--epochs", type=int, default=5)
+    parser.add_argument("--resume", action="store_true", help="Continue an interrupted incremental run")
+    parser.add_argument("--text-only", action="store_true",
+                        help="Train on document text only, without structural features")
+    parser.add_argument("--search", action="store_true",
+                        help="Pick vectorizer/classifier settings by cross-validated grid search "
+                             "and write models/metrics.json")
+    parser.add_argument("--dedup", choices=["drop", "weight"],
+                        help="Drop near-duplicate documents, or down-weight them to 1 / cluster size")
+    parser.add_argument("--folds", type=int, default=5, help="Cross-validation folds for --search")
+    parser.add_argument("--workers", type=int, help="Processes for --search (default: number of CPUs)")
+    parser.add_argument("--feature-store", metavar="PATH",
+                        help="SQLite file caching extracted text per file; only new or changed files are parsed")
+    parser.add_argument("--publish", metavar="REGISTRY", nargs="?", const=os.path.join("models", "registry"),
+                        help="Publish the trained model to a registry and make it current "
+                             "(default registry: models/registry)")
+    args = parser.parse_args()
+    if args.incremental and args.search:
+        # Cross-validation needs the whole corpus in memory, which out-of-core training avoids
+        parser.error("--search cannot be combined with --incremental.")
+
+    if args.incremental:
+        train_incremental(args.data_path, n_features=args.n_features, batch_size=args.batch_size,
+                          epochs=args.epochs, resume=args.resume, feature_store=args.feature_store,
+                          structural=not args.text_only, dedup=args.dedup)
+    else:
+        train(args.data_path, feature_store=args.feature_store, structural=not args.text_only,
+              search=args.search, folds=args.folds, workers=args.workers, dedup=args.dedup)
+
+    if args.publish:
+        version = ModelRegistry(args.publish).publish("models")
+        print(f"Published model version {version} to {args.publish}")
@@ -0,0 +1,96 @@
+# workers.py
+
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+########################################
+# 1. Configuration
+########################################
+def _env_int(name: str, default: int) -> int:
+    """
+    Read a positive integer from the environment, falling back to `default`.
+    """
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+# Pool sizes are read when a pool is created rather than at import, so a
+# launcher (see serve.py) can still set them for its worker processes:
+# - VALIDATION_WORKERS: threads running validations concurrently
+#   (default: number of CPUs)
+# - VALIDATION_QUEUE_DEPTH: validations accepted at once, running + waiting
+#   for a thread (default: 4 x VALIDATION_WORKERS)
+
+########################################
+# 2. Bounded Validation Pool
+########################################
+class PoolSaturatedError(RuntimeError):
+    """
+    Raised when the pool already holds `max_pending` jobs.
+    """
+
+class ValidationPool:
+    """
+    A bounded thread pool for CPU-bound validation work (lxml parsing, rule
+    checks, model scoring), keeping it off the asyncio event loop.
+
+    At most `max_pending` jobs are admitted at a time, counting both running
+    and queued ones. Further submissions fail immediately with
+    PoolSaturatedError so callers can apply backpressure instead of letting
+    the queue (and tail latency) grow without bound.
+    """
+
+    def __init__(self, max_workers: int = None, max_pending: int = None):
+        if max_workers is None:
+            max_workers = _env_int("VALIDATION_WORKERS", os.cpu_count() or 1)
+        if max_pending is None:
+            max_pending = _env_int("VALIDATION_QUEUE_DEPTH", max_workers * 4)
+        if max_workers < 1 or max_pending < 1:
+            raise ValueError("max_workers and max_pending must both be at least 1.")
+        self.max_workers = max_workers
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="validate")
+        self._slots = threading.BoundedSemaphore(max_pending)
+        self._pending = 0
+        self._lock = threading.Lock()
+
+    @property
+    def pending(self) -> int:
+        """
+        Number of admitted jobs that have not finished yet.
+        """
+        return self._pending
+
+    def _release(self, _future=None):
+        with self._lock:
+            self._pending -= 1
+        self._slots.release()
+
+    def submit(self, func, *args):
+        """
+        Submit `func(*args)` to the pool and return a concurrent Future.
+        Raises PoolSaturatedError if `max_pending` jobs are already admitted.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise PoolSaturatedError(f"Validation pool is saturated ({self.max_pending} jobs pending).")
+        with self._lock:
+            self._pending += 1
+        try:
+            future = self._executor.submit(func, *args)
+        except Exception:
+            self._release()
+            raise
+        # Free the slot when the work itself finishes, even if the awaiting
+        # request was cancelled in the meantime.
+        future.add_done_callback(self._release)
+        return future
+
+    async def run(self, func, *args):
+        """
+        Run `func(*args)` in the pool and await its result from the event loop.
+        """
+        return await asyncio.wrap_future(self.submit(func, *args))
+
+    def shutdown(self, wait: bool = True):
+        self._executor.shutdown(wait=wait)
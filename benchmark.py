@@ -0,0 +1,302 @@
+"""
+Reproducible performance benchmarks for the DITA validation backend.
+
+Generates a synthetic corpus with the populate_data.py generators, then
+measures:
+
+  - per-stage throughput: parse, rule checks, text extraction, vectorize, score
+  - end-to-end /validate latency percentiles through an in-process ASGI client
+  - training wall time and peak memory for several corpus sizes
+
+Results are written as JSON; pass --baseline to compare against an earlier
+run and exit non-zero on regressions beyond --tolerance.
+
+    python benchmark.py --docs 500 --depth 2 --output bench_results.json
+    python benchmark.py --baseline bench_results.json --output bench_new.json
+"""
+
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import multiprocessing
+import os
+import platform
+import random
+import resource
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import populate_data
+from backend.model import load_scorer
+from backend.parsing import parse_dita
+from backend.rules import perform_rule_based_checks
+
+# --------------------------------------------------------------------
+# 1. Corpus Generation
+# --------------------------------------------------------------------
+def nested_topics(depth, index):
+    """
+    Returns `depth` levels of nested <concept> topics, used to make deeper
+    documents than the flat topics populate_data.py produces.
+    """
+    if depth <= 0:
+        return ""
+    fake = populate_data.fake
+    return (
+        f'<concept id="nested_{index}_{depth}">'
+        f"<title>{fake.sentence(nb_words=4)}</title>"
+        f"<conbody><p>{fake.paragraph(nb_sentences=3)}</p></conbody>"
+        f"{nested_topics(depth - 1, index)}"
+        f"</concept>"
+    )
+
+def generate_corpus(size, depth=0, ratio=0.5, seed=0, pool_size=1000):
+    """
+    Returns a deterministic list of (content bytes, label) pairs: `size`
+    documents, `ratio` of them compliant, each with `depth` nested topics.
+    """
+    populate_data.seed_generators(seed, pool_size)
+
+    corpus = []
+    for index in range(size):
+        compliant = random.random() < ratio
+        if compliant:
+            content = populate_data.generate_compliant_content(index)
+        else:
+            content = populate_data.generate_non_compliant_content(index)
+        # Nest the extra topics just before the root's closing tag
+        closing = content.rfind("</")
+        content = content[:closing] + nested_topics(depth, index) + content[closing:]
+        corpus.append((content.encode("utf-8"), 1 if compliant else 0))
+    return corpus
+
+def write_corpus(corpus, data_path):
+    """
+    Writes the corpus in the data/compliant + data/non_compliant layout.
+    """
+    for folder in ("compliant", "non_compliant"):
+        os.makedirs(os.path.join(data_path, folder), exist_ok=True)
+    for index, (content, label) in enumerate(corpus):
+        folder = "compliant" if label else "non_compliant"
+        with open(os.path.join(data_path, folder, f"doc_{index}.dita"), "wb") as f:
+            f.write(content)
+
+# --------------------------------------------------------------------
+# 2. Stage Throughput
+# --------------------------------------------------------------------
+def bench_stages(corpus, scorer, repeat=3):
+    """
+    Times each pipeline stage over the whole corpus (best of `repeat`).
+    Returns throughput metrics in documents (and MB for parsing) per second.
+    """
+    documents = [content for content, _ in corpus]
+    best = {}
+    for _ in range(repeat):
+        totals = {"parse": 0.0, "rules": 0.0, "extract": 0.0, "vectorize": 0.0, "score": 0.0}
+        parsed_bytes = 0
+        parsed = 0
+        for content in documents:
+            start = time.perf_counter()
+            try:
+                root_element = parse_dita(content)
+            except Exception:
+                continue
+            t_parse = time.perf_counter()
+            perform_rule_based_checks(root_element)
+            t_rules = time.perf_counter()
+            text = scorer.extract(root_element)
+            t_extract = time.perf_counter()
+            features = scorer.features(text)
+            t_vectorize = time.perf_counter()
+            scorer.score_features(features)
+            t_score = time.perf_counter()
+
+            totals["parse"] += t_parse - start
+            totals["rules"] += t_rules - t_parse
+            totals["extract"] += t_extract - t_rules
+            totals["vectorize"] += t_vectorize - t_extract
+            totals["score"] += t_score - t_vectorize
+            parsed_bytes += len(content)
+            parsed += 1
+        for stage, seconds in totals.items():
+            best[stage] = min(best.get(stage, float("inf")), seconds)
+
+    metrics = {}
+    for stage, seconds in best.items():
+        metrics[f"{stage}.docs_per_second"] = _metric(parsed / seconds if seconds else 0.0, "higher")
+    metrics["parse.mb_per_second"] = _metric(parsed_bytes / 1e6 / best["parse"] if best["parse"] else 0.0, "higher")
+    return metrics
+
+# --------------------------------------------------------------------
+# 3. End-to-End /validate Latency
+# --------------------------------------------------------------------
+async def _bench_endpoint(corpus, requests, concurrency):
+    import httpx
+    from backend.app import app
+
+    documents = [content for content, _ in corpus]
+    latencies = []
+    semaphore = asyncio.Semaphore(concurrency)
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://benchmark") as client:
+        async def one(index):
+            # A unique trailing comment defeats the result cache
+            content = documents[index % len(documents)] + f"<!-- request {index} -->".encode()
+            async with semaphore:
+                start = time.perf_counter()
+                response = await client.post("/validate", files={"file": (f"doc_{index}.dita", content)})
+                latencies.append(time.perf_counter() - start)
+                response.raise_for_status()
+
+        start = time.perf_counter()
+        await asyncio.gather(*(one(index) for index in range(requests)))
+        elapsed = time.perf_counter() - start
+
+    milliseconds = np.array(latencies) * 1000
+    return {
+        "validate.p50_ms": _metric(float(np.percentile(milliseconds, 50)), "lower"),
+        "validate.p90_ms": _metric(float(np.percentile(milliseconds, 90)), "lower"),
+        "validate.p99_ms": _metric(float(np.percentile(milliseconds, 99)), "lower"),
+        "validate.requests_per_second": _metric(requests / elapsed, "higher"),
+    }
+
+def bench_endpoint(corpus, requests, concurrency):
+    return asyncio.run(_bench_endpoint(corpus, requests, concurrency))
+
+# --------------------------------------------------------------------
+# 4. Training Time and Memory
+# --------------------------------------------------------------------
+def _peak_rss_mb():
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and in kilobytes on Linux
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def _train_child(mode, data_path, models_dir, queue):
+    from backend.train_model import train, train_incremental
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        if mode == "incremental":
+            train_incremental(data_path, n_features=2 ** 18, batch_size=1000, epochs=1, models_dir=models_dir)
+        else:
+            train(data_path, models_dir=models_dir)
+    queue.put({"wall_seconds": time.perf_counter() - start, "peak_rss_mb": _peak_rss_mb()})
+
+def bench_training(sizes, depth, seed, modes):
+    """
+    Trains on corpora of each size in a fresh (spawned) interpreter, so the
+    peak RSS of every run is measured independently.
+    """
+    context = multiprocessing.get_context("spawn")
+    metrics = {}
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            data_path = os.path.join(tmp, "data")
+            write_corpus(generate_corpus(size, depth=depth, seed=seed), data_path)
+            for mode in modes:
+                queue = context.Queue()
+                child = context.Process(target=_train_child, args=(mode, data_path, os.path.join(tmp, mode), queue))
+                child.start()
+                result = queue.get()
+                child.join()
+                metrics[f"train.{mode}.{size}.wall_seconds"] = _metric(result["wall_seconds"], "lower")
+                metrics[f"train.{mode}.{size}.peak_rss_mb"] = _metric(result["peak_rss_mb"], "lower")
+    return metrics
+
+# --------------------------------------------------------------------
+# 5. Results and Baseline Comparison
+# --------------------------------------------------------------------
+def _metric(value, better):
+    return {"value": value, "better": better}
+
+def compare(results, baseline, tolerance):
+    """
+    Prints each metric next to its baseline value and returns the names of
+    metrics that got worse by more than `tolerance` (a fraction).
+    """
+    regressions = []
+    for name, metric in sorted(results["metrics"].items()):
+        base = baseline.get("metrics", {}).get(name)
+        if not base or not base["value"]:
+            print(f"{name:45s} {metric['value']:12.3f}   (no baseline)")
+            continue
+        change = (metric["value"] - base["value"]) / base["value"]
+        worse = -change if metric["better"] == "higher" else change
+        flag = "REGRESSION" if worse > tolerance else ""
+        print(f"{name:45s} {metric['value']:12.3f} {base['value']:12.3f} {change:+8.1%} {flag}")
+        if flag:
+            regressions.append(name)
+    return regressions
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark DITA validation throughput, latency and training time.")
+    parser.add_argument("--docs", type=int, default=500, help="Documents in the benchmark corpus")
+    parser.add_argument("--depth", type=int, default=1, help="Nested topics added to every document")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--requests", type=int, default=500, help="/validate requests to send")
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent /validate requests")
+    parser.add_argument("--train-sizes", default="200,1000", help="Comma-separated corpus sizes to train on")
+    parser.add_argument("--train-modes", default="full", help="Comma-separated: full, incremental")
+    parser.add_argument("--skip", default="", help="Comma-separated sections to skip: stages, endpoint, training")
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="Allowed relative regression (default 10%%)")
+    args = parser.parse_args()
+    skip = set(filter(None, args.skip.split(",")))
+
+    # Read the baseline before anything is written: comparing a run against
+    # the file it just overwrote would always pass
+    baseline = None
+    if args.baseline:
+        if os.path.abspath(args.baseline) == os.path.abspath(args.output):
+            parser.error("--output must differ from --baseline.")
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    corpus = generate_corpus(args.docs, depth=args.depth, seed=args.seed)
+    scorer = load_scorer()
+
+    metrics = {}
+    if "stages" not in skip:
+        print("Measuring stage throughput ...")
+        metrics.update(bench_stages(corpus, scorer))
+    if "endpoint" not in skip:
+        print("Measuring /validate latency ...")
+        metrics.update(bench_endpoint(corpus, args.requests, args.concurrency))
+    if "training" not in skip:
+        print("Measuring training time and memory ...")
+        sizes = [int(size) for size in args.train_sizes.split(",") if size]
+        modes = [mode for mode in args.train_modes.split(",") if mode]
+        metrics.update(bench_training(sizes, args.depth, args.seed, modes))
+
+    results = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "model_version": scorer.version,
+            "config": vars(args),
+        },
+        "metrics": metrics,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(results, f, indent=2, sort_keys=True)
+    print(f"Results written to {args.output}")
+
+    if baseline is not None:
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print(f"{len(regressions)} metric(s) regressed beyond {args.tolerance:.0%}.")
+            sys.exit(1)
+    else:
+        compare(results, {}, args.tolerance)
+
+if __name__ == "__main__":
+    main()
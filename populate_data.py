@@ -1,15 +1,16 @@
+import argparse
+import io
+import json
 import os
 import random
 import string
 import re
+import tarfile
+from concurrent.futures import ProcessPoolExecutor
 from faker import Faker
 
 fake = Faker()
 
-# Directories for compliant and non-compliant files
-GOOD_FOLDER = "sample_data/compliant"
-BAD_FOLDER = "sample_data/non_compliant"
-
 # Define possible topic types
 TOPIC_TYPES = ["concept", "task", "reference"]
 
@@ -271,36 +272,161 @@ def generate_non_compliant_content(index):
 
 
 # --------------------------------------------------------------------
-# 3. File Creation Logic
+# 3. Fast, Seeded Text Generation
 # --------------------------------------------------------------------
-def create_compliant_file(index):
-    file_name = f"good_{index}.dita"
-    content = generate_compliant_content(index)
-    file_path = os.path.join(GOOD_FOLDER, file_name)
-    with open(file_path, "w", encoding="utf-8") as f:
-        f.write(content)
-
-def create_non_compliant_file(index):
-    file_name = f"bad_{index}.dita"
-    content = generate_non_compliant_content(index)
-    file_path = os.path.join(BAD_FOLDER, file_name)
-    with open(file_path, "w", encoding="utf-8") as f:
-        f.write(content)
+class FakerPool:
+    """
+    Drop-in stand-in for the Faker methods used above (sentence, paragraph,
+    word) that draws from a pool of pre-generated values instead of calling
+    Faker every time. Each distinct call, e.g. sentence(nb_words=5), gets
+    its own pool of `size` values, filled on first use.
 
-def main():
-    # Ensure folders exist
-    os.makedirs(GOOD_FOLDER, exist_ok=True)
-    os.makedirs(BAD_FOLDER, exist_ok=True)
+    Documents become far cheaper to generate, at the cost of repeating
+    sentences across a large corpus.
+    """
+
+    def __init__(self, faker, size=1000):
+        self.faker = faker
+        self.size = size
+        self._pools = {}
+
+    def _draw(self, method, **kwargs):
+        key = (method, tuple(sorted(kwargs.items())))
+        pool = self._pools.get(key)
+        if pool is None:
+            generate = getattr(self.faker, method)
+            pool = self._pools[key] = [generate(**kwargs) for _ in range(self.size)]
+        return random.choice(pool)
+
+    def sentence(self, nb_words=6):
+        return self._draw("sentence", nb_words=nb_words)
 
-    # Create 10 compliant files
-    for i in range(1, 11):
-        create_compliant_file(i)
+    def paragraph(self, nb_sentences=3):
+        return self._draw("paragraph", nb_sentences=nb_sentences)
 
-    # Create 10 non-compliant files
-    for i in range(1, 11):
-        create_non_compliant_file(i)
+    def word(self):
+        return self._draw("word")
 
-    print("Done populating the sample_data folder with good and bad DITA files.")
+def seed_generators(seed, pool_size=0):
+    """
+    Makes the content generators deterministic: reseeds `random` and
+    replaces the module-level `fake` with a seeded Faker, wrapped in a
+    FakerPool when `pool_size` > 0.
+    """
+    global fake
+    random.seed(seed)
+    faker = Faker()
+    faker.seed_instance(seed)
+    fake = FakerPool(faker, pool_size) if pool_size > 0 else faker
+
+# --------------------------------------------------------------------
+# 4. File Creation Logic
+# --------------------------------------------------------------------
+def document_label(position, ratio):
+    """
+    Label and per-label index (1-based) of the document at `position` in
+    the corpus. Compliant documents are spread evenly, so every shard gets
+    close to `ratio` of them.
+    """
+    good_before = int(position * ratio)
+    good_through = int((position + 1) * ratio)
+    if good_through > good_before:
+        return 1, good_through
+    return 0, position + 1 - good_through
+
+def generate_shard(job):
+    """
+    Worker task: generate documents [start, stop) of the corpus and write
+    them as loose files, one tar archive or one JSONL file.
+
+    Every shard is seeded from (seed, shard number), so the output does not
+    depend on the number of workers. Returns the number of documents written.
+    """
+    shard, start, stop, options = job
+    seed_generators(f"{options['seed']}-{shard}", options["pool_size"])
+    output, fmt = options["output"], options["format"]
+
+    def documents():
+        for position in range(start, stop):
+            label, index = document_label(position, options["ratio"])
+            if label:
+                yield "compliant", f"good_{index}.dita", label, generate_compliant_content(index)
+            else:
+                yield "non_compliant", f"bad_{index}.dita", label, generate_non_compliant_content(index)
+
+    if fmt == "files":
+        for folder, name, _, content in documents():
+            with open(os.path.join(output, folder, name), "w", encoding="utf-8") as f:
+                f.write(content)
+    elif fmt == "tar":
+        # Same compliant/ + non_compliant/ layout inside the archive
+        with tarfile.open(os.path.join(output, f"shard-{shard:05d}.tar"), "w") as archive:
+            for folder, name, _, content in documents():
+                data = content.encode("utf-8")
+                info = tarfile.TarInfo(f"{folder}/{name}")
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+    else:
+        with open(os.path.join(output, f"shard-{shard:05d}.jsonl"), "w", encoding="utf-8") as f:
+            for folder, name, label, content in documents():
+                f.write(json.dumps({"name": f"{folder}/{name}", "label": label, "content": content}) + "\n")
+    return stop - start
+
+def populate(count=20, ratio=0.5, seed=None, output="sample_data", workers=None,
+             fmt="files", shard_size=10000, pool_size=1000):
+    """
+    Generates `count` documents (`ratio` of them compliant) under `output`,
+    `shard_size` documents per task, across `workers` processes.
+    Returns the seed used, so an unseeded run can be reproduced.
+    """
+    if seed is None:
+        seed = random.randrange(2 ** 32)
+    workers = workers or os.cpu_count() or 1
+
+    os.makedirs(output, exist_ok=True)
+    if fmt == "files":
+        os.makedirs(os.path.join(output, "compliant"), exist_ok=True)
+        os.makedirs(os.path.join(output, "non_compliant"), exist_ok=True)
+
+    options = {"seed": seed, "ratio": ratio, "output": output, "format": fmt, "pool_size": pool_size}
+    jobs = [
+        (shard, start, min(start + shard_size, count), options)
+        for shard, start in enumerate(range(0, count, shard_size))
+    ]
+
+    if workers == 1 or len(jobs) <= 1:
+        for job in jobs:
+            generate_shard(job)
+    else:
+        written = 0
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for done in pool.map(generate_shard, jobs):
+                written += done
+                print(f"  ... {written}/{count} documents")
+    return seed
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate synthetic compliant and non-compliant DITA topics.")
+    parser.add_argument("--count", type=int, default=20, help="Total number of documents (default: 20)")
+    parser.add_argument("--ratio", type=float, default=0.5, help="Fraction of compliant documents (default: 0.5)")
+    parser.add_argument("--seed", type=int, help="Seed for reproducible output (default: random)")
+    parser.add_argument("--output", default="sample_data", help="Output directory (default: sample_data)")
+    parser.add_argument("--workers", type=int, help="Generator processes (default: number of CPUs)")
+    parser.add_argument("--format", choices=["files", "tar", "jsonl"], default="files",
+                        help="Loose .dita files, or one tar/JSONL archive per shard")
+    parser.add_argument("--shard-size", type=int, default=10000, help="Documents per shard/task (default: 10000)")
+    parser.add_argument("--pool-size", type=int, default=1000,
+                        help="Pre-generated values per Faker call; 0 calls Faker for every field")
+    args = parser.parse_args()
+
+    if not 0.0 <= args.ratio <= 1.0:
+        parser.error("--ratio must be between 0 and 1")
+    if args.count < 0 or args.shard_size < 1:
+        parser.error("--count must be >= 0 and --shard-size >= 1")
+
+    seed = populate(args.count, args.ratio, args.seed, args.output, args.workers,
+                    args.format, args.shard_size, args.pool_size)
+    print(f"Done populating {args.output} with {args.count} DITA documents (seed {seed}).")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,14 +1,17 @@
 import os
+import io
 import shutil
+import time
 import pickle
 import unittest
 import glob
+import zipfile
 from lxml import etree
 from sklearn.feature_extraction.text import CountVectorizer
 from sklearn.linear_model import LogisticRegression
 
 # Import the functions you want to test
-from backend.train_model import extract_text_from_xml, load_data, train
+from backend.train_model import CorpusReport, extract_text_from_xml, iter_corpus, load_data, train, train_incremental
 
 class TestDITAProcessing(unittest.TestCase):
 
@@ -29,6 +32,46 @@ class TestDITAProcessing(unittest.TestCase):
         extracted_text_invalid = extract_text_from_xml(xml_content_with_invalid_syntax)
         self.assertEqual(extracted_text_invalid, "") # Should return empty string for invalid XML
 
+    def test_extract_text_from_non_utf8_bytes(self):
+        xml_content = '<?xml version="1.0" encoding="ISO-8859-1"?><concept><title>Caf\xe9</title></concept>'
+        extracted_text = extract_text_from_xml(xml_content.encode("iso-8859-1"))
+        self.assertEqual(extracted_text, "Caf\xe9")
+
+    def test_dtd_catalog_serves_local_dtds(self):
+        import tempfile
+        import backend.parsing as parsing
+        document = (b'<!DOCTYPE concept PUBLIC "-//OASIS//DTD DITA Concept//EN" "http://docs.oasis-open.org/dita/concept.dtd">'
+                    b'<concept id="c"><title>&product; guide</title></concept>')
+
+        with tempfile.TemporaryDirectory() as tmp:
+            os.makedirs(os.path.join(tmp, "base"))
+            with open(os.path.join(tmp, "concept.dtd"), "w") as f:
+                f.write('<!ENTITY % names SYSTEM "names.ent"> %names;\n'
+                        '<!ATTLIST concept class CDATA "- topic/topic concept/concept ">\n')
+            with open(os.path.join(tmp, "base", "names.ent"), "w") as f:
+                f.write('<!ENTITY product "Widget">\n')
+
+            catalog = parsing.DTDCatalog(tmp)
+            original = parsing.DITA_LOAD_DTD, parsing.dtd_catalog
+            parsing.DITA_LOAD_DTD, parsing.dtd_catalog = True, catalog
+            try:
+                root = etree.fromstring(document, parsing.new_parser())
+                self.assertEqual(root.get("class"), "- topic/topic concept/concept ")
+                self.assertEqual(parsing.extract_text(root), "Widget guide")
+
+                # DTDs are read once, then served from memory
+                shutil.rmtree(os.path.join(tmp, "base"))
+                root = etree.fromstring(document, parsing.new_parser())
+                self.assertEqual(parsing.extract_text(root), "Widget guide")
+            finally:
+                parsing.DITA_LOAD_DTD, parsing.dtd_catalog = original
+
+        # By default DOCTYPEs are not loaded and nothing outside the document is expanded
+        root = parsing.parse_dita(b'<concept id="c"><title>Guide</title></concept>')
+        self.assertIsNone(root.get("class"))
+        with self.assertRaises(etree.XMLSyntaxError):
+            parsing.parse_dita(b'<!DOCTYPE c [<!ENTITY f SYSTEM "/etc/hostname">]><c>&f;</c>')
+
     def test_load_data(self):
         # Test with real data (assuming data directory exists)
         if not os.path.exists(self.DATA_DIR):
@@ -41,6 +84,69 @@ class TestDITAProcessing(unittest.TestCase):
         X_test, y_test = load_data(self.TEST_DATA_DIR)
         self.assertEqual(len(X_test), 0)  # No data in the empty test directory
 
+    def test_iter_corpus_records_unparseable_files(self):
+        report = CorpusReport()
+        parallel = list(iter_corpus(self.DATA_DIR, workers=2, chunksize=3, report=report))
+        serial = list(iter_corpus(self.DATA_DIR, workers=1))
+        self.assertEqual(parallel, serial)
+        self.assertEqual(report.files, report.loaded + len(report.failures))
+        self.assertEqual(report.loaded, len(parallel))
+        self.assertIn("data/non_compliant/bad_6.dita", [path for path, _ in report.failures])
+        self.assertNotIn("", [text for text, _ in parallel])
+
+    def test_iter_corpus_reads_shards(self):
+        import tempfile
+        from populate_data import populate
+
+        with tempfile.TemporaryDirectory() as tmp:
+            corpora = {}
+            for fmt in ("files", "tar", "jsonl"):
+                output = os.path.join(tmp, fmt)
+                populate(count=6, seed=1, output=output, workers=1, fmt=fmt, shard_size=4)
+                report = CorpusReport()
+                corpora[fmt] = list(iter_corpus(output, workers=1, report=report))
+                self.assertEqual(report.files, 6)
+            self.assertGreater(len(corpora["files"]), 0)
+            # Shards yield the same documents and labels as loose files
+            self.assertEqual(sorted(corpora["tar"]), sorted(corpora["files"]))
+            self.assertEqual(corpora["jsonl"], corpora["tar"])
+
+            X, y = load_data(os.path.join(tmp, "jsonl"), workers=2)
+            self.assertEqual(list(zip(X, y)), corpora["jsonl"])
+
+    def test_feature_store_only_extracts_changed_files(self):
+        import tempfile
+        from backend.feature_store import FeatureStore
+
+        with tempfile.TemporaryDirectory() as tmp:
+            data_path = os.path.join(tmp, "data")
+            shutil.copytree(self.DATA_DIR, data_path)
+            store = FeatureStore(os.path.join(tmp, "features.sqlite"))
+            expected = list(iter_corpus(data_path, workers=1))
+
+            def run(workers=1):
+                report = CorpusReport()
+                pairs = list(iter_corpus(data_path, workers=workers, chunksize=3, report=report, store=store))
+                return pairs, report
+
+            first, report = run()
+            self.assertEqual((first, report.cached), (expected, 0))
+            second, report = run(workers=2)
+            self.assertEqual((second, report.cached), (expected, report.files))
+
+            # A rewritten file is re-extracted; a touched but identical one is not
+            changed = os.path.join(data_path, "compliant", "good_1.dita")
+            with open(changed, "w") as f:
+                f.write("<concept id='c'><title>Rewritten topic</title></concept>")
+            touched = os.path.join(data_path, "compliant", "good_2.dita")
+            os.utime(touched, ns=(0, 0))
+            os.remove(os.path.join(data_path, "compliant", "good_3.dita"))
+            third, report = run()
+            self.assertEqual(third, list(iter_corpus(data_path, workers=1)))
+            self.assertEqual(report.cached, report.files - 1)
+            self.assertEqual(len(store), report.files)
+            store.close()
+
     def test_training(self):
         train(self.DATA_DIR)
 
@@ -59,10 +165,808 @@ class TestDITAProcessing(unittest.TestCase):
         prediction = model.predict(features)
         self.assertIn(prediction[0], [0,1]) # Very basic check, the data is too small to be accurate
 
+    def test_cross_validated_search_writes_metrics_report(self):
+        import json
+        import tempfile
+        from backend.model import load_scorer
+
+        with tempfile.TemporaryDirectory() as tmp:
+            train(self.DATA_DIR, models_dir=tmp, search=True, folds=3, workers=2)
+            with open(os.path.join(tmp, "metrics.json")) as f:
+                report = json.load(f)
+            with open(os.path.join(tmp, "vectorizer.pkl"), "rb") as f:
+                vectorizer = pickle.load(f)
+
+            self.assertEqual(report["folds"], 3)
+            self.assertEqual(len(report["candidates"]), 18)
+            selected = report["selected"]
+            for name in ("accuracy", "roc_auc", "brier", "calibration_error", "fit_seconds", "latency_ms"):
+                self.assertIn(name, selected["mean"])
+            self.assertEqual(vectorizer.min_df, selected["vectorizer"]["min_df"])
+            self.assertEqual(report["final"]["model_version"], load_scorer(tmp).version)
+            self.assertGreater(report["final"]["artifact_bytes"], 0)
+
+    def test_near_duplicates_are_dropped_or_down_weighted(self):
+        from backend.dedup import DedupReport, deduplicate
+        boilerplate = " ".join(f"clause{number}" for number in range(60))
+        template = "Install the {} package before configuring the server. " + boilerplate
+        texts = [template.format(name) for name in ("alpha", "beta", "gamma")]
+        texts += ["A completely different topic about billing cycles and invoices sent each month.", texts[0]]
+        labels = [1, 1, 1, 1, 0]
+
+        report = DedupReport()
+        kept, kept_labels, weights = deduplicate(texts, labels, report=report)
+        # The templated copies collapse into one; the copy with another label is kept
+        self.assertEqual(kept, [texts[0], texts[3], texts[0]])
+        self.assertEqual(kept_labels, [1, 1, 0])
+        self.assertIsNone(weights)
+        self.assertEqual((report.documents, report.clusters, report.removed, report.largest_cluster), (5, 3, 2, 3))
+
+        _, _, weights = deduplicate(texts, labels, mode="weight")
+        self.assertEqual(weights, [1 / 3, 1 / 3, 1 / 3, 1.0, 1.0])
+
+    def test_incremental_training(self):
+        from sklearn.feature_extraction.text import HashingVectorizer
+        from sklearn.linear_model import SGDClassifier
+
+        models_dir = os.path.join(self.TEST_DATA_DIR, "incremental_models")
+        train_incremental(self.DATA_DIR, n_features=2 ** 12, batch_size=4, epochs=2, models_dir=models_dir)
+        self.assertFalse(os.path.exists(os.path.join(models_dir, "checkpoint.pkl")))
+
+        with open(os.path.join(models_dir, "vectorizer.pkl"), "rb") as f:
+            vectorizer = pickle.load(f)
+        with open(os.path.join(models_dir, "model.pkl"), "rb") as f:
+            model = pickle.load(f)
+        self.assertIsInstance(vectorizer, HashingVectorizer)
+        self.assertIsInstance(model, SGDClassifier)
+        self.assertEqual(model.coef_.shape, (1, 2 ** 12))
+        probabilities = model.predict_proba(vectorizer.transform(["Another test paragraph."]))
+        self.assertEqual(probabilities.shape, (1, 2))
+
+    def test_incremental_training_deduplicates_batches(self):
+        models_dir = os.path.join(self.TEST_DATA_DIR, "incremental_dedup_models")
+        report = train_incremental(self.DATA_DIR, n_features=2 ** 12, batch_size=4, epochs=1,
+                                   models_dir=models_dir, dedup="weight")
+        self.assertGreater(report.documents, 0)
+        self.assertEqual(report.removed, 0)
+        self.assertIsNone(train_incremental(self.DATA_DIR, n_features=2 ** 12, batch_size=4, epochs=1,
+                                            models_dir=models_dir))
+
     @classmethod
     def tearDownClass(cls):
         # Clean up test data (optional)
         shutil.rmtree(cls.TEST_DATA_DIR, ignore_errors=True)  # Ignore if it doesn't exist
 
+class TestRuleEngine(unittest.TestCase):
+
+    def test_rule_based_checks(self):
+        from backend.rules import perform_rule_based_checks
+        root = etree.fromstring(
+            b'<task><shortdesc> </shortdesc><concept id="a"/><p id="a"/></task>'
+        )
+        self.assertEqual(perform_rule_based_checks(root), [
+            "Root element <task> is missing the 'id' attribute.",
+            "Shortdesc element is empty.",
+            "Concept element is missing a <title>.",
+            "Duplicate id 'a' on <p>.",
+            "Task element is missing a <title>.",
+            "Task element is missing a <taskbody>.",
+        ])
+
+    def test_rules_share_a_single_walk(self):
+        from backend.rules import RuleEngine
+        engine = RuleEngine()
+        visited = []
+
+        @engine.rule("p", "li")
+        def record(element, context):
+            visited.append(element.tag)
+
+        root = etree.fromstring(b"<concept><p/><ul><li/><li/></ul><p/></concept>")
+        self.assertEqual(engine.check(root), [])
+        self.assertEqual(visited, ["p", "li", "li", "p"])
+
+class TestStreamingValidation(unittest.TestCase):
+
+    def test_streaming_matches_tree_validation(self):
+        from backend.model import DITAModel, LinearScorer
+        from backend.parsing import extract_text, parse_dita
+        from backend.rules import perform_rule_based_checks
+        from backend.streaming import StreamingValidator
+
+        body = "".join(f"<p id='p{i}'>para {i} <b>bold</b> tail {i}<!-- c -->after</p>" for i in range(200))
+        generated = f"<concept id='big'><title>Big</title><conbody>{body}<p id='p7'/></conbody></concept>".encode()
+        documents = [generated] + [open(path, "rb").read() for path in sorted(glob.glob("data/*/*.dita"))]
+
+        sklearn_model = DITAModel("models")
+        scorer = LinearScorer.load("models/artifact")
+
+        for content in documents:
+            try:
+                root_element = parse_dita(content)
+            except etree.XMLSyntaxError:
+                continue
+            text = extract_text(root_element)
+            for features, expected in [(sklearn_model.features, lambda f: (f != sklearn_model.features(text)).nnz == 0),
+                                       (scorer.features, lambda f: f == scorer.features(text))]:
+                validator = StreamingValidator(features, flush_chars=100)
+                for start in range(0, len(content), 97):
+                    validator.feed(content[start:start + 97])
+                validator.close()
+
+                self.assertEqual(validator.errors, perform_rule_based_checks(root_element))
+                self.assertTrue(expected(validator.features))
+
+    def test_structural_features_match_in_streaming_mode(self):
+        import re
+        import tempfile
+        from collections import Counter
+        from backend.artifact import export_artifact
+        from backend.model import LinearScorer
+        from backend.parsing import extract_features, extract_text, parse_dita, structure_tokens
+        from backend.streaming import StreamingValidator
+
+        documents = []
+        for path in sorted(glob.glob("data/*/*.dita")):
+            try:
+                documents.append((open(path, "rb").read(), parse_dita(open(path, "rb").read())))
+            except etree.XMLSyntaxError:
+                continue
+
+        # One walk yields the same words as extract_text, plus the markup tokens
+        content, root_element = documents[0]
+        words = lambda text: Counter(re.findall(r"(?u)\b\w\w+\b", text))
+        structure = [token for element in root_element.iter(tag=etree.Element) for token in structure_tokens(element)]
+        self.assertEqual(words(extract_features(root_element)), words(extract_text(root_element)) + Counter(structure))
+        self.assertIn(f"xpath_{root_element.tag}_title", structure)
+
+        vectorizer = CountVectorizer()
+        vectorizer.structural = True
+        model = LogisticRegression().fit(vectorizer.fit_transform([extract_features(r) for _, r in documents]),
+                                         [i % 2 for i in range(len(documents))])
+        with tempfile.TemporaryDirectory() as tmp:
+            export_artifact(vectorizer, model, tmp)
+            scorer = LinearScorer.load(tmp, mmap=False)
+        self.assertTrue(scorer.structural)
+
+        for content, root_element in documents:
+            validator = StreamingValidator(scorer.features, flush_chars=50, structural=True)
+            for start in range(0, len(content), 61):
+                validator.feed(content[start:start + 61])
+            validator.close()
+            self.assertEqual(validator.features, scorer.features(scorer.extract(root_element)))
+
+class TestModelArtifact(unittest.TestCase):
+
+    def test_export_round_trip(self):
+        import tempfile
+        import numpy as np
+        from backend.artifact import ArtifactError, export_pickles, load_artifact
+
+        with open("models/vectorizer.pkl", "rb") as f:
+            vectorizer = pickle.load(f)
+        with open("models/model.pkl", "rb") as f:
+            model = pickle.load(f)
+
+        with tempfile.TemporaryDirectory() as tmp:
+            header = export_pickles("models", tmp)
+            artifact = load_artifact(tmp, verify=True)
+            self.assertEqual(artifact.version, header["version"])
+            self.assertIsInstance(artifact.coef, np.memmap)
+            tokens = [artifact.token(index) for index in range(len(artifact.offsets) - 1)]
+            self.assertEqual(tokens, sorted(token.encode("utf-8") for token in vectorizer.vocabulary_))
+            # Tokens are stored back to back, not padded to the longest one
+            self.assertEqual(artifact.vocabulary.nbytes, sum(len(token) for token in tokens))
+            for token, column in list(vectorizer.vocabulary_.items())[:50]:
+                index = tokens.index(token.encode("utf-8"))
+                self.assertEqual(artifact.coef[index], model.coef_[0][column])
+
+            with open(os.path.join(tmp, "coef.npy"), "r+b") as f:
+                f.seek(-1, os.SEEK_END)
+                f.write(b"\x01")
+            with self.assertRaises(ArtifactError):
+                load_artifact(tmp, verify=True)
+
+class TestLinearScorer(unittest.TestCase):
+
+    TEXTS = [
+        "",
+        "Another test paragraph.",
+        "Caf\xe9 na\xefve \u00fcber STRA\u00dfE test test TEST a b",
+    ]
+
+    def corpus_texts(self):
+        from backend.parsing import extract_text_from_xml
+        return self.TEXTS + [extract_text_from_xml(open(p, "rb").read()) for p in sorted(glob.glob("data/*/*.dita"))]
+
+    def test_parity_with_sklearn_pipeline(self):
+        import tempfile
+        from backend.artifact import export_pickles
+        from backend.model import DITAModel, LinearScorer
+
+        texts = self.corpus_texts()
+        with tempfile.TemporaryDirectory() as tmp:
+            export_pickles("models", tmp)
+            scorer = LinearScorer.load(tmp)
+            expected = DITAModel("models").score_texts(texts)
+            for actual, wanted in zip(scorer.score_texts(texts), expected):
+                self.assertAlmostEqual(actual, wanted, places=12)
+
+    def test_parity_with_hashing_pipeline(self):
+        import tempfile
+        from sklearn.feature_extraction.text import HashingVectorizer
+        from sklearn.linear_model import SGDClassifier
+        from backend.artifact import export_artifact
+        from backend.model import LinearScorer
+
+        texts = self.corpus_texts()
+        vectorizer = HashingVectorizer(n_features=2 ** 10, alternate_sign=False, norm=None)
+        model = SGDClassifier(loss="log_loss", random_state=0)
+        model.fit(vectorizer.transform(texts), [i % 2 for i in range(len(texts))])
+
+        with tempfile.TemporaryDirectory() as tmp:
+            export_artifact(vectorizer, model, tmp)
+            scorer = LinearScorer.load(tmp)
+            expected = model.predict_proba(vectorizer.transform(texts))[:, 1]
+            for actual, wanted in zip(scorer.score_texts(texts), expected):
+                self.assertAlmostEqual(actual, wanted, places=12)
+
+    def test_batch_scoring_matches_single_documents(self):
+        import tempfile
+        from sklearn.feature_extraction.text import HashingVectorizer
+        from backend.artifact import export_artifact
+        from backend.model import LinearScorer
+
+        texts = self.corpus_texts()
+        labels = [i % 2 for i in range(len(texts))]
+        vectorizers = [
+            CountVectorizer(), CountVectorizer(binary=True),
+            HashingVectorizer(n_features=2 ** 4, alternate_sign=False, norm=None, binary=True),
+        ]
+        for vectorizer in vectorizers:
+            model = LogisticRegression(max_iter=1000).fit(vectorizer.fit_transform(texts), labels)
+            with tempfile.TemporaryDirectory() as tmp:
+                export_artifact(vectorizer, model, tmp)
+                scorer = LinearScorer.load(tmp)
+                batch = scorer.score_texts(texts)
+                self.assertEqual(len(batch), len(texts))
+                for text, probability in zip(texts, batch):
+                    self.assertAlmostEqual(probability, scorer.score_features(scorer.features(text)), places=12)
+        self.assertEqual(scorer.score_texts([]), [])
+
+    def test_vocabulary_lookup(self):
+        import tempfile
+        from backend.artifact import export_artifact
+        from backend.model import LinearScorer
+
+        long_token = "x" * 500
+        texts = ["a ab abc abd b ba \u00e9t\u00e9 z " + long_token, "ab abc zz"]
+        vectorizer = CountVectorizer(token_pattern=r"(?u)\b\w+\b")
+        model = LogisticRegression().fit(vectorizer.fit_transform(texts), [1, 0])
+        with tempfile.TemporaryDirectory() as tmp:
+            export_artifact(vectorizer, model, tmp)
+            scorer = LinearScorer.load(tmp)
+            tokens = [scorer.artifact.token(column) for column in range(len(vectorizer.vocabulary_))]
+            queries = ["abc", "ab", "a", "aa", "abe", "\u00e9t\u00e9", long_token, long_token + "x", "zzz", "zz", ""]
+            columns = scorer._columns(queries).tolist()
+            for query, column in zip(queries, columns):
+                if query in vectorizer.vocabulary_:
+                    self.assertEqual(tokens[column], query.encode("utf-8"))
+                else:
+                    self.assertEqual(column, -1)
+
+class TestModelRegistry(unittest.TestCase):
+
+    def test_publish_activate_and_hot_reload(self):
+        import tempfile
+        from sklearn.feature_extraction.text import HashingVectorizer
+        from sklearn.linear_model import SGDClassifier
+        from backend.artifact import export_artifact
+        from backend.registry import LiveScorer, ModelRegistry
+
+        with tempfile.TemporaryDirectory() as tmp:
+            registry = ModelRegistry(os.path.join(tmp, "registry"))
+            live = LiveScorer(registry, "models")
+            original = live.version
+            self.assertFalse(live.reload())  # nothing published yet
+
+            first = registry.publish("models")
+            self.assertEqual(first, original)
+            self.assertFalse(live.reload())
+
+            retrained_dir = os.path.join(tmp, "retrained")
+            vectorizer = HashingVectorizer(n_features=2 ** 8, alternate_sign=False, norm=None)
+            model = SGDClassifier(loss="log_loss", random_state=0)
+            model.fit(vectorizer.transform(["good topic", "bad topic"]), [1, 0])
+            export_artifact(vectorizer, model, os.path.join(retrained_dir, "artifact"))
+
+            in_flight = live.current
+            second = registry.publish(retrained_dir)
+            self.assertEqual(registry.versions(), sorted([first, second]))
+            self.assertEqual(registry.current_version(), second)
+            self.assertTrue(live.reload())
+            self.assertEqual(live.version, second)
+            self.assertEqual(in_flight.version, first)  # old scorer still usable
+
+            registry.activate(first)
+            self.assertTrue(live.reload())
+            self.assertEqual(live.version, first)
+
+    def test_watching_can_be_restarted(self):
+        import tempfile
+        from backend.registry import LiveScorer, ModelRegistry
+
+        with tempfile.TemporaryDirectory() as tmp:
+            live = LiveScorer(ModelRegistry(os.path.join(tmp, "registry")), "models")
+            for _ in range(2):
+                live.start_watching(0.01)
+                watcher = live._watcher
+                self.assertTrue(watcher.is_alive())
+                live.stop_watching()
+                self.assertFalse(watcher.is_alive())
+                self.assertIsNone(live._watcher)
+            live.stop_watching()  # not watching: nothing to do
+
+class TestValidationAPI(unittest.TestCase):
+
+    GOOD_FILE = "data/compliant/good_1.dita"
+    BAD_FILE = "data/non_compliant/bad_1.dita"
+
+    @classmethod
+    def setUpClass(cls):
+        from fastapi.testclient import TestClient
+        from backend.app import app
+        cls.client = TestClient(app)
+
+    def read(self, path):
+        with open(path, "rb") as f:
+            return f.read()
+
+    def test_batch_matches_single_validation(self):
+        paths = [self.GOOD_FILE, self.BAD_FILE]
+        files = [("files", (os.path.basename(p), self.read(p))) for p in paths]
+        files.append(("files", ("broken.dita", b"<concept><title>x</concept>")))
+        response = self.client.post("/validate/batch", files=files)
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+
+        self.assertEqual([r["filename"] for r in results], ["good_1.dita", "bad_1.dita", "broken.dita"])
+        self.assertIn("Invalid XML", results[2]["error"])
+        for path, result in zip(paths, results):
+            single = self.client.post("/validate", files={"file": (path, self.read(path))}).json()
+            if "error" in single:
+                self.assertIn("error", result)
+                continue
+            self.assertEqual(result["errors"], single["errors"])
+            self.assertAlmostEqual(result["compliance_probability"], single["compliance_probability"])
+
+    def test_batch_expands_zip_archive(self):
+        buffer = io.BytesIO()
+        with zipfile.ZipFile(buffer, "w") as archive:
+            archive.writestr("topics/a.dita", self.read(self.GOOD_FILE))
+            archive.writestr("topics/readme.txt", "not a topic")
+            archive.writestr("topics/b.dita", self.read(self.GOOD_FILE))
+        files = [("files", ("topics.zip", buffer.getvalue()))]
+        results = self.client.post("/validate/batch", files=files).json()["results"]
+        self.assertEqual([r["filename"] for r in results], ["topics/a.dita", "topics/b.dita"])
+        self.assertEqual(results[0]["compliance_probability"], results[1]["compliance_probability"])
+
+    def test_streaming_mode_matches_in_memory_mode(self):
+        for path in [self.GOOD_FILE, self.BAD_FILE, "data/non_compliant/bad_6.dita"]:
+            content = self.read(path)
+            single = self.client.post("/validate", files={"file": ("a.dita", content)}).json()
+            # A trailing comment changes the cache key but not the result
+            streamed_content = content + b"<!-- streamed -->"
+            streamed = self.client.post("/validate?stream=true", files={"file": ("a.dita", streamed_content)}).json()
+            self.assertEqual(single.keys(), streamed.keys())
+            if "error" in single:
+                continue
+            self.assertEqual(single["errors"], streamed["errors"])
+            self.assertAlmostEqual(single["compliance_probability"], streamed["compliance_probability"])
+
+    def test_response_reports_model_version(self):
+        from backend import app as app_module
+        result = self.client.post("/validate", files={"file": ("a.dita", self.read(self.GOOD_FILE))}).json()
+        self.assertEqual(result["model_version"], app_module.live_scorer.version)
+        self.assertEqual(self.client.get("/models").json()["serving"], result["model_version"])
+
+    def test_metrics_and_server_timing(self):
+        content = self.read(self.GOOD_FILE) + b"<!-- timing test -->"
+        response = self.client.post("/validate?timing=true", files={"file": ("a.dita", content)})
+        stages = [part.split(";")[0] for part in response.headers["Server-Timing"].split(", ")]
+        self.assertEqual(stages, ["read", "cache", "parse", "rules", "extract", "vectorize", "score"])
+        self.client.post("/validate", files={"file": ("bad.dita", b"<concept>")})
+
+        metrics = self.client.get("/metrics")
+        self.assertTrue(metrics.headers["content-type"].startswith("text/plain"))
+        text = metrics.text
+        self.assertRegex(text, r'dita_requests_total\{endpoint="validate"\} \d+')
+        self.assertRegex(text, r'dita_errors_total\{type="invalid_xml"\} \d+')
+        self.assertIn('dita_stage_seconds_bucket{stage="parse",le="+Inf"}', text)
+        self.assertIn("dita_upload_bytes_count", text)
+        self.assertIn("dita_cache_hits_total", text)
+
+    def test_saturated_pool_returns_503(self):
+        import threading
+        from backend import app as app_module
+        from backend.workers import ValidationPool
+
+        pool = ValidationPool(max_workers=1, max_pending=1)
+        release = threading.Event()
+        blocker = pool.submit(release.wait)
+        original_pool, app_module.validation_pool = app_module.validation_pool, pool
+        try:
+            response = self.client.post("/validate", files={"file": ("a.dita", self.read(self.GOOD_FILE))})
+            self.assertEqual(response.status_code, 503)
+            self.assertIn("Retry-After", response.headers)
+            self.assertEqual(self.client.get("/").status_code, 200)
+        finally:
+            release.set()
+            blocker.result()
+            app_module.validation_pool = original_pool
+            pool.shutdown()
+        self.assertEqual(pool.pending, 0)
+
+    def test_repeated_upload_hits_result_cache(self):
+        content = self.read(self.GOOD_FILE) + b"<!-- cache test -->"
+        before = self.client.get("/cache/stats").json()
+        first = self.client.post("/validate", files={"file": ("a.dita", content)}).json()
+        second = self.client.post("/validate", files={"file": ("b.dita", content)}).json()
+        after = self.client.get("/cache/stats").json()
+        self.assertEqual(first, second)
+        self.assertEqual(after["misses"] - before["misses"], 1)
+        self.assertEqual(after["hits"] - before["hits"], 1)
+
+    def test_bulk_job_lifecycle_and_restart(self):
+        import tempfile
+        import time
+        import backend.app as app_module
+        from backend.jobs import JobQueue
+
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("a.dita", self.read(self.GOOD_FILE))
+            zf.writestr("b.dita", b"<concept><title>x</concept>")
+        files = [("files", ("good_1.dita", self.read(self.GOOD_FILE))), ("files", ("docs.zip", archive.getvalue()))]
+
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "jobs.sqlite")
+            # A queue without workers only persists jobs, like a server that went down
+            original, app_module.job_queue = app_module.job_queue, JobQueue(db_path, app_module.validate_uploads, workers=0)
+            try:
+                response = self.client.post("/jobs", files=files)
+                self.assertEqual(response.status_code, 202)
+                job = response.json()
+                self.assertEqual((job["status"], job["total"], job["done"]), ("queued", 3, 0))
+
+                # After a "restart", the job is resumed and finished
+                app_module.job_queue = JobQueue(db_path, app_module.validate_uploads, workers=1, chunk_size=2)
+                app_module.job_queue.start()
+                for _ in range(200):
+                    status = self.client.get(f"/jobs/{job['id']}").json()
+                    if status["status"] == "done":
+                        break
+                    time.sleep(0.05)
+                self.assertEqual((status["status"], status["done"], status["next_offset"]), ("done", 3, None))
+                self.assertEqual([r["filename"] for r in status["results"]], ["good_1.dita", "a.dita", "b.dita"])
+                self.assertIn("Invalid XML", status["results"][2]["error"])
+
+                page = self.client.get(f"/jobs/{job['id']}", params={"offset": 1, "limit": 1}).json()
+                self.assertEqual(([r["filename"] for r in page["results"]], page["next_offset"]), (["a.dita"], 2))
+
+                events = self.client.get(f"/jobs/{job['id']}/events", headers={"Last-Event-ID": "0"}).text
+                self.assertEqual(events.count("event: result"), 2)
+                self.assertIn("id: 2\n", events)
+                self.assertTrue(events.rstrip().split("\n\n")[-1].startswith("event: done"))
+
+                self.assertEqual(self.client.delete(f"/jobs/{job['id']}").status_code, 200)
+                self.assertEqual(self.client.get(f"/jobs/{job['id']}").status_code, 404)
+            finally:
+                app_module.job_queue.stop()
+                app_module.job_queue = original
+
+    def test_finished_jobs_are_purged_after_retention(self):
+        import tempfile
+        import time
+        from backend.jobs import JobQueue
+
+        with tempfile.TemporaryDirectory() as tmp:
+            queue = JobQueue(os.path.join(tmp, "jobs.sqlite"), lambda files: [], workers=0, retention=60)
+            old = queue.submit([("old.dita", b"<concept/>")])["id"]
+            recent = queue.submit([("recent.dita", b"<concept/>")])["id"]
+            pending = queue.submit([("pending.dita", b"<concept/>")])["id"]
+            now = time.time()
+            for job_id, finished in ((old, now - 120), (recent, now - 30)):
+                queue._db.execute("UPDATE jobs SET status = 'done', finished = ? WHERE id = ?", (finished, job_id))
+            queue._db.commit()
+
+            self.assertEqual(queue._claim(), pending)
+            self.assertIsNone(queue.status(old))
+            self.assertEqual(queue._db.execute("SELECT COUNT(*) FROM job_files WHERE job_id = ?", (old,)).fetchone(), (0,))
+            self.assertEqual(queue.status(recent)["status"], "done")
+
+    def test_oversized_and_malformed_uploads_are_rejected_early(self):
+        from fastapi import FastAPI, Request
+        from fastapi.testclient import TestClient
+        import backend.app as app_module
+        import backend.parsing as parsing
+        from backend.limits import BodySizeLimit
+
+        # Bodies over the limit get 413, whether or not they declare their length
+        small = FastAPI()
+        small.add_middleware(BodySizeLimit, max_bytes=1000)
+
+        @small.post("/upload")
+        async def upload(request: Request):
+            return {"bytes": len(await request.body())}
+
+        client = TestClient(small)
+        self.assertEqual(client.post("/upload", content=b"x" * 2000).status_code, 413)
+        self.assertEqual(client.post("/upload", content=iter([b"x" * 600] * 2)).status_code, 413)
+        self.assertEqual(client.post("/upload", content=b"x" * 100).status_code, 200)
+
+        result = self.client.post("/validate", files={"file": ("a.dita", b"<concept id='c'>\n<p>x</concept>")}).json()
+        self.assertIn("Invalid XML", result["error"])
+        self.assertEqual((result["line"], result["column"]), (2, 15))
+
+        laughs = b'<!DOCTYPE c [<!ENTITY a "aaaaaaaaaa">' + b"".join(
+            b'<!ENTITY a%d "%s">' % (i, b"&a%s;" % (b"%d" % (i - 1) if i > 1 else b"") * 10) for i in range(1, 10)
+        ) + b"]><c>&a9;</c>"
+        self.assertIn("amplification", self.client.post("/validate", files={"file": ("a.dita", laughs)}).json()["error"])
+
+        original = parsing.MAX_XML_ELEMENTS
+        parsing.MAX_XML_ELEMENTS = 100
+        try:
+            large = b"<concept id='c'><title>t</title>" + b"<p>x</p>" * 200 + b"</concept>"
+            for stream in ("false", "true"):
+                result = self.client.post("/validate", files={"file": ("a.dita", large)}, params={"stream": stream}).json()
+                self.assertEqual(result["error"], "Document too large: Document has more than 100 elements.")
+        finally:
+            parsing.MAX_XML_ELEMENTS = original
+
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("bomb.dita", b"<c>" + b" " * 100000 + b"</c>")
+        original = app_module.MAX_DOCUMENT_BYTES
+        app_module.MAX_DOCUMENT_BYTES = 10000
+        try:
+            results = self.client.post("/validate/batch", files=[("files", ("docs.zip", archive.getvalue()))]).json()
+            self.assertIn("bomb.dita is larger than 10000 bytes", results["results"][0]["error"])
+
+            # Plain files get the same limit on every endpoint, not only /validate
+            big = b"<concept id='c'><title>" + b"t" * 20000 + b"</title></concept>"
+            self.assertEqual(self.client.post("/validate", files={"file": ("big.dita", big)}).status_code, 413)
+            results = self.client.post("/validate/batch", files=[("files", ("big.dita", big))]).json()
+            self.assertEqual(results["results"][0]["error"], "Document too large: big.dita is larger than 10000 bytes uncompressed.")
+            self.assertNotIn("compliance_probability", results["results"][0])
+            self.assertIn("Document too large", self.client.post("/validate/map", files={"file": ("big.dita", big)}).json()["error"])
+        finally:
+            app_module.MAX_DOCUMENT_BYTES = original
+
+    def test_map_validation_checks_references_and_reuses_topics(self):
+        from backend.maps import TopicMemo
+
+        archive = io.BytesIO()
+        with zipfile.ZipFile(archive, "w") as zf:
+            zf.writestr("maps/root.ditamap",
+                        '<map><title>Guide</title><topicref href="../topics/a.dita#a"/>'
+                        '<topicref href="../topics/missing.dita"/><topicref href="../topics/a.dita#nope"/>'
+                        '<mapref href="sub.ditamap"/><topicref href="https://example.com/x.dita" scope="external"/></map>')
+            zf.writestr("maps/sub.ditamap", '<map><topicref href="../topics/b.dita"/><topicref href="../topics/a.dita"/></map>')
+            zf.writestr("topics/a.dita", '<concept id="a"><title>A</title><conbody><p id="p1">Text</p></conbody></concept>')
+            zf.writestr("topics/b.dita", '<concept id="a"><title>B</title><conbody><p>'
+                                         '<xref href="a.dita#a/p1"/><xref href="a.dita#a/p2"/></p></conbody></concept>')
+        files = {"file": ("docs.zip", archive.getvalue())}
+
+        import backend.app as app_module
+        original, app_module.topic_memo = app_module.topic_memo, TopicMemo()
+        try:
+            report = self.client.post("/validate/map", files=files).json()
+            self.assertEqual([m["map"] for m in report["maps"]], ["maps/root.ditamap", "maps/sub.ditamap"])
+            self.assertEqual((report["topics_parsed"], report["topics_reused"]), (2, 0))
+            root = report["maps"][0]
+            self.assertEqual([t["filename"] for t in root["topics"]], ["topics/a.dita", "topics/b.dita"])
+            self.assertIn("compliance_probability", root["topics"][0])
+            errors = "\n".join(root["errors"])
+            self.assertIn("Broken reference '../topics/missing.dita'", errors)
+            self.assertIn("no topic with id 'nope'", errors)
+            self.assertIn("no element with id 'p2'", errors)
+            self.assertNotIn("'p1'", errors)
+            self.assertIn("Duplicate topic id 'a'", errors)
+            self.assertNotIn("example.com", errors)
+
+            # Unchanged topics are not parsed again
+            report = self.client.post("/validate/map", files=files, params={"map": "maps/sub.ditamap"}).json()
+            self.assertEqual((report["topics_parsed"], report["topics_reused"]), (0, 2))
+            self.assertEqual(len(report["maps"]), 1)
+        finally:
+            app_module.topic_memo = original
+
+        self.assertEqual(self.client.post("/validate/map").status_code, 400)
+
+        # Unparsable topics are reported exactly like /validate reports them
+        from backend.maps import analyze_topics
+        broken = b"<concept id='c'>\n<p>x</concept>"
+        analyses, _, _ = analyze_topics({"bad.dita": broken}, app_module.live_scorer.current, TopicMemo())
+        expected = self.client.post("/validate", files={"file": ("bad.dita", broken)}).json()
+        self.assertEqual(analyses["bad.dita"]["result"], expected)
+
+    def test_document_session_revalidates_changed_blocks_only(self):
+        paragraphs = [f'<p id="p{i}">Configure the server option {i}.</p>' for i in range(50)]
+
+        def revision(title, paragraphs):
+            return ('<task id="t"><title>' + title + '</title><!-- draft --> note <taskbody>'
+                    + "\n".join(paragraphs) + '</taskbody></task>').encode("utf-8")
+
+        def check(content, incremental, reused):
+            files = {"file": ("guide.dita", content)}
+            result = self.client.put("/documents/guide.dita", files=files).json()
+            expected = self.client.post("/validate", files=files).json()
+            self.assertEqual(result["errors"], expected["errors"])
+            self.assertAlmostEqual(result["compliance_probability"], expected["compliance_probability"], places=12)
+            self.assertEqual(result["session"]["incremental"], incremental)
+            self.assertEqual(result["session"]["blocks_reused"], reused)
+            return result
+
+        check(revision("Install the server", paragraphs), False, 0)
+
+        # Edit one paragraph (giving it a duplicate id) and the title
+        paragraphs[10] = '<p id="p3">Open the <b>file</b> and save.</p>'
+        result = check(revision("Install the server again", paragraphs), True, 49)
+        self.assertIn("Duplicate id 'p3' on <p>.", result["errors"])
+
+        # Invalid XML keeps the last valid revision to diff against
+        invalid = self.client.put("/documents/guide.dita", files={"file": ("guide.dita", b"<task><title>")}).json()
+        self.assertIn("error", invalid)
+        del paragraphs[30]
+        paragraphs.insert(20, paragraphs[5])
+        result = check(revision("Install the server again", paragraphs), True, 50)
+        self.assertEqual(result["session"]["revision"], 3)
+
+        self.assertEqual(self.client.delete("/documents/guide.dita").json(), {"deleted": "guide.dita"})
+        self.assertEqual(self.client.delete("/documents/guide.dita").status_code, 404)
+
+class TestServerLauncher(unittest.TestCase):
+
+    def test_prefork_workers_serve_and_shut_down(self):
+        import re
+        import signal
+        import subprocess
+        import sys
+        import tempfile
+        import httpx
+
+        with tempfile.TemporaryDirectory() as tmp:
+            env = dict(os.environ, PYTHONUNBUFFERED="1", JOBS_DB=os.path.join(tmp, "jobs.sqlite"))
+            env.pop("VALIDATION_WORKERS", None)
+            server = subprocess.Popen(
+                [sys.executable, "-m", "backend.serve", "--host", "127.0.0.1", "--port", "0", "--workers", "2"],
+                stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True, env=env,
+            )
+            try:
+                banner = ""
+                while "Serving on" not in banner:
+                    banner = server.stdout.readline()
+                    self.assertTrue(banner, "server exited before listening")
+                self.assertIn("with 2 workers (1 BLAS thread(s) each", banner)
+                url = re.search(r"http://\S+", banner).group(0)
+
+                for _ in range(50):
+                    try:
+                        response = httpx.post(f"{url}/validate", files={"file": ("a.dita", b"<concept id='c'><title>t</title></concept>")})
+                        break
+                    except httpx.TransportError:
+                        time.sleep(0.1)
+                self.assertIn("compliance_probability", response.json())
+
+                # Each worker's validation pool gets its share of the CPUs
+                from backend.serve import available_cpus
+                metrics = httpx.get(f"{url}/metrics").text
+                pool_size = re.search(r"^dita_pool_workers (\S+)$", metrics, re.M).group(1)
+                self.assertEqual(float(pool_size), max(1, available_cpus() // 2))
+            finally:
+                server.send_signal(signal.SIGTERM)
+                server.communicate(timeout=30)
+            self.assertEqual(server.returncode, 0)
+
+        # Pool sizes set by the launcher after importing it still apply to the app
+        script = ("import os, backend.serve; os.environ['VALIDATION_WORKERS'] = '7'; "
+                  "import backend.app; print(backend.app.validation_pool.max_workers)")
+        env = dict(os.environ)
+        env.pop("VALIDATION_WORKERS", None)
+        output = subprocess.run([sys.executable, "-c", script], capture_output=True, text=True, env=env, check=True)
+        self.assertEqual(output.stdout.split()[-1], "7")
+
+class TestResultCache(unittest.TestCase):
+
+    def test_lru_eviction_and_disk_tier(self):
+        import tempfile
+        from backend.cache import ResultCache, content_key
+
+        with tempfile.TemporaryDirectory() as tmp:
+            db_path = os.path.join(tmp, "results.sqlite")
+            cache = ResultCache(max_entries=1, ttl=0, db_path=db_path)
+            key_a = content_key(b"<a/>", "v1")
+            key_b = content_key(b"<b/>", "v1")
+            self.assertNotEqual(key_a, content_key(b"<a/>", "v2"))
+
+            cache.put(key_a, {"errors": []})
+            cache.put(key_b, {"errors": ["x"]})
+            self.assertEqual(cache.stats()["entries"], 1)
+
+            # Evicted from memory but still on disk; a new process sees it too
+            self.assertEqual(cache.get(key_a), {"errors": []})
+            self.assertEqual(cache.disk_hits, 1)
+            restarted = ResultCache(max_entries=1, ttl=0, db_path=db_path)
+            self.assertEqual(restarted.get(key_b), {"errors": ["x"]})
+            self.assertIsNone(restarted.get(content_key(b"<c/>", "v1")))
+            self.assertEqual((restarted.hits, restarted.misses), (1, 1))
+
+            # Rule and parser changes invalidate keys too
+            import backend.parsing as parsing
+            import backend.rules as rules
+            for module, name, value in [(rules, "RULES_VERSION", "test"), (parsing, "MAX_XML_DEPTH", 3),
+                                        (parsing, "XML_HUGE_TREE", True)]:
+                original = getattr(module, name)
+                setattr(module, name, value)
+                try:
+                    self.assertNotEqual(content_key(b"<a/>", "v1"), key_a)
+                finally:
+                    setattr(module, name, original)
+            self.assertEqual(content_key(b"<a/>", "v1"), key_a)
+
+            # The disk tier drops expired rows and keeps at most max_rows
+            import sqlite3
+            db = sqlite3.connect(db_path)
+            db.execute("INSERT INTO results VALUES ('old', 0, '{}')")
+            db.commit()
+            pruned = ResultCache(max_entries=0, ttl=60, db_path=db_path, max_rows=1)
+            self.assertIsNone(pruned.get("old"))
+            self.assertEqual(db.execute("SELECT key FROM results").fetchall(), [(key_b,)])
+            db.close()
+
+class TestBatchCLI(unittest.TestCase):
+
+    def test_tree_validation_exit_status_and_incremental_state(self):
+        import contextlib
+        import json
+        import tempfile
+        from backend.cli import main
+
+        with tempfile.TemporaryDirectory() as tmp:
+            docs = os.path.join(tmp, "docs", "nested")
+            os.makedirs(docs)
+            shutil.copy(os.path.join("data", "compliant", "good_1.dita"), docs)
+            with open(os.path.join(docs, "broken.dita"), "w") as f:
+                f.write("<concept><title>Broken</concept>")
+            output = os.path.join(tmp, "results.jsonl")
+            state = os.path.join(tmp, "state.json")
+            args = [os.path.join(tmp, "docs"), "--workers", "1", "--output", output, "--incremental", state]
+
+            with contextlib.redirect_stderr(io.StringIO()):
+                self.assertEqual(main(args), 1)
+                with open(output) as f:
+                    first = [json.loads(line) for line in f]
+                self.assertEqual(main(args), 1)
+                with open(output) as f:
+                    second = [json.loads(line) for line in f]
+
+            self.assertEqual([os.path.basename(r["path"]) for r in first], ["broken.dita", "good_1.dita"])
+            self.assertIn("Invalid XML", first[0]["error"])
+            self.assertIn("line", first[0])
+            self.assertEqual(first[1]["errors"], [])
+            self.assertTrue(all(r["cached"] for r in second))
+            self.assertEqual(second[1]["compliance_probability"], first[1]["compliance_probability"])
+
+            # With the broken file gone, the run passes
+            os.remove(os.path.join(docs, "broken.dita"))
+            with contextlib.redirect_stderr(io.StringIO()):
+                self.assertEqual(main(args), 0)
+
+            # A path that does not exist is a usage error, not an empty run
+            with contextlib.redirect_stderr(io.StringIO()), self.assertRaises(SystemExit) as exit_info:
+                main([os.path.join(tmp, "does", "not", "exist")])
+            self.assertEqual(exit_info.exception.code, 2)
+
 if __name__ == "__main__":
     unittest.main()
\ No newline at end of file